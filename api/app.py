@@ -7,32 +7,114 @@ This module handles API Gateway events and delegates to the core API logic.
 import json
 import os
 import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextvars import copy_context
+from urllib.parse import parse_qsl
 import boto3
 from botocore.config import Config
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, ConnectTimeoutError, ReadTimeoutError
 from marshmallow import ValidationError
 from core.api import SongsApi
+from core.sqlite_store import SqliteSongStore
+from core.storage import DynamoDBSongStore
+from core.catalog import ColumnarCatalog
+from core.deadline import Deadline, DeadlineExceeded
+from core.known_ids import KnownSongIds
+from core.metrics import Metrics
+from core.resilience import DependencyUnavailable, Resilience, budget
+from core.timing import Timings, collect, instrument, span
+from core.emf import InvocationMetrics, record, recording
+from core.capacity import ConsumedCapacity, current as current_capacity, metering
+from core.capacity import instrument as instrument_capacity
+from core.profiling import TOKEN_HEADER, ProfileWriter, profiled
+from core.changes import SyncTokenExpired, decode_token
 from core.responses import success, error
-from core.validation import validate_bucket_name, validate_object_key
+from core.keys import parse_range_filters, parse_sort, range_index
+from core.pagination import decode_cursor
+from core.search import TrigramIndex
+from core.validation import validate_bucket_name, validate_object_key, validate_limit
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Configure S3 client with rate limiting
+# Configure S3 client; retries are made by ``resilience``
 s3_config = Config(
     signature_version='s3v4',
-    retries={
-        'max_attempts': 3,
-        'mode': 'adaptive',
-        'total_max_attempts': 3
-    },
     connect_timeout=5,
     read_timeout=5,
     max_pool_connections=50
 )
 
-def error_response(message: str, code: str, status_code: int = 400, details: dict = None) -> dict:
+# Warm-up: {"warmup": true} events keep sandboxes, their connections and caches alive.
+# WARM_ON_INIT also opens connections and loads caches while the sandbox initializes.
+WARM_ON_INIT = os.getenv('WARM_ON_INIT', '').lower() in ('1', 'true')
+WARMUP_HOLD_MS = int(os.getenv('WARMUP_HOLD_MS', '100'))
+INIT_BUDGET_SECONDS = 8  # Lambda allows 10 s of init
+
+# Time kept back from the Lambda timeout to answer, and the cap on any one AWS call
+DEADLINE_RESERVE_SECONDS = float(os.getenv('DEADLINE_RESERVE_SECONDS', '1'))
+DOWNSTREAM_TIMEOUT_SECONDS = float(os.getenv('DOWNSTREAM_TIMEOUT_SECONDS', '5'))
+# Connections each pooled client keeps open: one per thread that may call AWS at once
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '10'))
+
+# Server-Timing header on every response (or on requests sending X-Server-Timing),
+# and a log line with the same breakdown for requests slower than SLOW_REQUEST_MS (0 disables)
+SERVER_TIMING = os.getenv('SERVER_TIMING', '').lower() in ('1', 'true')
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+
+# Opt-in profiling of requests sending X-Profile-Token: PROFILING_SECRET, written to
+# PROFILING_OUTPUT (a directory or s3://bucket/prefix). Without PROFILING nothing is wrapped.
+PROFILING = os.getenv('PROFILING', '').lower() in ('1', 'true')
+PROFILING_SECRET = os.getenv('PROFILING_SECRET', '')
+PROFILING_OUTPUT = os.getenv('PROFILING_OUTPUT', '/tmp/profiles')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '1'))
+
+# Embedded Metric Format lines with per-route latencies, dependency time and counters
+EMF_METRICS = os.getenv('EMF_METRICS', '').lower() in ('1', 'true')
+EMF_NAMESPACE = os.getenv('EMF_NAMESPACE', 'OurChants/Api')
+# Whether the next invocation is the sandbox's first
+_cold_start = True
+
+# Where songs are kept: "dynamodb" (DYNAMODB_TABLE_NAME and INDEX_TABLE_NAME) or "sqlite"
+# (one database file at SQLITE_PATH, for small self-hosted installs; needs no AWS account)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'dynamodb').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', '/tmp/songs.db')
+if STORAGE_BACKEND not in ('dynamodb', 'sqlite'):
+    raise ValueError(f"STORAGE_BACKEND must be dynamodb or sqlite, not {STORAGE_BACKEND!r}")
+
+# Search index shared by warm invocations of this sandbox
+search_index = TrigramIndex()
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv('SEARCH_INDEX_TTL_SECONDS', '300'))
+CHANGES_SETTLE_SECONDS = float(os.getenv('CHANGES_SETTLE_SECONDS', '5'))
+# Columnar snapshot of the catalog serving paginated listings, if enabled
+catalog = ColumnarCatalog() if os.getenv('MEMORY_CATALOG', '').lower() in ('1', 'true') else None
+# Counters accumulated by this sandbox, logged after every invocation
+metrics = Metrics()
+# Jittered retries within the deadline, and a circuit breaker per dependency
+resilience = Resilience(
+    max_attempts=int(os.getenv('AWS_MAX_ATTEMPTS', '4')),
+    failure_threshold=int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('BREAKER_RESET_SECONDS', '10')),
+    metrics=metrics,
+)
+# Bloom filter and negative cache answering reads of unknown song IDs, if enabled
+known_ids = KnownSongIds(
+    fp_rate=float(os.getenv('SONG_ID_FILTER_FP_RATE', '0.01')),
+    negative_ttl=float(os.getenv('SONG_ID_NEGATIVE_TTL_SECONDS', '30')),
+    max_staleness=float(os.getenv('SONG_ID_FILTER_MAX_STALENESS_SECONDS', '1')),
+    metrics=metrics,
+) if os.getenv('SONG_ID_FILTER', '').lower() in ('1', 'true') else None
+
+def json_body(value) -> str:
+    """Encode a response body, timed as the ``json`` span."""
+    with span('json'):
+        return json.dumps(value)
+
+def error_response(message: str, code: str, status_code: int = 400, details: dict = None,
+                   headers: dict = None) -> dict:
     """Return a standardized error response.
     
     Args:
@@ -40,6 +122,7 @@ def error_response(message: str, code: str, status_code: int = 400, details: dic
         code: The error code identifier
         status_code: The HTTP status code (default: 400)
         details: Additional error details (optional)
+        headers: Additional response headers (optional)
     """
     response = {
         'statusCode': status_code,
@@ -47,16 +130,17 @@ def error_response(message: str, code: str, status_code: int = 400, details: dic
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'OPTIONS,POST',
-            'Access-Control-Allow-Headers': 'Content-Type'
+            'Access-Control-Allow-Headers': 'Content-Type',
+            **(headers or {})
         },
-        'body': json.dumps({
+        'body': json_body({
             'error': message,
             'code': code
         })
     }
     
     if details:
-        response['body'] = json.dumps({
+        response['body'] = json_body({
             'error': message,
             'code': code,
             'details': details
@@ -64,258 +148,447 @@ def error_response(message: str, code: str, status_code: int = 400, details: dic
     
     return response
 
-def lambda_handler(event, context):
-    """Handle API Gateway HTTP API events."""
-    try:
-        # Initialize AWS clients inside the handler
-        dynamodb = boto3.resource('dynamodb')
-        s3_client = boto3.client('s3', config=s3_config)
+# POST /batch limits
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '10'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '5'))
+BATCH_TIMEOUT_SECONDS = float(os.getenv('BATCH_TIMEOUT_SECONDS', '10'))
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+# DynamoDB resource and S3 client shared by warm invocations, so their connections stay open
+_aws_clients = None
+# boto3's default session is not thread-safe: clients are created one at a time
+_aws_clients_lock = threading.Lock()
+# SQLite store shared by warm invocations and threads (it opens one connection per thread)
+_sqlite_store = None
+_sqlite_store_lock = threading.Lock()
+
+def create_aws_clients(timeout: float) -> tuple:
+    """Create the DynamoDB resource (None with SQLite storage) and S3 client with a per-call timeout."""
+    call_config = Config(connect_timeout=timeout, read_timeout=timeout,
+                         max_pool_connections=AWS_MAX_POOL_CONNECTIONS)
+    dynamodb = boto3.resource('dynamodb', config=call_config) if STORAGE_BACKEND == 'dynamodb' else None
+    s3_client = boto3.client('s3', config=s3_config.merge(call_config))
+    if dynamodb is not None:
+        resilience.attach(instrument_capacity(instrument(dynamodb.meta.client, 'dynamodb')), 'dynamodb')
+    resilience.attach(instrument(s3_client, 's3'), 's3')
+    return dynamodb, s3_client
+
+def aws_clients(deadline: Deadline = None) -> tuple:
+    """Return the sandbox's pooled AWS clients, or short-timeout ones near the deadline."""
+    global _aws_clients
+    timeout = deadline.timeout(DOWNSTREAM_TIMEOUT_SECONDS) if deadline else DOWNSTREAM_TIMEOUT_SECONDS
+    if timeout < DOWNSTREAM_TIMEOUT_SECONDS:
+        # Less time left than the pooled clients would wait: a new connection is the lesser cost
+        with _aws_clients_lock:
+            return create_aws_clients(timeout)
+    if _aws_clients is None:
+        with _aws_clients_lock:
+            if _aws_clients is None:
+                _aws_clients = create_aws_clients(DOWNSTREAM_TIMEOUT_SECONDS)
+    return _aws_clients
+
+def sqlite_store() -> SqliteSongStore:
+    """Return the sandbox's SQLite store, creating the database on first use."""
+    global _sqlite_store
+    if _sqlite_store is None:
+        with _sqlite_store_lock:
+            if _sqlite_store is None:
+                _sqlite_store = SqliteSongStore(SQLITE_PATH)
+    return _sqlite_store
+
+def build_api(dynamodb, deadline: Deadline = None) -> SongsApi:
+    """Create a ``SongsApi`` over the configured storage and the sandbox-wide caches."""
+    if STORAGE_BACKEND == 'sqlite':
+        store = sqlite_store()
+    else:
         table = dynamodb.Table(os.getenv('DYNAMODB_TABLE_NAME'))
-        api = SongsApi(table)
-        
-        logger.info(f"Received event: {json.dumps(event)}")
-        
-        # Extract HTTP method and path from HTTP API event
-        http_method = event.get('requestContext', {}).get('http', {}).get('method')
-        path = event.get('requestContext', {}).get('http', {}).get('path')
-        raw_body = event.get('body', '{}')
-        
-        # Parse body if it's a string
+        index_table_name = os.getenv('INDEX_TABLE_NAME')
+        index_table = dynamodb.Table(index_table_name) if index_table_name else None
+        store = DynamoDBSongStore(table, index_table, CHANGES_SETTLE_SECONDS)
+    return SongsApi(store=store, search_index=search_index, search_index_ttl=SEARCH_INDEX_TTL_SECONDS,
+                    catalog=catalog, known_ids=known_ids, deadline=deadline, metrics=metrics)
+
+def warm_up(api: SongsApi, s3_client) -> dict:
+    """Open the pooled connections with cheap calls, then load the in-process caches.
+
+    Every step is attempted; failures are reported, not raised.
+
+    Returns:
+        Milliseconds taken by each step, and the error of any that failed
+    """
+    steps = {
+        api.store.name: api.store.ping,
+        's3': lambda: s3_client.head_bucket(Bucket=os.getenv('S3_BUCKET')),
+        'caches': api.warm_caches,
+    }
+    report = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
         try:
-            body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
-        except json.JSONDecodeError:
-            body = {}
-        
-        if not http_method or not path:
-            logger.error("Invalid event structure: missing method or path")
-            return error_response("Invalid request format", "INVALID_REQUEST")
-        
-        # Handle CORS preflight requests
-        if http_method == 'OPTIONS':
+            step()
+            report[name] = {'ms': round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+            report[name] = {'error': str(e)}
+    return report
+
+# Scheduled maintenance tasks, invoked by EventBridge with {"maintenance": "<task>"}
+MAINTENANCE_TASKS = {
+    'reconcile_counters': SongsApi.reconcile_counters,
+    'repair_aggregates': SongsApi.repair_aggregates,
+    'refresh_shuffle': SongsApi.refresh_shuffle,
+}
+
+def run_maintenance(api: SongsApi, task: str, dry_run: bool = False) -> dict:
+    """Run a scheduled maintenance task and report what it changed."""
+    if task not in MAINTENANCE_TASKS:
+        logger.error(f"Unknown maintenance task: {task}")
+        return {'task': task, 'error': 'Unknown maintenance task'}
+    if api.index_table is None:
+        logger.error(f"Maintenance task {task} needs INDEX_TABLE_NAME")
+        return {'task': task, 'error': 'Index table not configured'}
+    report = MAINTENANCE_TASKS[task](api, dry_run=dry_run)
+    logger.info(f"Maintenance task {task} finished: {json.dumps(report)}")
+    return {'task': task, 'dry_run': dry_run, 'report': report}
+
+def route(api: SongsApi, s3_client, http_method: str, path: str, query_params: dict, body) -> dict:
+    """Handle one API request and return its API Gateway response.
+
+    Errors the handlers do not catch themselves propagate; ``dispatch``
+    turns them into error responses.
+    """
+    # Route requests based on path and method
+    if path == '/songs':
+        if http_method == 'GET':
+            limit = query_params.get('limit')
+            if limit is not None:
+                is_valid_limit, limit_error = validate_limit(limit)
+                if not is_valid_limit:
+                    return error_response("Invalid limit parameter", "INVALID_LIMIT", 400,
+                                          {'reason': limit_error})
+                limit = int(limit)
+            cursor = query_params.get('cursor')
+            if cursor is not None:
+                try:
+                    decode_cursor(cursor)
+                except ValueError as e:
+                    return error_response("Invalid cursor parameter", "INVALID_CURSOR", 400,
+                                          {'reason': str(e)})
+            sort = query_params.get('sort')
+            if sort is not None:
+                try:
+                    parse_sort(sort)
+                except ValueError as e:
+                    return error_response("Invalid sort parameter", "INVALID_SORT", 400,
+                                          {'reason': str(e)})
+            try:
+                filters = parse_range_filters(query_params)
+            except ValueError as e:
+                return error_response("Invalid filter parameter", "INVALID_FILTER", 400,
+                                      {'reason': str(e)})
+            lineage = query_params.get('lineage')
+            if lineage is not None:
+                if not lineage.strip() or filters:
+                    return error_response("Invalid filter parameter", "INVALID_FILTER", 400,
+                                          {'reason': "lineage must be non-empty and cannot be combined with range filters"})
+                if sort is not None:
+                    return error_response("Invalid sort parameter", "INVALID_SORT", 400,
+                                          {'reason': "lineage pages cannot be sorted"})
+            elif filters:
+                try:
+                    range_index(filters, sort)
+                except ValueError as e:
+                    return error_response("Invalid sort parameter", "INVALID_SORT", 400,
+                                          {'reason': str(e)})
+            try:
+                songs = api.list_songs(limit=limit, cursor=cursor, sort=sort, filters=filters,
+                                       lineage=lineage)
+            except ValueError as e:
+                # e.g. an in-memory catalog cursor after the catalog was disabled
+                return error_response("Invalid cursor parameter", "INVALID_CURSOR", 400,
+                                      {'reason': str(e)})
             return {
                 'statusCode': 200,
                 'headers': {
+                    'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
+                    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
                     'Access-Control-Allow-Headers': 'Content-Type'
-                }
+                },
+                'body': json_body(songs)
             }
-        
-        # Route requests based on path and method
-        if path == '/songs':
-            if http_method == 'GET':
-                songs = api.list_songs()
+        elif http_method == 'POST':
+            try:
+                # Ensure body is a dictionary
+                if not isinstance(body, dict):
+                    body = {}
+                song = api.create_song(body)
                 return {
-                    'statusCode': 200,
+                    'statusCode': 201,
                     'headers': {
                         'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
-                        'Access-Control-Allow-Headers': 'Content-Type'
+                        'Access-Control-Allow-Origin': '*'
                     },
-                    'body': json.dumps(songs)
+                    'body': json_body(song)
                 }
-            elif http_method == 'POST':
-                try:
-                    # Ensure body is a dictionary
-                    if not isinstance(body, dict):
-                        body = {}
-                    song = api.create_song(body)
-                    return {
-                        'statusCode': 201,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*'
-                        },
-                        'body': json.dumps(song)
-                    }
-                except ValidationError as e:
-                    return error_response(str(e.messages), "VALIDATION_ERROR", 400)
-        elif path == '/presigned-url':
-            if http_method == 'POST':
+            except ValidationError as e:
+                return error_response(str(e.messages), "VALIDATION_ERROR", 400)
+    elif path == '/songs/random':
+        if http_method == 'GET':
+            n = query_params.get('n', 20)
+            is_valid_n, n_error = validate_limit(n)
+            if not is_valid_n:
+                return error_response("Invalid n parameter", "INVALID_LIMIT", 400,
+                                      {'reason': n_error.replace('limit', 'n')})
+            lineage = query_params.get('lineage')
+            if lineage is not None and not lineage.strip():
+                return error_response("Invalid filter parameter", "INVALID_FILTER", 400,
+                                      {'reason': 'lineage must not be empty'})
+            result = api.random_songs(int(n), lineage=lineage)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json_body(result)
+            }
+    elif path == '/songs/changes':
+        if http_method == 'GET':
+            limit = query_params.get('limit', 100)
+            is_valid_limit, limit_error = validate_limit(limit)
+            if not is_valid_limit:
+                return error_response("Invalid limit parameter", "INVALID_LIMIT", 400,
+                                      {'reason': limit_error})
+            token = query_params.get('since')
+            if token is not None:
                 try:
-                    logger.info(f"Presigned URL request - Raw body: {raw_body}")
-                    logger.info(f"Presigned URL request - Parsed body: {body}")
-                    
-                    # Ensure body is a dictionary and has a key
-                    if not isinstance(body, dict) or not body:
-                        logger.error("Presigned URL request - Invalid body format")
-                        return error_response("Object key cannot be empty", "INVALID_OBJECT_KEY")
+                    decode_token(token)
+                except ValueError as e:
+                    return error_response("Invalid sync token", "INVALID_TOKEN", 400,
+                                          {'reason': str(e)})
+            try:
+                result = api.list_changes(token, limit=int(limit))
+            except SyncTokenExpired as e:
+                return error_response("Sync token expired", "SYNC_TOKEN_EXPIRED", 410,
+                                      {'reason': str(e)})
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json_body(result)
+            }
+    elif path == '/search':
+        if http_method == 'GET':
+            query = (query_params.get('q') or '').strip()
+            if not query:
+                return error_response("Missing search query", "INVALID_QUERY", 400,
+                                      {'reason': 'q must not be empty'})
+            limit = query_params.get('limit', 20)
+            is_valid_limit, limit_error = validate_limit(limit)
+            if not is_valid_limit:
+                return error_response("Invalid limit parameter", "INVALID_LIMIT", 400,
+                                      {'reason': limit_error})
+            fuzzy = query_params.get('fuzzy', '').lower() in ('1', 'true', 'yes')
+            results = api.search_songs(query, fuzzy=fuzzy, limit=int(limit))
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json_body(results)
+            }
+    elif path == '/artists' or path.startswith('/artists/') or path.startswith('/albums/'):
+        if http_method == 'GET':
+            if path == '/artists':
+                result = api.list_artists()
+            elif path.startswith('/artists/'):
+                result = api.get_artist(path.split('/')[-1])
+                if not result:
+                    return error_response("Artist not found", "NOT_FOUND", 404)
+            else:
+                result = api.get_album(path.split('/')[-1])
+                if not result:
+                    return error_response("Album not found", "NOT_FOUND", 404)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json_body(result)
+            }
+    elif path == '/presigned-url':
+        if http_method == 'POST':
+            try:
+                logger.info(f"Presigned URL request - Parsed body: {body}")
                     
-                    key = body.get('key')
-                    if not key:
-                        logger.error("Presigned URL request - Missing key")
-                        return error_response("Object key cannot be empty", "INVALID_OBJECT_KEY")
+                # Ensure body is a dictionary and has a key
+                if not isinstance(body, dict) or not body:
+                    logger.error("Presigned URL request - Invalid body format")
+                    return error_response("Object key cannot be empty", "INVALID_OBJECT_KEY")
                     
-                    bucket = body.get('bucket', os.getenv('S3_BUCKET'))
-                    logger.info(f"Presigned URL request - Bucket: {bucket}, Key: {key}")
+                key = body.get('key')
+                if not key:
+                    logger.error("Presigned URL request - Missing key")
+                    return error_response("Object key cannot be empty", "INVALID_OBJECT_KEY")
                     
-                    # Validate bucket name
-                    is_valid_bucket, bucket_error = validate_bucket_name(bucket)
-                    if not is_valid_bucket:
-                        logger.error(f"Presigned URL request - Invalid bucket: {bucket_error}")
-                        return error_response("Invalid bucket name", "INVALID_BUCKET_NAME")
+                bucket = body.get('bucket', os.getenv('S3_BUCKET'))
+                logger.info(f"Presigned URL request - Bucket: {bucket}, Key: {key}")
                     
-                    # Validate key format
-                    is_valid_key, key_error = validate_object_key(key)
-                    if not is_valid_key:
-                        logger.error(f"Presigned URL request - Invalid key: {key_error}")
-                        return error_response("Invalid object key", "INVALID_OBJECT_KEY")
+                # Validate bucket name
+                is_valid_bucket, bucket_error = validate_bucket_name(bucket)
+                if not is_valid_bucket:
+                    logger.error(f"Presigned URL request - Invalid bucket: {bucket_error}")
+                    return error_response("Invalid bucket name", "INVALID_BUCKET_NAME")
                     
-                    # Check if bucket exists
-                    try:
-                        logger.info(f"Presigned URL request - Checking bucket existence: {bucket}")
-                        s3_client.head_bucket(Bucket=bucket)
-                    except ClientError as e:
-                        error_code = e.response.get('Error', {}).get('Code', '')
-                        error_message = e.response.get('Error', {}).get('Message', '')
-                        logger.error(f"Presigned URL request - Bucket check failed: {error_code} - {error_message}")
-                        if error_code in ['404', 'NoSuchBucket']:
-                            return error_response(
-                                f"Bucket {bucket} not found",
-                                "BUCKET_NOT_FOUND",
-                                404,
-                                {'bucket': bucket}
-                            )
-                        elif error_code in ['403', 'Forbidden']:
-                            return error_response(
-                                f"Bucket {bucket} not found or access denied",
-                                "BUCKET_NOT_FOUND",
-                                404,
-                                {'bucket': bucket, 'reason': 'access_denied'}
-                            )
-                        elif error_code == 'ThrottlingException':
-                            return error_response(
-                                "Rate limit exceeded. Please try again later.",
-                                "RATE_LIMIT_EXCEEDED",
-                                429,
-                                {'retry_after': 5}
-                            )
-                        raise
-
-                    # Check if object exists
-                    try:
-                        logger.info(f"Presigned URL request - Checking object existence: {bucket}/{key}")
-                        s3_client.head_object(Bucket=bucket, Key=key)
-                    except ClientError as e:
-                        error_code = e.response.get('Error', {}).get('Code', '')
-                        error_message = e.response.get('Error', {}).get('Message', '')
-                        logger.error(f"Presigned URL request - Object check failed: {error_code} - {error_message}")
-                        if error_code in ['404', 'NoSuchKey']:
-                            return error_response(
-                                f"Object {key} not found in bucket {bucket}",
-                                "OBJECT_NOT_FOUND",
-                                404,
-                                {'bucket': bucket, 'key': key}
-                            )
-                        elif error_code == 'ThrottlingException':
-                            return error_response(
-                                "Rate limit exceeded. Please try again later.",
-                                "RATE_LIMIT_EXCEEDED",
-                                429,
-                                {'retry_after': 5}
-                            )
-                        raise
+                # Validate key format
+                is_valid_key, key_error = validate_object_key(key)
+                if not is_valid_key:
+                    logger.error(f"Presigned URL request - Invalid key: {key_error}")
+                    return error_response("Invalid object key", "INVALID_OBJECT_KEY")
                     
-                    try:
-                        logger.info(f"Presigned URL request - Generating URL for: {bucket}/{key}")
-                        url = s3_client.generate_presigned_url(
-                            'get_object',
-                            Params={
-                                'Bucket': bucket,
-                                'Key': key
-                            },
-                            ExpiresIn=3600
+                # Check if bucket exists
+                try:
+                    logger.info(f"Presigned URL request - Checking bucket existence: {bucket}")
+                    s3_client.head_bucket(Bucket=bucket)
+                except ClientError as e:
+                    error_code = e.response.get('Error', {}).get('Code', '')
+                    error_message = e.response.get('Error', {}).get('Message', '')
+                    logger.error(f"Presigned URL request - Bucket check failed: {error_code} - {error_message}")
+                    if error_code in ['404', 'NoSuchBucket']:
+                        return error_response(
+                            f"Bucket {bucket} not found",
+                            "BUCKET_NOT_FOUND",
+                            404,
+                            {'bucket': bucket}
                         )
-                        logger.info(f"Presigned URL request - Generated URL: {url}")
-                        return {
-                            'statusCode': 200,
-                            'headers': {
-                                'Content-Type': 'application/json',
-                                'Access-Control-Allow-Origin': '*',
-                                'Access-Control-Allow-Methods': 'OPTIONS,POST',
-                                'Access-Control-Allow-Headers': 'Content-Type'
-                            },
-                            'body': json.dumps({
-                                'url': url,
-                                'expiresIn': 3600
-                            })
-                        }
-                    except ClientError as e:
-                        error_code = e.response.get('Error', {}).get('Code', '')
-                        error_message = e.response.get('Error', {}).get('Message', '')
-                        logger.error(f"Presigned URL request - URL generation failed: {error_code} - {error_message}")
-                        if error_code == 'ThrottlingException':
-                            return error_response(
-                                "Rate limit exceeded. Please try again later.",
-                                "RATE_LIMIT_EXCEEDED",
-                                429,
-                                {'retry_after': 5}
-                            )
-                        logger.error(f"Error generating pre-signed URL: {str(e)}")
+                    elif error_code in ['403', 'Forbidden']:
                         return error_response(
-                            "Failed to generate pre-signed URL",
-                            "INTERNAL_ERROR",
-                            500,
-                            {'error_code': error_code}
+                            f"Bucket {bucket} not found or access denied",
+                            "BUCKET_NOT_FOUND",
+                            404,
+                            {'bucket': bucket, 'reason': 'access_denied'}
                         )
+                    raise
+
+                # Check if object exists
+                try:
+                    logger.info(f"Presigned URL request - Checking object existence: {bucket}/{key}")
+                    s3_client.head_object(Bucket=bucket, Key=key)
                 except ClientError as e:
                     error_code = e.response.get('Error', {}).get('Code', '')
                     error_message = e.response.get('Error', {}).get('Message', '')
-                    logger.error(f"Presigned URL request - Unexpected error: {error_code} - {error_message}")
-                    return error_response("Failed to generate pre-signed URL", "INTERNAL_ERROR", 500)
-        elif path.startswith('/songs/'):
-            song_id = path.split('/')[-1]
-            if http_method == 'GET':
-                song = api.get_song(song_id)
-                if not song:
-                    return error_response("Song not found", "NOT_FOUND", 404)
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps(song)
-                }
-            elif http_method == 'PUT':
+                    logger.error(f"Presigned URL request - Object check failed: {error_code} - {error_message}")
+                    if error_code in ['404', 'NoSuchKey']:
+                        return error_response(
+                            f"Object {key} not found in bucket {bucket}",
+                            "OBJECT_NOT_FOUND",
+                            404,
+                            {'bucket': bucket, 'key': key}
+                        )
+                    raise
+                    
                 try:
-                    # Ensure body is a dictionary
-                    if not isinstance(body, dict):
-                        body = {}
-                    song = api.update_song(song_id, body)
-                    if not song:
-                        return error_response("Song not found", "NOT_FOUND", 404)
+                    logger.info(f"Presigned URL request - Generating URL for: {bucket}/{key}")
+                    url = s3_client.generate_presigned_url(
+                        'get_object',
+                        Params={
+                            'Bucket': bucket,
+                            'Key': key
+                        },
+                        ExpiresIn=3600
+                    )
+                    logger.info(f"Presigned URL request - Generated URL: {url}")
                     return {
                         'statusCode': 200,
                         'headers': {
                             'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*'
+                            'Access-Control-Allow-Origin': '*',
+                            'Access-Control-Allow-Methods': 'OPTIONS,POST',
+                            'Access-Control-Allow-Headers': 'Content-Type'
                         },
-                        'body': json.dumps(song)
+                        'body': json_body({
+                            'url': url,
+                            'expiresIn': 3600
+                        })
                     }
-                except ValidationError as e:
-                    return error_response(str(e.messages), "VALIDATION_ERROR", 400)
-            elif http_method == 'DELETE':
-                # Check if song exists before deleting
-                if not api.get_song(song_id):
+                except ClientError as e:
+                    error_code = e.response.get('Error', {}).get('Code', '')
+                    error_message = e.response.get('Error', {}).get('Message', '')
+                    logger.error(f"Presigned URL request - URL generation failed: {error_code} - {error_message}")
+                    logger.error(f"Error generating pre-signed URL: {str(e)}")
+                    return error_response(
+                        "Failed to generate pre-signed URL",
+                        "INTERNAL_ERROR",
+                        500,
+                        {'error_code': error_code}
+                    )
+            except ClientError as e:
+                error_code = e.response.get('Error', {}).get('Code', '')
+                error_message = e.response.get('Error', {}).get('Message', '')
+                logger.error(f"Presigned URL request - Unexpected error: {error_code} - {error_message}")
+                return error_response("Failed to generate pre-signed URL", "INTERNAL_ERROR", 500)
+    elif path.startswith('/songs/'):
+        song_id = path.split('/')[-1]
+        if http_method == 'GET':
+            song = api.get_song(song_id)
+            if not song:
+                return error_response("Song not found", "NOT_FOUND", 404)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json_body(song)
+            }
+        elif http_method == 'PUT':
+            try:
+                # Ensure body is a dictionary
+                if not isinstance(body, dict):
+                    body = {}
+                song = api.update_song(song_id, body)
+                if not song:
                     return error_response("Song not found", "NOT_FOUND", 404)
-                api.delete_song(song_id)
                 return {
-                    'statusCode': 204,
+                    'statusCode': 200,
                     'headers': {
+                        'Content-Type': 'application/json',
                         'Access-Control-Allow-Origin': '*'
-                    }
+                    },
+                    'body': json_body(song)
+                }
+            except ValidationError as e:
+                return error_response(str(e.messages), "VALIDATION_ERROR", 400)
+        elif http_method == 'DELETE':
+            # Check if song exists before deleting
+            if not api.get_song(song_id):
+                return error_response("Song not found", "NOT_FOUND", 404)
+            api.delete_song(song_id)
+            return {
+                'statusCode': 204,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*'
                 }
+            }
         
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+    return {
+        'statusCode': 405,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json_body({'error': 'Method not allowed'})
+    }
+
+def dispatch(api: SongsApi, s3_client, http_method: str, path: str, query_params: dict, body) -> dict:
+    """Route one request, turning uncaught errors into error responses."""
+    try:
+        return route(api, s3_client, http_method, path, query_params, body)
     except ValidationError as e:
         logger.error(f"Validation error: {str(e)}")
         return error_response(str(e.messages), "VALIDATION_ERROR", 400)
@@ -325,6 +598,257 @@ def lambda_handler(event, context):
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON: {str(e)}")
         return error_response("Invalid JSON in request body", "INVALID_JSON", 400)
+    except DependencyUnavailable as e:
+        logger.error(f"Dependency unavailable: {str(e)}")
+        return error_response("Service temporarily unavailable", "SERVICE_UNAVAILABLE", 503,
+                              {'dependency': e.dependency, 'retry_after': int(e.retry_after_header)},
+                              {'Retry-After': e.retry_after_header})
+    except DeadlineExceeded:
+        logger.error(f"Deadline exceeded: {http_method} {path}")
+        return error_response("Request ran out of time", "DEADLINE_EXCEEDED", 503)
+    except (ConnectTimeoutError, ReadTimeoutError) as e:
+        logger.error(f"AWS call timed out: {str(e)}")
+        return error_response("Upstream service timed out", "UPSTREAM_TIMEOUT", 503)
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        return error_response("Internal server error", "INTERNAL_ERROR", 500) 
\ No newline at end of file
+        return error_response("Internal server error", "INTERNAL_ERROR", 500)
+
+def dispatch_recorded(api: SongsApi, s3_client, http_method: str, path: str, query_params: dict,
+                      body) -> dict:
+    """``dispatch``, recording the request's route, status, latency and capacity in the invocation's metrics."""
+    start = time.perf_counter()
+    # Capacity is metered per sub-request, so that each route is charged for its own reads and writes
+    capacity = ConsumedCapacity() if current_capacity() is not None else None
+    with metering(capacity):
+        response = dispatch(api, s3_client, http_method, path, query_params, body)
+    record(http_method, path, response['statusCode'], (time.perf_counter() - start) * 1000, capacity)
+    return response
+
+def parse_sub_request(item) -> tuple:
+    """Parse one ``POST /batch`` sub-request into ``dispatch`` arguments.
+
+    A sub-request is ``{"method", "path", "query", "body"}``; the path may
+    carry its own query string.
+
+    Raises:
+        ValueError: If the sub-request is malformed
+    """
+    if not isinstance(item, dict):
+        raise ValueError("each request must be an object")
+    method = str(item.get('method', 'GET')).upper()
+    if method not in BATCH_METHODS:
+        raise ValueError(f"method must be one of: {', '.join(BATCH_METHODS)}")
+    path, _, query_string = str(item.get('path', '')).partition('?')
+    if not path.startswith('/'):
+        raise ValueError("path must start with '/'")
+    if path == '/batch':
+        raise ValueError("batch requests cannot be nested")
+    query = item.get('query') or {}
+    if not isinstance(query, dict) or not all(isinstance(value, str) for value in query.values()):
+        raise ValueError("query must be an object of strings")
+    query_params = dict(parse_qsl(query_string), **query)
+    return method, path, query_params, item.get('body') or {}
+
+def handle_batch(api: SongsApi, s3_client, body, deadline: Deadline = None) -> dict:
+    """Run the sub-requests of ``POST /batch`` through ``dispatch``.
+
+    Reads run concurrently; a read still running after
+    ``BATCH_TIMEOUT_SECONDS``, or when the invocation's deadline comes, gets
+    a 504 response of its own. Writes (``POST``, ``PUT``, ``DELETE``) run one
+    after another in this thread, under the invocation's deadline only, so
+    no write is ever abandoned while it may still commit: a write gets a 504
+    only if the time limit passed before it started. Responses come back in
+    request order.
+    """
+    requests = body.get('requests') if isinstance(body, dict) else None
+    if not isinstance(requests, list) or not requests:
+        return error_response("Invalid batch request", "INVALID_BATCH", 400,
+                              {'reason': "body must have a non-empty 'requests' list"})
+    if len(requests) > BATCH_MAX_REQUESTS:
+        return error_response("Invalid batch request", "INVALID_BATCH", 400,
+                              {'reason': f"at most {BATCH_MAX_REQUESTS} requests per batch"})
+    parsed = []
+    for index, item in enumerate(requests):
+        try:
+            parsed.append(parse_sub_request(item))
+        except ValueError as e:
+            return error_response("Invalid batch request", "INVALID_BATCH", 400,
+                                  {'index': index, 'reason': str(e)})
+
+    time_limit = BATCH_TIMEOUT_SECONDS if deadline is None else min(BATCH_TIMEOUT_SECONDS, deadline.remaining())
+    expires_at = time.monotonic() + time_limit
+    reads = [index for index, request in enumerate(parsed) if request[0] == 'GET']
+    executor = ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(reads))) if reads else None
+    # Each worker runs in a copy of this context, so sub-requests share the time budget
+    futures = {index: executor.submit(copy_context().run, dispatch_recorded, api, s3_client, *parsed[index])
+               for index in reads}
+    results = {}
+    for index, request in enumerate(parsed):
+        if index in futures:
+            continue
+        if time.monotonic() >= expires_at:
+            results[index] = error_response("Batch time limit exceeded", "BATCH_TIMEOUT", 504)
+        else:
+            results[index] = dispatch_recorded(api, s3_client, *request)
+    responses = []
+    for index in range(len(parsed)):
+        response = results.get(index)
+        if response is None:
+            try:
+                response = futures[index].result(timeout=max(0, expires_at - time.monotonic()))
+            except FutureTimeout:
+                response = error_response("Batch time limit exceeded", "BATCH_TIMEOUT", 504)
+        responses.append({
+            'status': response['statusCode'],
+            'headers': response.get('headers', {}),
+            'body': json.loads(response['body']) if response.get('body') else None,
+        })
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)  # Only reads are left behind
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json_body({'responses': responses})
+    }
+
+def lambda_handler(event, context):
+    """Handle API Gateway HTTP API events."""
+    global _cold_start
+    cold, _cold_start = _cold_start, False
+    # HTTP requests must answer before the Lambda timeout; maintenance runs to completion
+    deadline = None if event.get('maintenance') else Deadline.from_context(context, DEADLINE_RESERVE_SECONDS)
+    http_request = 'requestContext' in event
+    server_timing = SERVER_TIMING or 'x-server-timing' in (event.get('headers') or {})
+    timings = Timings() if http_request and (server_timing or SLOW_REQUEST_MS > 0 or EMF_METRICS) else None
+    invocation = InvocationMetrics(cold, EMF_NAMESPACE) if EMF_METRICS else None
+    capacity = ConsumedCapacity() if invocation is not None and http_request else None
+    with budget(deadline), collect(timings), recording(invocation), metering(capacity):
+        response = handle_event(event, deadline)
+        if http_request and timings is not None:
+            http = event['requestContext'].get('http', {})
+            record(http.get('method'), http.get('path'), response['statusCode'], timings.elapsed_ms(),
+                   capacity)
+    if timings is not None:
+        report_timings(event, response, timings, server_timing)
+    emit_metrics(invocation, timings)
+    return response
+
+def emit_metrics(invocation: InvocationMetrics = None, timings: Timings = None) -> None:
+    """Write the invocation's metrics, and the sandbox's counters, to the log.
+
+    With EMF enabled, each document is printed as a bare JSON line, which
+    CloudWatch only recognizes without the logger's prefix. Otherwise the
+    counters are logged as ``{"metrics": {...}}``. Circuit breakers that
+    are not closed are logged either way.
+    """
+    counts, breakers = metrics.flush(), resilience.states()
+    if invocation is not None:
+        for document in invocation.documents(timings, counts):
+            print(json.dumps(document), flush=True)
+        counts = {}
+    if breakers:
+        logger.info(json.dumps({'metrics': counts, 'breakers': breakers}))
+    elif counts:
+        logger.info(json.dumps({'metrics': counts}))
+
+def report_timings(event, response: dict, timings: Timings, header: bool) -> None:
+    """Add the ``Server-Timing`` header to a response, and log the request if it was slow."""
+    if header:
+        response.setdefault('headers', {}).update({
+            'Server-Timing': timings.header(),
+            'Timing-Allow-Origin': '*',
+        })
+    total_ms = timings.elapsed_ms()
+    if SLOW_REQUEST_MS > 0 and total_ms >= SLOW_REQUEST_MS:
+        http = event['requestContext'].get('http', {})
+        logger.warning(json.dumps({'slow_request': {
+            'method': http.get('method'),
+            'path': http.get('path'),
+            'status': response.get('statusCode'),
+            'ms': round(total_ms, 1),
+            'spans': timings.spans(),
+        }}))
+
+# Request headers whose values never reach the logs
+SENSITIVE_HEADERS = frozenset({TOKEN_HEADER, 'authorization', 'cookie'})
+
+def loggable_event(event) -> dict:
+    """Return a copy of an HTTP event with sensitive header values masked, for logging."""
+    headers = event.get('headers')
+    if not headers:
+        return event
+    return {**event, 'headers': {
+        name: '***' if name.lower() in SENSITIVE_HEADERS else value for name, value in headers.items()
+    }}
+
+def handle_event(event, deadline: Deadline = None):
+    """Handle one event within ``deadline``."""
+    try:
+        dynamodb, s3_client = aws_clients(deadline)
+        api = build_api(dynamodb, deadline)
+        
+        if event.get('warmup'):
+            report = warm_up(api, s3_client)
+            # Held briefly so that concurrent warm-up events land on different sandboxes
+            time.sleep(int(event.get('hold_ms', WARMUP_HOLD_MS)) / 1000)
+            logger.info(f"Warm-up finished: {json.dumps(report)}")
+            return {'warmup': True, 'report': report}
+        
+        if event.get('maintenance'):
+            return run_maintenance(api, event['maintenance'], bool(event.get('dry_run')))
+        
+        logger.info(f"Received event: {json.dumps(loggable_event(event))}")
+        
+        # Extract HTTP method and path from HTTP API event
+        http_method = event.get('requestContext', {}).get('http', {}).get('method')
+        path = event.get('requestContext', {}).get('http', {}).get('path')
+        raw_body = event.get('body', '{}')
+        query_params = event.get('queryStringParameters') or {}
+        
+        # Parse body if it's a string
+        try:
+            body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
+        except json.JSONDecodeError:
+            body = {}
+        
+        if not http_method or not path:
+            logger.error("Invalid event structure: missing method or path")
+            return error_response("Invalid request format", "INVALID_REQUEST")
+        
+        # Handle CORS preflight requests
+        if http_method == 'OPTIONS':
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
+                    'Access-Control-Allow-Headers': 'Content-Type'
+                }
+            }
+
+        if path == '/batch':
+            if http_method != 'POST':
+                return error_response("Method not allowed", "METHOD_NOT_ALLOWED", 405)
+            return handle_batch(api, s3_client, body, deadline)
+        return dispatch(api, s3_client, http_method, path, query_params, body)
+    except ClientError as e:
+        logger.error(f"AWS error: {str(e)}")
+        return error_response("Internal server error", "INTERNAL_ERROR", 500)
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return error_response("Internal server error", "INTERNAL_ERROR", 500)
+
+if PROFILING:
+    if PROFILING_SECRET:
+        lambda_handler = profiled(lambda_handler, PROFILING_SECRET, ProfileWriter(PROFILING_OUTPUT),
+                                  PROFILING_SAMPLE_RATE)
+    else:
+        logger.warning("PROFILING is set without PROFILING_SECRET; requests are not profiled")
+
+# Runs once per sandbox, during init
+if WARM_ON_INIT:
+    _dynamodb, _s3_client = aws_clients()
+    warm_up(build_api(_dynamodb, Deadline.after(INIT_BUDGET_SECONDS)), _s3_client)
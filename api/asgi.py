@@ -0,0 +1,182 @@
+"""
+ASGI adapter for running the Songs API in a long-lived process.
+
+In a container there is no Lambda runtime to turn HTTP requests into
+events. ``SongsAsgi`` does that: each request becomes the API Gateway
+HTTP API (v2) event ``lambda_handler`` already handles, so routing,
+validation, deadlines, batching, Server-Timing and metrics are the same
+code as on Lambda. What the process adds is reuse: the pooled boto3
+clients and in-memory caches of ``app`` live as long as the worker, and
+are warmed once at startup rather than on a cold invocation.
+
+The handler blocks on AWS calls, so it runs in a bounded thread pool of
+``ASGI_THREADS`` threads, which is also the size of the boto3 connection
+pool. Requests beyond ``ASGI_MAX_PENDING`` waiting or running ones are
+turned away with a 503 rather than queued without bound.
+
+Run it under any ASGI server, one process per worker:
+
+    cd api && uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from urllib.parse import parse_qsl
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '16'))
+ASGI_MAX_PENDING = int(os.getenv('ASGI_MAX_PENDING', str(4 * ASGI_THREADS)))
+# API Gateway's integration timeout, so a request gets the time it would have on Lambda
+ASGI_REQUEST_TIMEOUT_SECONDS = float(os.getenv('ASGI_REQUEST_TIMEOUT_SECONDS', '29'))
+
+# Every pool thread can hold a connection; botocore's default pool is 10
+os.environ.setdefault('AWS_MAX_POOL_CONNECTIONS', str(ASGI_THREADS))
+
+try:
+    from . import app as handler  # Imported as api.asgi
+except ImportError:
+    import app as handler  # Imported from api/, as the server does
+
+logger = logging.getLogger()
+
+class RequestContext:
+    """The parts of the Lambda context the handler reads, for one request."""
+
+    function_name = 'songs-api-asgi'
+    memory_limit_in_mb = None
+
+    def __init__(self, timeout: float):
+        self.aws_request_id = str(uuid.uuid4())
+        self._expires_at = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._expires_at - time.monotonic()) * 1000))
+
+def _join(pairs) -> dict:
+    """Fold repeated names into one comma-separated value, as API Gateway does."""
+    joined = {}
+    for name, value in pairs:
+        joined[name] = f'{joined[name]},{value}' if name in joined else value
+    return joined
+
+def to_event(scope: dict, body: bytes) -> dict:
+    """Build the API Gateway HTTP API (v2) event for an ASGI HTTP request."""
+    headers = _join((name.decode('latin-1').lower(), value.decode('latin-1'))
+                    for name, value in scope.get('headers') or [])
+    query_string = scope.get('query_string', b'').decode('latin-1')
+    query = _join(parse_qsl(query_string, keep_blank_values=True))
+    client = scope.get('client') or ('', 0)
+    return {
+        'version': '2.0',
+        'routeKey': '$default',
+        'rawPath': scope['path'],
+        'rawQueryString': query_string,
+        'headers': headers,
+        'queryStringParameters': query or None,
+        'requestContext': {
+            'http': {
+                'method': scope['method'],
+                'path': scope['path'],
+                'protocol': f"HTTP/{scope.get('http_version', '1.1')}",
+                'sourceIp': client[0],
+                'userAgent': headers.get('user-agent', ''),
+            },
+            'requestId': str(uuid.uuid4()),
+            'routeKey': '$default',
+            'stage': '$default',
+            'timeEpoch': int(time.time() * 1000),
+        },
+        # The API only takes JSON; bytes that are not UTF-8 fail as invalid JSON would
+        'body': body.decode('utf-8', errors='replace') if body else None,
+        'isBase64Encoded': False,
+    }
+
+def from_response(response: dict) -> tuple:
+    """Return the status, headers and body bytes of a handler response."""
+    body = response.get('body') or ''
+    body = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+    headers = [(name.encode('latin-1'), str(value).encode('latin-1'))
+               for name, value in (response.get('headers') or {}).items()
+               if name.lower() != 'content-length']
+    headers += [(b'set-cookie', cookie.encode('latin-1')) for cookie in response.get('cookies') or []]
+    headers.append((b'content-length', str(len(body)).encode('ascii')))
+    return response['statusCode'], headers, body
+
+class SongsAsgi:
+    """ASGI 3 application serving the Songs API through ``lambda_handler``."""
+
+    def __init__(self, threads: int = ASGI_THREADS, max_pending: int = ASGI_MAX_PENDING,
+                 request_timeout: float = ASGI_REQUEST_TIMEOUT_SECONDS, warm_up: bool = True):
+        """Create the adapter and its thread pool.
+
+        Args:
+            threads: Requests handled at once
+            max_pending: Requests waiting or running before new ones get a 503
+            request_timeout: Seconds each request has, like a Lambda timeout
+            warm_up: Open the pooled connections and load the caches at startup
+        """
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='songs-api')
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.warm_up = warm_up
+        self.pending = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.warm_up:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, self._warm_up)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _warm_up(self) -> None:
+        dynamodb, s3_client = handler.aws_clients()
+        report = handler.warm_up(handler.build_api(dynamodb), s3_client)
+        logger.info(f"ASGI worker warmed up: {report}")
+
+    async def _http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        if self.pending >= self.max_pending:
+            response = handler.error_response("Service temporarily unavailable", "SERVICE_UNAVAILABLE", 503,
+                                              {'reason': 'too many requests in progress'}, {'Retry-After': '1'})
+        else:
+            event = to_event(scope, b''.join(chunks))
+            context = RequestContext(self.request_timeout)
+            self.pending += 1
+            try:
+                # A fresh context per request, so per-request context variables never leak between them
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, copy_context().run, handler.lambda_handler, event, context)
+            finally:
+                self.pending -= 1
+
+        status, headers, body = from_response(response)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+app = SongsAsgi()
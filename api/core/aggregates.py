@@ -0,0 +1,293 @@
+"""
+Artist and album aggregates.
+
+Aggregates live in the index table as small items that every song write
+changes in the same ``TransactWriteItems`` call as the song itself, so
+they cannot drift from the songs when a write fails halfway:
+
+- ``ARTIST#<slug>`` / ``SONG#<song_id>`` and ``ALBUM#<album_id>`` /
+  ``SONG#<song_id>``: one entry per song, with its ``artist`` and
+  ``album`` names; an artist or album page is a Query on one partition
+- ``ARTISTS`` / ``ARTIST#<slug>`` and ``ARTISTS`` / ``ALBUM#<album_id>``:
+  per-artist and per-album ``song_count`` counters, adjusted with ``ADD``;
+  the artist list is a Query on the ``ARTISTS`` partition
+
+Writes to different artists touch different items, so they never
+conflict, and no item grows with the catalog. Counters left at zero are
+skipped by readers. The repair job (``rebuild``) recomputes every item
+from a full scan, reports how far the stored items had drifted, and
+removes the zeroed counters.
+"""
+
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from boto3.dynamodb.conditions import Key
+from .search import normalize_text
+from .transactions import WriteTransaction
+
+ARTISTS_PK = 'ARTISTS'
+SONG_PREFIX = 'SONG#'
+
+def slugify(name: Optional[str]) -> str:
+    """Turn a display name into a URL-safe slug."""
+    return '-'.join(normalize_text(name).split()) or 'unknown'
+
+def album_id_for(artist: Optional[str], album: Optional[str]) -> Optional[str]:
+    """Return the album ID for an artist/album pair (None when there is no album)."""
+    if not album:
+        return None
+    return f'{slugify(artist)}--{slugify(album)}'
+
+def plain(value: Any) -> Any:
+    """Convert DynamoDB Decimals into ints so documents are JSON-serializable."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, list):
+        return [plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    return value
+
+def _placement(song: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str, Optional[str], Optional[str]]]:
+    if not song:
+        return None
+    artist = song.get('artist') or ''
+    album = song.get('album') or None
+    return slugify(artist), artist, album_id_for(artist, album), album
+
+def song_entries(song: Optional[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Return the entries a song adds to its artist's and album's partitions, keyed by (pk, sk)."""
+    placement = _placement(song)
+    if not placement:
+        return {}
+    slug, name, album_id, album = placement
+    sk = f"{SONG_PREFIX}{song['song_id']}"
+    entry = {'artist': name, 'album': album} if album else {'artist': name}
+    entries = {(f'ARTIST#{slug}', sk): dict(entry, pk=f'ARTIST#{slug}', sk=sk)}
+    if album_id:
+        entries[(f'ALBUM#{album_id}', sk)] = dict(entry, pk=f'ALBUM#{album_id}', sk=sk)
+    return entries
+
+def song_counts(song: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Return the ``ARTISTS`` counter items a song counts towards, keyed by sk (without counts)."""
+    placement = _placement(song)
+    if not placement:
+        return {}
+    slug, name, album_id, _ = placement
+    counts = {f'ARTIST#{slug}': {'name': name, 'slug': slug}}
+    if album_id:
+        counts[f'ALBUM#{album_id}'] = {'album_id': album_id, 'artist_slug': slug}
+    return counts
+
+def _entry_song(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a stored entry back into the song fields the pages are built from."""
+    return {'song_id': item['sk'][len(SONG_PREFIX):], 'artist': item.get('artist'), 'album': item.get('album')}
+
+def artist_list(counters: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Build ``GET /artists`` from the ``ARTISTS`` counter items, ordered by name."""
+    artists: Dict[str, Dict[str, Any]] = {}
+    album_counts: Dict[str, int] = {}
+    for item in counters:
+        if item.get('song_count', 0) <= 0:
+            continue
+        if item['sk'].startswith('ARTIST#'):
+            artists[item['slug']] = {'slug': item['slug'], 'name': item['name'],
+                                     'song_count': item['song_count'], 'album_count': 0}
+        elif item['sk'].startswith('ALBUM#'):
+            album_counts[item['artist_slug']] = album_counts.get(item['artist_slug'], 0) + 1
+    for slug, count in album_counts.items():
+        if slug in artists:
+            artists[slug]['album_count'] = count
+    return plain(sorted(artists.values(), key=lambda entry: (normalize_text(entry['name']), entry['slug'])))
+
+def artist_page(slug: str, songs: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Build ``GET /artists/{slug}`` from the artist's songs, or None if it has none.
+
+    The artist's name and each album's title are those of its first song by ID.
+    """
+    songs = sorted((song for song in songs if slugify(song.get('artist')) == slug), key=lambda song: song['song_id'])
+    if not songs:
+        return None
+    albums: Dict[str, Dict[str, Any]] = {}
+    for song in songs:
+        album_id = album_id_for(song.get('artist'), song.get('album'))
+        if album_id:
+            albums.setdefault(album_id, {'album_id': album_id, 'title': song['album'], 'song_ids': []})[
+                'song_ids'].append(song['song_id'])
+    for album in albums.values():
+        album['song_count'] = len(album['song_ids'])
+    return {
+        'name': songs[0].get('artist') or '',
+        'slug': slug,
+        'song_ids': [song['song_id'] for song in songs],
+        'song_count': len(songs),
+        'albums': sorted(albums.values(), key=lambda album: (normalize_text(album['title']), album['album_id'])),
+    }
+
+def album_page(album_id: str, songs: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Build ``GET /albums/{album_id}`` from the album's songs, or None if it has none."""
+    songs = sorted((song for song in songs if album_id_for(song.get('artist'), song.get('album')) == album_id),
+                   key=lambda song: song['song_id'])
+    if not songs:
+        return None
+    artist = songs[0].get('artist') or ''
+    return {
+        'album_id': album_id,
+        'title': songs[0]['album'],
+        'artist': artist,
+        'artist_slug': slugify(artist),
+        'song_ids': [song['song_id'] for song in songs],
+        'song_count': len(songs),
+    }
+
+class AggregateStore:
+    """Reads and maintains aggregate items in the index table."""
+
+    def __init__(self, index_table):
+        """Initialize with the index table."""
+        self.index_table = index_table
+
+    # Reads
+
+    def _query(self, pk: str, prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Read a whole partition (or the items whose sk starts with ``prefix``)."""
+        condition = Key('pk').eq(pk)
+        if prefix:
+            condition = condition & Key('sk').begins_with(prefix)
+        query: Dict[str, Any] = {'KeyConditionExpression': condition}
+        items = []
+        while True:
+            response = self.index_table.query(**query)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get_artists(self) -> List[Dict[str, Any]]:
+        """Return every artist with counts, ordered by name."""
+        return artist_list(self._query(ARTISTS_PK))
+
+    def get_artist(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Return one artist's songs grouped by album, or None."""
+        entries = self._query(f'ARTIST#{slug}', SONG_PREFIX)
+        return plain(artist_page(slug, map(_entry_song, entries)))
+
+    def get_album(self, album_id: str) -> Optional[Dict[str, Any]]:
+        """Return one album and its songs, or None."""
+        entries = self._query(f'ALBUM#{album_id}', SONG_PREFIX)
+        return plain(album_page(album_id, map(_entry_song, entries)))
+
+    # Incremental maintenance
+
+    def add_to(self, transaction: WriteTransaction, old: Optional[Dict[str, Any]],
+               new: Optional[Dict[str, Any]]) -> WriteTransaction:
+        """Add the entry and counter writes for a song moving from ``old`` to ``new``.
+
+        Args:
+            transaction: The transaction writing the song
+            old: The song before the write (None for creates)
+            new: The song after the write (None for deletes)
+        """
+        if _placement(old) == _placement(new):
+            return transaction
+        before, after = song_entries(old), song_entries(new)
+        for key in sorted(after):
+            if before.get(key) != after[key]:
+                transaction.put(self.index_table, after[key])
+        for pk, sk in sorted(before.keys() - after.keys()):
+            transaction.delete(self.index_table, {'pk': pk, 'sk': sk})
+
+        removed, added = song_counts(old), song_counts(new)
+        for sk in sorted(removed.keys() | added.keys()):
+            delta = (sk in added) - (sk in removed)
+            if not delta:
+                continue
+            if delta < 0:
+                transaction.update(self.index_table, {'pk': ARTISTS_PK, 'sk': sk},
+                                   'ADD song_count :delta', values={':delta': delta})
+                continue
+            # The first writer names the artist; later ones only count
+            fields = added[sk]
+            names = {f'#{name}': name for name in fields}
+            values = {f':{name}': value for name, value in fields.items()}
+            assignments = ', '.join(
+                f'#{name} = if_not_exists(#{name}, :{name})' if name == 'name' else f'#{name} = :{name}'
+                for name in fields
+            )
+            transaction.update(self.index_table, {'pk': ARTISTS_PK, 'sk': sk},
+                               f'SET {assignments} ADD song_count :delta',
+                               names=names, values=dict(values, **{':delta': delta}))
+        return transaction
+
+    # Repair
+
+    def rebuild(self, songs: Iterable[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+        """Recompute every aggregate item from the full catalog and fix any drift.
+
+        Writes that land while the scan is running can make a counter look
+        off by one; the next rebuild settles it.
+
+        Args:
+            songs: Every song in the catalog (e.g. from ``parallel_scan``)
+            dry_run: Only report drift, do not write
+
+        Returns:
+            Drift report with the number of items checked, and the items
+            (``pk/sk``) missing, stale and orphaned
+        """
+        expected = build_aggregates(songs)
+
+        stored: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        scan_kwargs: Dict[str, Any] = {}
+        while True:
+            response = self.index_table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                if item['pk'] == ARTISTS_PK or item['pk'].startswith(('ARTIST#', 'ALBUM#')):
+                    stored[(item['pk'], item['sk'])] = item
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        report = {'checked': len(expected), 'missing': [], 'stale': [], 'orphaned': []}
+        writes, deletes = [], []
+        for key, item in sorted(expected.items()):
+            current = stored.get(key)
+            if current is None:
+                report['missing'].append('/'.join(key))
+            elif _differs(current, item):
+                report['stale'].append('/'.join(key))
+                if 'name' in current:
+                    item = dict(item, name=current['name'])  # Keep the name the first writer chose
+            else:
+                continue
+            writes.append(item)
+        for key in sorted(stored.keys() - expected.keys()):
+            report['orphaned'].append('/'.join(key))
+            deletes.append({'pk': key[0], 'sk': key[1]})
+        if not dry_run:
+            with self.index_table.batch_writer() as batch:
+                for item in writes:
+                    batch.put_item(Item=item)
+                for key in deletes:
+                    batch.delete_item(Key=key)
+
+        report['drift'] = len(report['missing']) + len(report['stale']) + len(report['orphaned'])
+        return report
+
+def _differs(stored: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+    """Whether a stored item differs from the rebuilt one (the first writer's artist name stands)."""
+    ignored = ('name',) if expected['pk'] == ARTISTS_PK else ()
+    return any(plain(stored.get(name)) != plain(value) for name, value in expected.items() if name not in ignored)
+
+def build_aggregates(songs: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Compute every aggregate item from scratch, keyed by (pk, sk).
+
+    Counters are named after the first song by ID, as ``artist_page`` names artists.
+    """
+    items: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for song in sorted(songs, key=lambda song: song['song_id']):
+        items.update(song_entries(song))
+        for sk, fields in song_counts(song).items():
+            counter = items.setdefault((ARTISTS_PK, sk), dict(fields, pk=ARTISTS_PK, sk=sk, song_count=0))
+            counter['song_count'] += 1
+    return items
@@ -5,17 +5,64 @@ This module contains the business logic for handling song operations,
 independent of the API Gateway/Lambda implementation.
 """
 
-import json
+import random
+import threading
+import time
+from decimal import Decimal
 from uuid import uuid4
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, Iterator, List, Optional, Any
 from marshmallow import ValidationError
-from .schemas import song_schema, songs_schema
-from botocore.exceptions import ClientError
+from .schemas import song_serializer
+from .catalog import ColumnarCatalog
+from .known_ids import KnownSongIds
+from .metrics import Metrics
+from .deadline import Deadline
+from .search import TrigramIndex
+from .timing import span
+from .changes import SETTLE_SECONDS
+from .shuffle import lineage_scope
+from .storage import DynamoDBSongStore, SearchableStore, SongStore
+from .keys import new_song_keys, parse_sort, range_index
+from .pagination import decode_cursor, encode_cursor
 
 class SongsApi:
-    def __init__(self, table):
-        """Initialize with a DynamoDB table."""
-        self.table = table
+    def __init__(self, table=None, index_table=None, search_index: Optional[TrigramIndex] = None,
+                 search_index_ttl: float = 300, changes_settle_seconds: float = SETTLE_SECONDS,
+                 catalog: Optional[ColumnarCatalog] = None, known_ids: Optional[KnownSongIds] = None,
+                 deadline: Optional[Deadline] = None, metrics: Optional[Metrics] = None,
+                 store: Optional[SongStore] = None):
+        """Initialize with a DynamoDB table, or any other song store.
+
+        Args:
+            table: The songs DynamoDB table (when no ``store`` is given)
+            index_table: Table holding derived documents such as aggregates (optional)
+            search_index: Trigram index shared across invocations (optional)
+            search_index_ttl: Seconds before the search index is refreshed from the table
+            changes_settle_seconds: Age a change must reach before the change feed serves it
+            catalog: In-memory catalog shared across invocations; when given
+                (and the index table holds the change feed), paginated
+                listings are served from it instead of DynamoDB (optional)
+            known_ids: Bloom filter and negative cache of song IDs shared across
+                invocations; when given (and the index table holds the change
+                feed), reads of unknown IDs are answered without DynamoDB (optional)
+            deadline: When the request must have answered by; scans stop or
+                give up once it passes (optional)
+            metrics: Counters for hits and reloads of the in-process caches (optional)
+            store: Where songs are kept, e.g. a ``SqliteSongStore``; replaces
+                ``table``, ``index_table`` and ``changes_settle_seconds`` (optional)
+        """
+        self.store = store if store is not None else DynamoDBSongStore(table, index_table, changes_settle_seconds)
+        self.index_table = self.store.index_table
+        self.aggregates = self.store.aggregates
+        self.changes = self.store.changes
+        # A store with its own full-text index answers searches; the others use the in-memory one
+        self.search_index = None if isinstance(self.store, SearchableStore) else (
+            search_index if search_index is not None else TrigramIndex())
+        self.search_index_ttl = search_index_ttl
+        self.catalog = catalog
+        self.known_ids = known_ids
+        self.deadline = deadline
+        self.metrics = metrics or Metrics()
 
     def _ensure_s3_uri(self, song_data: Dict[str, Any]) -> Dict[str, Any]:
         """Ensure s3_uri is properly set in song data."""
@@ -27,28 +74,214 @@ class SongsApi:
                 song_data['s3_uri'] = ''  # Set empty string if no filename
         return song_data
 
-    def list_songs(self) -> Dict[str, Any]:
-        """List all songs.
-        
+    def _dump_songs(self, items) -> List[Dict[str, Any]]:
+        """Serialize stored songs for a response."""
+        with span('dump'):
+            return song_serializer.dump_many(self._ensure_s3_uri(item) for item in items)
+
+    def _ensure_search_index(self, wait: bool = False) -> TrigramIndex:
+        """Build the search index from the table if it is missing, and refresh it once stale.
+
+        Only a missing index is built in the request; warm-up and init build
+        it before any search needs it. A stale one keeps answering while a
+        background thread, one per sandbox, rebuilds it from a full scan.
+
+        Args:
+            wait: Rebuild a stale index now instead of in the background
+        """
+        index = self.search_index
+        if index.loaded_at is None or (wait and not index.is_fresh(self.search_index_ttl)):
+            index.load(self._search_documents(self.deadline))
+            self.metrics.increment('search_index.rebuild')
+            return index
+        if not index.is_fresh(self.search_index_ttl) and index.refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_search_index, name='search-index-refresh', daemon=True).start()
+            self.metrics.increment('search_index.refresh')
+        self.metrics.increment('search_index.hit')
+        return index
+
+    def _refresh_search_index(self) -> None:
+        """Reload the search index without a deadline, then let the next refresh start."""
+        try:
+            self.search_index.load(self._search_documents(None))
+        finally:
+            self.search_index.refresh_lock.release()
+
+    def _search_documents(self, deadline: Optional[Deadline]) -> Iterator[Dict[str, Any]]:
+        """Yield every song as the search index keeps it."""
+        for item in self.store.scan(deadline):
+            yield song_serializer.dump(self._ensure_s3_uri(item))
+
+    def _ensure_catalog(self, wait: bool = False) -> Optional[ColumnarCatalog]:
+        """Load the in-memory catalog if it is missing, and reload it once the table changed.
+
+        The snapshot is versioned by the change feed's sequence number. A
+        write allocates its number just before it commits, so a snapshot
+        taken within ``settle_seconds`` of the last allocation may miss that
+        write; it is taken once more after the window has passed.
+
+        Only a missing snapshot is loaded in the request. A stale one keeps
+        answering while a background thread, one per sandbox, reloads it.
+
+        Args:
+            wait: Reload a stale snapshot now, for callers that need it current
+        """
+        if self.catalog is None or self.changes is None:
+            return None
+        if self.catalog.loaded_at is None or wait:
+            if self._catalog_stale() is not None:
+                # One request reloads; the others wait for its snapshot instead of scanning too
+                with self.catalog.reload_lock:
+                    version = self._catalog_stale()
+                    if version is not None:
+                        self.catalog.load(self.store.scan(self.deadline, parallel=True), version)
+                        self.metrics.increment('catalog.reload')
+                        return self.catalog
+        elif self._catalog_stale() is not None and self.catalog.reload_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_catalog, name='catalog-refresh', daemon=True).start()
+            self.metrics.increment('catalog.refresh')
+        self.metrics.increment('catalog.hit')
+        return self.catalog
+
+    def _refresh_catalog(self) -> None:
+        """Reload the catalog without a deadline, then let the next reload start."""
+        try:
+            version = self._catalog_stale()
+            if version is not None:
+                self.catalog.load(self.store.scan(None, parallel=True), version)
+        finally:
+            self.catalog.reload_lock.release()
+
+    def _catalog_stale(self) -> Optional[int]:
+        """Return the table's version if the in-memory catalog should be reloaded, else None."""
+        version, allocated_at = self.changes.current_sequence()
+        settled_at = allocated_at + self.changes.settle_seconds
+        if self.catalog.version != version or self.catalog.loaded_at < settled_at <= time.time():
+            return version
+        return None
+
+    def _ensure_known_ids(self) -> Optional[KnownSongIds]:
+        """Build or catch up the song ID filter, if one is configured."""
+        if self.known_ids is None or self.changes is None:
+            return None
+        # Only DynamoDB has a change feed, so the store here is always its table
+        self.known_ids.sync(self.store.table, self.changes, self._song_ids)
+        return self.known_ids
+
+    def _song_ids(self) -> Iterator[str]:
+        """Yield every song ID, from the in-memory catalog if there is one."""
+        # The filter is rebuilt from these, so a stale snapshot would hide songs from it
+        catalog = self._ensure_catalog(wait=True)
+        if catalog is not None:
+            yield from catalog.song_ids()
+            return
+        for item in self.store.scan(self.deadline, parallel=True, attributes=['song_id']):
+            yield item['song_id']
+
+    def warm_caches(self) -> Dict[str, int]:
+        """Load the sandbox-wide caches now instead of on the first request needing them.
+
+        Returns:
+            Number of songs in each cache that was loaded
+        """
+        report = {'search_index': len(self._ensure_search_index(wait=True))} if self.search_index is not None else {}
+        catalog = self._ensure_catalog(wait=True)
+        if catalog is not None:
+            report['catalog'] = len(catalog)
+        if self._ensure_known_ids() is not None:
+            report['known_ids'] = 1
+        return report
+
+    def list_songs(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                   sort: Optional[str] = None,
+                   filters: Optional[Dict[str, Decimal]] = None,
+                   lineage: Optional[str] = None) -> Dict[str, Any]:
+        """List songs, optionally one sorted page at a time.
+
+        Without any arguments every song is returned, unsorted. With a
+        ``limit``, ``cursor`` or ``sort`` a single page is read: sorted pages
+        come straight from the matching index, so they cost the same as an
+        unsorted page.
+
+        Args:
+            limit: Page size (default 20 when paginating)
+            cursor: Opaque cursor from a previous page's ``next_cursor``
+            sort: ``title``, ``date_added`` or ``bpm``; prefix with ``-`` for descending
+            filters: Range filters from ``parse_range_filters`` (``bpm_min``,
+                ``bpm_max``, ``duration_min``, ``duration_max``), served by
+                the bpm or duration index
+            lineage: Only songs of this lineage (name or slug), read from
+                the lineage fan-out index
+
+        With an in-memory catalog, pages are filtered, sorted and sliced
+        in memory; ``next_cursor`` is then an offset and ``total`` is exact
+        for every page, filtered or not.
+
         Returns:
             Dict containing:
             - items: List of songs
+            - next_cursor: Cursor for the next page (paginated requests, and
+              full listings cut short by the deadline)
+            - has_more: Whether another page exists (likewise)
+            - total: Number of songs in the catalog, from the maintained counter
+              (None for range-filtered pages, which no counter covers; the
+              lineage's own counter for lineage pages)
+
+        Raises:
+            ValueError: If the sort field or cursor is invalid
         """
-        try:
-            # Get all items
-            response = self.table.scan()
-            items = response.get('Items', [])
+        if limit is None and cursor is None and sort is None and not filters and lineage is None:
+            # Get all items, or as many as the deadline allows
+            items, last_key = self.store.list_all(self.deadline)
             
             # Ensure s3_uri is set for each item
             processed_items = [self._ensure_s3_uri(item) for item in items]
             
-            return {
-                'items': [song_schema.dump(item) for item in processed_items]
-            }
-        except ClientError:
-            return {
-                'items': []
+            total = self.store.count()
+            result = {
+                'items': self._dump_songs(processed_items),
+                'total': total if total is not None or last_key else len(processed_items)
             }
+            if last_key is not None:
+                # Cut short: the client resumes with paginated requests
+                result.update(next_cursor=encode_cursor(last_key), has_more=True)
+            return result
+
+        start_key = decode_cursor(cursor) if cursor else None
+        if start_key is None or 'offset' in start_key:
+            catalog = self._ensure_catalog()
+            if catalog is not None:
+                offset = int(start_key['offset']) if start_key else 0
+                return self._catalog_page(catalog, limit or 20, offset, sort, filters, lineage)
+            if start_key:
+                raise ValueError("cursor is not valid")
+
+        items, last_key = self.store.page(limit or 20, start_key, sort, filters, lineage)
+        next_cursor = encode_cursor(last_key)
+        return {
+            'items': self._dump_songs(items),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'total': None if filters else self.store.count(lineage)
+        }
+
+    def _catalog_page(self, catalog: ColumnarCatalog, limit: int, offset: int, sort: Optional[str],
+                      filters: Optional[Dict[str, Decimal]], lineage: Optional[str]) -> Dict[str, Any]:
+        """Serve one ``list_songs`` page from the in-memory catalog, in index order."""
+        sort_key, ascending = None, True
+        if filters:
+            _, sort_key, ascending = range_index(filters, sort)
+        elif sort:
+            _, sort_key, ascending = parse_sort(sort)
+        items, total = catalog.query(sort_key, ascending, filters, lineage, offset, limit)
+        next_offset = offset + len(items)
+        next_cursor = encode_cursor({'offset': Decimal(next_offset)}) if next_offset < total else None
+        return {
+            'items': self._dump_songs(items),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'total': total
+        }
 
     def create_song(self, song_data: Dict[str, str]) -> Dict[str, Any]:
         """Create a new song."""
@@ -57,29 +290,46 @@ class SongsApi:
         
         # Validate and clean input data
         try:
-            validated_data = song_schema.load(song_data)
+            validated_data = song_serializer.load(song_data)
         except ValidationError as e:
             raise ValidationError(e.messages)
             
         # Add UUID and save
         validated_data['song_id'] = str(uuid4())
-        self.table.put_item(Item=validated_data)
-        return song_schema.dump(validated_data)
+        self.store.create({**validated_data, **new_song_keys(validated_data)})
+        with span('dump'):
+            song = song_serializer.dump(validated_data)
+        if self.known_ids is not None:
+            self.known_ids.add(song['song_id'])
+        # Even before the index is loaded: a load already scanning may have missed it
+        if self.search_index is not None:
+            self.search_index.add(song)
+        return song
 
     def get_song(self, song_id: str) -> Optional[Dict[str, Any]]:
-        """Get a specific song by ID."""
-        response = self.table.get_item(Key={'song_id': song_id})
-        item = response.get('Item')
+        """Get a specific song by ID.
+
+        With a song ID filter, IDs it knows to be missing return None
+        without a read.
+        """
+        known = self._ensure_known_ids()
+        if known is not None and not known.might_exist(song_id):
+            return None
+        item = self.store.get(song_id)
         if item:
             # Ensure s3_uri is set
             item = self._ensure_s3_uri(item)
-            return song_schema.dump(item)
+            with span('dump'):
+                return song_serializer.dump(item)
+        if known is not None:
+            known.record_miss(song_id)
         return None
 
     def update_song(self, song_id: str, song_data: Dict[str, str]) -> Optional[Dict[str, Any]]:
         """Update a song."""
         # First check if the song exists
-        if not self.get_song(song_id):
+        existing = self.get_song(song_id)
+        if not existing:
             return None
 
         # Ensure s3_uri is set
@@ -87,40 +337,129 @@ class SongsApi:
 
         # Validate and clean input data
         try:
-            validated_data = song_schema.load(song_data)
+            validated_data = song_serializer.load(song_data)
         except ValidationError as e:
             raise ValidationError(e.messages)
             
-        # Build update expression
-        update_expr = 'SET '
-        expr_names = {}
-        expr_values = {}
-        
-        for key, value in validated_data.items():
-            if key != 'song_id':  # Don't update the primary key
-                update_expr += f'#{key} = :{key}, '
-                expr_names[f'#{key}'] = key
-                expr_values[f':{key}'] = value
-        
-        update_expr = update_expr.rstrip(', ')
-        
-        try:
-            response = self.table.update_item(
-                Key={'song_id': song_id},
-                UpdateExpression=update_expr,
-                ExpressionAttributeNames=expr_names,
-                ExpressionAttributeValues=expr_values,
-                ReturnValues='ALL_NEW'
-            )
-            item = response.get('Attributes')
-            if item:
-                # Ensure s3_uri is set
-                item = self._ensure_s3_uri(item)
-                return song_schema.dump(item)
-            return None
-        except ClientError:
+        item = self.store.update(song_id, existing, validated_data)
+        if not item:
             return None
+        # Ensure s3_uri is set
+        item = self._ensure_s3_uri(item)
+        with span('dump'):
+            song = song_serializer.dump(item)
+        if self.search_index is not None:
+            self.search_index.add(song)
+        return song
 
     def delete_song(self, song_id: str) -> None:
         """Delete a song."""
-        self.table.delete_item(Key={'song_id': song_id}) 
\ No newline at end of file
+        self.store.delete(song_id)
+        if self.search_index is not None:
+            self.search_index.remove(song_id)
+
+    def list_changes(self, token: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """List songs created, updated or deleted since a sync token.
+
+        Args:
+            token: ``next_token`` from the previous call; omit for a full download
+            limit: Maximum number of changes
+
+        Returns:
+            Dict containing:
+            - changes: ``{"type": "upserted", "song": {...}}`` or
+              ``{"type": "deleted", "song_id": "..."}``, oldest first
+            - next_token: Token to pass on the next call
+            - has_more: Whether more changes are ready right now
+
+        Raises:
+            ValueError: If the token is malformed
+            SyncTokenExpired: If the token is older than the retained tombstones
+        """
+        if not self.changes:
+            return {'changes': [], 'next_token': None, 'has_more': False}
+        page = self.changes.changes(self.store.table, token, limit)
+        changes = []
+        with span('dump'):
+            for kind, item in page['changes']:
+                if kind == 'deleted':
+                    changes.append({'type': kind, 'song_id': item['song_id']})
+                else:
+                    changes.append({'type': kind, 'song': song_serializer.dump(self._ensure_s3_uri(item))})
+        return {'changes': changes, 'next_token': page['next_token'], 'has_more': page['has_more']}
+
+    def random_songs(self, n: int = 20, lineage: Optional[str] = None) -> Dict[str, Any]:
+        """Return a uniform random sample of songs, optionally from one lineage.
+
+        Reads the precomputed shuffle, so the cost is O(n) reads. Until the
+        first refresh has run the sample is drawn from a full scan instead.
+
+        Args:
+            n: Number of songs
+            lineage: Only sample songs of this lineage (name or slug)
+
+        Returns:
+            Dict containing:
+            - items: Up to n distinct songs in random order
+        """
+        items = self.store.sample(n, lineage)
+        if items is None:
+            slug = lineage_scope(lineage) if lineage else None
+            candidates = [
+                item for item in self.store.scan(self.deadline)
+                if slug is None or slug in {lineage_scope(name) for name in item.get('lineage') or []}
+            ]
+            items = random.sample(candidates, min(n, len(candidates)))
+        return {'items': self._dump_songs(items or [])}
+
+    def refresh_shuffle(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Rebuild the shuffled song IDs behind random samples from a parallel scan."""
+        return self.store.shuffle.refresh(self.store.scan(self.deadline, parallel=True), dry_run=dry_run)
+
+    def list_artists(self) -> Dict[str, Any]:
+        """List every artist with song and album counts from the aggregate index."""
+        return {'items': self.aggregates.get_artists() if self.aggregates else []}
+
+    def get_artist(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Get an artist's songs grouped by album, or None."""
+        return self.aggregates.get_artist(slug) if self.aggregates else None
+
+    def get_album(self, album_id: str) -> Optional[Dict[str, Any]]:
+        """Get an album and its songs, or None."""
+        return self.aggregates.get_album(album_id) if self.aggregates else None
+
+    def reconcile_counters(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Recompute the maintained counters from a parallel scan and fix drift."""
+        return self.store.counters.reconcile(self.store.scan(parallel=True), dry_run=dry_run)
+
+    def repair_aggregates(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Rebuild the artist and album aggregates from a parallel scan."""
+        return self.aggregates.rebuild(self.store.scan(parallel=True), dry_run=dry_run)
+
+    def rebuild_lineage_index(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Backfill and repair the lineage fan-out entries from a parallel scan."""
+        return self.store.lineage.rebuild(self.store.scan(parallel=True), dry_run=dry_run)
+
+    def search_songs(self, query: str, fuzzy: bool = False, limit: int = 20) -> Dict[str, Any]:
+        """Search songs by title and artist.
+
+        Args:
+            query: Free-text query
+            fuzzy: Tolerate typos by ranking on trigram similarity
+            limit: Maximum number of results
+
+        Returns:
+            Dict containing:
+            - items: Matching songs, best match first
+            - scores: Similarity score for each item (0-1)
+        """
+        if self.search_index is None:
+            results = self.store.search(query, fuzzy=fuzzy, limit=limit)
+            with span('dump'):
+                results = [(song_serializer.dump(self._ensure_s3_uri(item)), score) for item, score in results]
+        else:
+            results = self._ensure_search_index().search(query, fuzzy=fuzzy, limit=limit)
+        return {
+            'items': [song for song, _ in results],
+            'scores': [score for _, score in results]
+        } 
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Batched point reads for the Songs API.
+
+``batch_get`` fetches many items by key with ``BatchGetItem`` (100 keys
+per call), retrying any keys DynamoDB leaves unprocessed, and returns
+them in the order the keys were given.
+"""
+
+import random
+import time
+from typing import Any, Dict, List, Sequence
+
+MAX_KEYS = 100
+
+def batch_get(table, keys: Sequence[Dict[str, Any]], max_attempts: int = 5,
+              **kwargs) -> List[Dict[str, Any]]:
+    """Fetch items by key, preserving key order and skipping missing items.
+
+    Args:
+        table: DynamoDB table resource
+        keys: Primary keys to fetch
+        max_attempts: Attempts per chunk while keys come back unprocessed
+        **kwargs: Extra per-table request arguments (e.g. ProjectionExpression)
+
+    Raises:
+        RuntimeError: If keys are still unprocessed after every attempt
+    """
+    if not keys:
+        return []
+    client = table.meta.client
+    key_names = sorted(keys[0])
+    found: Dict[tuple, Dict[str, Any]] = {}
+    for start in range(0, len(keys), MAX_KEYS):
+        pending = list(keys[start:start + MAX_KEYS])
+        for attempt in range(1, max_attempts + 1):
+            response = client.batch_get_item(
+                RequestItems={table.name: dict(kwargs, Keys=pending)}
+            )
+            for item in response.get('Responses', {}).get(table.name, []):
+                found[tuple(item.get(name) for name in key_names)] = item
+            pending = response.get('UnprocessedKeys', {}).get(table.name, {}).get('Keys', [])
+            if not pending:
+                break
+            if attempt == max_attempts:
+                raise RuntimeError(f'{len(pending)} keys still unprocessed after {max_attempts} attempts')
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+    ordered = (found.get(tuple(key.get(name) for name in key_names)) for key in keys)
+    return [item for item in ordered if item is not None]
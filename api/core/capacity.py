@@ -0,0 +1,89 @@
+"""
+Consumed DynamoDB capacity per request.
+
+The tables are on-demand, so every read and write request unit is
+billed. ``instrument`` adds hooks to a DynamoDB client:
+
+- ``ReturnConsumedCapacity=TOTAL`` is added to every table operation
+  while a ``ConsumedCapacity`` collector is current.
+- The units each response reports are added to that collector, per
+  operation.
+
+The handler makes a collector current for each request with ``metering``.
+Each ``POST /batch`` sub-request gets its own, so every unit is counted
+once, under the route that spent it. The totals are emitted with the
+route's EMF metrics, and ``utilities/capacity_report.py`` turns them
+into a cost per 1,000 requests.
+"""
+
+import contextlib
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+READ_OPERATIONS = frozenset({'GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'})
+WRITE_OPERATIONS = frozenset({'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'})
+TABLE_OPERATIONS = READ_OPERATIONS | WRITE_OPERATIONS
+
+_capacity: ContextVar[Optional['ConsumedCapacity']] = ContextVar('capacity', default=None)
+
+class ConsumedCapacity:
+    """Read and write capacity units consumed per operation."""
+
+    def __init__(self):
+        self._operations: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, operation: str, consumed) -> None:
+        """Add the ``ConsumedCapacity`` of one response (a dict, or a list of them for batches)."""
+        entries = consumed if isinstance(consumed, list) else [consumed]
+        units = sum(float(entry.get('CapacityUnits', 0)) for entry in entries)
+        with self._lock:
+            totals = self._operations.setdefault(operation, [0.0, 0])
+            totals[0] += units
+            totals[1] += 1
+
+    def operations(self) -> Dict[str, Dict[str, float]]:
+        """Return ``{operation: {'units', 'calls'}}``."""
+        with self._lock:
+            return {operation: {'units': round(units, 2), 'calls': calls}
+                    for operation, (units, calls) in self._operations.items()}
+
+    def read_units(self) -> float:
+        """Read capacity units consumed by all operations."""
+        return round(sum(stats['units'] for operation, stats in self.operations().items()
+                         if operation in READ_OPERATIONS), 2)
+
+    def write_units(self) -> float:
+        """Write capacity units consumed by all operations."""
+        return round(sum(stats['units'] for operation, stats in self.operations().items()
+                         if operation in WRITE_OPERATIONS), 2)
+
+@contextlib.contextmanager
+def metering(capacity: Optional[ConsumedCapacity]):
+    """Add capacity consumed in this context to ``capacity`` (None adds nothing)."""
+    token = _capacity.set(capacity)
+    try:
+        yield
+    finally:
+        _capacity.reset(token)
+
+def current() -> Optional[ConsumedCapacity]:
+    """Return the collector of this context, if there is one."""
+    return _capacity.get()
+
+def instrument(client):
+    """Report consumed capacity for every table operation of a DynamoDB client. Returns the client."""
+
+    def before_parameter_build(params, model, **kwargs):
+        if _capacity.get() is not None and model.name in TABLE_OPERATIONS:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+    def after_call(parsed, model, **kwargs):
+        capacity = _capacity.get()
+        if capacity is not None and 'ConsumedCapacity' in parsed:
+            capacity.add(model.name, parsed['ConsumedCapacity'])
+
+    client.meta.events.register('before-parameter-build.dynamodb', before_parameter_build)
+    client.meta.events.register('after-call.dynamodb', after_call)
+    return client
@@ -0,0 +1,255 @@
+"""
+Columnar in-memory catalog for warm sandboxes.
+
+The whole catalog fits comfortably in Lambda memory, so
+``ColumnarCatalog`` keeps a snapshot of it as columns instead of one dict
+per song:
+
+- string fields as ``array('I')`` codes into one pool of interned strings
+- ``lineage`` as offsets and codes (a list per row without the lists)
+- ``bpm_value``, ``duration_s`` and ``date_added_ts`` as ``array('d')``,
+  NaN where the song has no value
+
+At load time each sortable column gets a row permutation ordered by
+value, and each lineage a list of its rows. Range filters are then two
+bisections into a sorted column, sorting a page is a slice of a
+permutation, and filters combine by set intersection, so a query only
+touches the rows it returns. Rows are materialized back into song dicts
+for the requested page alone.
+
+A snapshot is tagged with a version (the change feed's sequence number)
+and reloaded in the background when the table's version moves on, while
+requests keep reading the snapshot they have. Concurrent requests share
+the catalog: a reload builds the new snapshot aside and swaps it in under
+a lock that queries also take, so a query never mixes two snapshots.
+"""
+
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from marshmallow import fields
+from .aggregates import slugify
+from .keys import MIN_KNOWN_BPM, SORT_INDEXES
+from .schemas import song_schema
+
+NUMERIC_COLUMNS = ('bpm_value', 'duration_s', 'date_added_ts')
+STRING_COLUMNS = tuple(
+    name for name, field in song_schema.dump_fields.items() if type(field) is fields.String
+) + ('title_key',)
+RANGE_COLUMNS = {'bpm': 'bpm_value', 'duration': 'duration_s'}
+
+_MISSING_CODE, _NONE_CODE, _LIST_CODE = 0, 1, 2
+_MISSING = object()
+_NAN = float('nan')
+
+class ColumnarCatalog:
+    """A versioned, column-oriented snapshot of the catalog."""
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+        self.size = 0
+        self._pool: List[Optional[str]] = [None, None]
+        self._strings: Dict[str, array] = {}
+        self._numbers: Dict[str, array] = {}
+        self._lineage_offsets = array('I', [0])
+        self._lineage_codes = array('I')
+        self._lineage_state = bytearray()
+        self._lineages: Dict[str, array] = {}
+        self._orders: Dict[str, array] = {}
+        self._sorted_values: Dict[str, array] = {}
+        self._ranks: Dict[str, array] = {}
+        self._lock = threading.Lock()
+        # Held by the caller around a reload, so concurrent requests scan once
+        self.reload_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def load(self, items: Iterable[Dict[str, Any]], version: Optional[int] = None) -> None:
+        """Replace the snapshot with the given songs.
+
+        A snapshot whose load started before the one in place is dropped:
+        of two overlapping loads, the one that read first may finish last.
+        """
+        started = time.time()
+        codes: Dict[Any, int] = {None: _NONE_CODE}
+        pool: List[Optional[str]] = [None, None]
+        known = codes.get
+
+        def intern(value: Any) -> int:
+            if value is _MISSING:
+                return _MISSING_CODE
+            value = str(value)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(pool)
+                pool.append(value)
+            return code
+
+        rows = sorted(items, key=lambda item: item['song_id'])
+        # One column at a time: a comprehension per column beats a loop per row
+        strings = {
+            name: array('I', [known(value) or intern(value)
+                              for value in [item.get(name, _MISSING) for item in rows]])
+            for name in STRING_COLUMNS
+        }
+        numbers = {
+            name: array('d', [_NAN if value is None else float(value)
+                              for value in (item.get(name) for item in rows)])
+            for name in NUMERIC_COLUMNS
+        }
+
+        offsets, lineage_codes, lineage_state = array('I', [0]), array('I'), bytearray()
+        lineage_rows: Dict[str, List[int]] = {}
+        slugs: Dict[str, str] = {}
+        for row, item in enumerate(rows):
+            lineage = item.get('lineage', _MISSING)
+            lineage_state.append(_MISSING_CODE if lineage is _MISSING
+                                 else _NONE_CODE if lineage is None else _LIST_CODE)
+            for name in (None if lineage is _MISSING else lineage) or []:
+                lineage_codes.append(intern(name))
+                if name:
+                    slug = slugs.get(name) or slugs.setdefault(name, slugify(name))
+                    lineage_rows.setdefault(slug, []).append(row)
+            offsets.append(len(lineage_codes))
+
+        lineages = {slug: array('I', sorted(set(found))) for slug, found in lineage_rows.items()}
+        orders, sorted_values, ranks = _build_orders(pool, strings, numbers, len(rows))
+        with self._lock:
+            if self.loaded_at is not None and started < self.loaded_at:
+                return
+            self._pool, self._strings, self._numbers = pool, strings, numbers
+            self._lineage_offsets, self._lineage_codes = offsets, lineage_codes
+            self._lineage_state = lineage_state
+            self._lineages = lineages
+            self._orders, self._sorted_values, self._ranks = orders, sorted_values, ranks
+            self.size = len(rows)
+            self.version = version
+            self.loaded_at = started
+
+    def song_ids(self) -> List[str]:
+        """Return every song ID in the snapshot, in order."""
+        with self._lock:
+            pool = self._pool
+            return [pool[code] for code in self._strings.get('song_id', ())]
+
+    def _range_rows(self, column: str, low: float, high: float) -> array:
+        values = self._sorted_values[column]
+        return self._orders[column][bisect_left(values, low):bisect_right(values, high)]
+
+    def query(self, sort_key: Optional[str] = None, ascending: bool = True,
+              filters: Optional[Dict[str, Any]] = None, lineage: Optional[str] = None,
+              offset: int = 0, limit: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+        """Filter, sort and slice the catalog.
+
+        Args:
+            sort_key: Derived attribute to order by (``title_key``,
+                ``date_added_ts`` or ``bpm_value``); None orders by song_id
+            ascending: Sort direction
+            filters: Range filters from ``parse_range_filters``
+            lineage: Only songs of this lineage (name or slug)
+            offset: Number of matching songs to skip
+            limit: Page size
+
+        Returns:
+            (songs on the page, number of matching songs)
+        """
+        with self._lock:
+            return self._query(sort_key, ascending, filters, lineage, offset, limit)
+
+    def _query(self, sort_key: Optional[str], ascending: bool, filters: Optional[Dict[str, Any]],
+               lineage: Optional[str], offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        # Each selection is already ordered: ranges by their column, lineages by row
+        selections: Dict[Optional[str], array] = {}
+        for field, column in RANGE_COLUMNS.items():
+            low, high = (filters or {}).get(f'{field}_min'), (filters or {}).get(f'{field}_max')
+            if low is None and high is None:
+                continue
+            low = float(low if low is not None else 0)
+            if field == 'bpm':
+                low = max(low, float(MIN_KNOWN_BPM))
+            selections[column] = self._range_rows(column, low, float(high) if high is not None else math.inf)
+        if lineage is not None:
+            selections[None] = self._lineages.get(slugify(lineage), array('I'))
+
+        if sort_key in selections:
+            # Walk the selection in sort order, keeping rows the others also match
+            rows = selections.pop(sort_key)
+            if selections:
+                others = sorted(selections.values(), key=len)
+                matched = set(others[0]).intersection(*others[1:])
+                rows = [row for row in rows if row in matched]
+        elif selections:
+            others = sorted(selections.values(), key=len)
+            matched = set(others[0]).intersection(*others[1:])
+            rank = self._ranks[sort_key] if sort_key else None
+            if rank is not None:
+                rows = sorted((row for row in matched if rank[row] != 0xFFFFFFFF), key=rank.__getitem__)
+            else:
+                rows = sorted(matched)
+        elif sort_key:
+            rows = self._orders[sort_key]
+        else:
+            rows = range(self.size)
+
+        total = len(rows)
+        if ascending:
+            page = rows[offset:offset + limit]
+        else:
+            end = total - offset
+            page = rows[max(0, end - limit):max(0, end)][::-1]
+        return [self._materialize(row) for row in page], total
+
+    def _materialize(self, row: int) -> Dict[str, Any]:
+        """Rebuild the stored item for one row."""
+        pool = self._pool
+        song: Dict[str, Any] = {}
+        for name, column in self._strings.items():
+            code = column[row]
+            if code != _MISSING_CODE:
+                song[name] = pool[code]
+        state = self._lineage_state[row]
+        if state == _NONE_CODE:
+            song['lineage'] = None
+        elif state == _LIST_CODE:
+            start, end = self._lineage_offsets[row], self._lineage_offsets[row + 1]
+            song['lineage'] = [pool[code] for code in self._lineage_codes[start:end]]
+        for name, column in self._numbers.items():
+            value = column[row]
+            if not math.isnan(value):
+                song[name] = int(value) if value.is_integer() else value
+        return song
+
+def _build_orders(pool: List[Optional[str]], strings: Dict[str, array], numbers: Dict[str, array],
+                  size: int) -> Tuple[Dict[str, array], Dict[str, array], Dict[str, array]]:
+    """Sort each sortable column once; queries reuse the permutations.
+
+    Returns:
+        (row order per column, numeric values in that order, each row's rank)
+    """
+    song_ids = strings['song_id']
+    columns = {key: numbers.get(key) for _, key in SORT_INDEXES.values()}
+    columns['duration_s'] = numbers['duration_s']
+    orders, sorted_values, ranks = {}, {}, {}
+    for key, numeric in columns.items():
+        if numeric is not None:
+            present = [row for row in range(size) if not math.isnan(numeric[row])]
+            value_of = numeric.__getitem__
+        else:
+            text = strings[key]
+            present = [row for row in range(size) if text[row] > _NONE_CODE]
+            value_of = lambda row, text=text: pool[text[row]]
+        present.sort(key=lambda row: (value_of(row), pool[song_ids[row]]))
+        order = array('I', present)
+        rank = array('I', [0xFFFFFFFF]) * size
+        for position, row in enumerate(order):
+            rank[row] = position
+        orders[key] = order
+        ranks[key] = rank
+        if numeric is not None:
+            sorted_values[key] = array('d', (numeric[row] for row in order))
+    return orders, sorted_values, ranks
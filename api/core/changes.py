@@ -0,0 +1,173 @@
+"""
+Change feed for offline clients.
+
+Every song write is stamped with a monotonic ``seq`` (allocated from a
+single counter item in the index table) and an ``updated_at`` epoch
+time, and songs are indexed by ``seq`` in ``changes-index``. Deletes
+leave a tombstone in the index table:
+
+- ``pk = TOMBSTONE``, ``sk = <zero-padded seq>``, ``song_id``,
+  ``expires_at`` (DynamoDB TTL)
+
+``ChangeFeed.changes`` merges both in ``seq`` order, so a client holding
+a sync token only downloads what was created, updated or deleted since.
+A sequence number is allocated just before its write commits, so a
+change is only served once it is ``settle_seconds`` old; by then every
+lower sequence number has either committed or failed for good.
+"""
+
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from boto3.dynamodb.conditions import Key
+from .keys import LISTING_ATTR, LISTING_VALUE
+from .pagination import decode_cursor, encode_cursor
+from .transactions import WriteTransaction
+
+SEQUENCE_KEY = {'pk': 'SEQUENCE', 'sk': 'songs'}
+TOMBSTONE_PK = 'TOMBSTONE'
+CHANGES_INDEX = ('changes-index', 'seq')
+
+# Tokens older than the tombstones they rely on can no longer be served
+TOMBSTONE_TTL_SECONDS = 30 * 24 * 3600
+SETTLE_SECONDS = 5
+
+class SyncTokenExpired(Exception):
+    """Raised when a sync token predates the retained tombstones."""
+
+def encode_token(seq: int, issued_at: float) -> str:
+    """Encode a sequence number and issue time as an opaque sync token."""
+    return encode_cursor({'seq': Decimal(int(seq)), 'ts': Decimal(int(issued_at))})
+
+def decode_token(token: str) -> Tuple[int, int]:
+    """Decode a sync token into (sequence number, issue time).
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    key = decode_cursor(token)
+    try:
+        return int(key['seq']), int(key['ts'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("sync token is not valid") from e
+
+def _tombstone_sk(seq: int) -> str:
+    return f'{seq:020d}'
+
+class ChangeFeed:
+    """Stamps writes with sequence numbers and serves changes since a token."""
+
+    def __init__(self, index_table, settle_seconds: float = SETTLE_SECONDS,
+                 tombstone_ttl: int = TOMBSTONE_TTL_SECONDS):
+        """Initialize with the index table holding the sequence and tombstones."""
+        self.index_table = index_table
+        self.settle_seconds = settle_seconds
+        self.tombstone_ttl = tombstone_ttl
+
+    def next_sequence(self, count: int = 1) -> int:
+        """Allocate ``count`` sequence numbers and return the highest."""
+        response = self.index_table.update_item(
+            Key=SEQUENCE_KEY,
+            UpdateExpression='ADD #count :count SET #updated_at = :now',
+            ExpressionAttributeNames={'#count': 'count', '#updated_at': 'updated_at'},
+            ExpressionAttributeValues={':count': count, ':now': int(time.time())},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['count'])
+
+    def current_sequence(self) -> Tuple[int, int]:
+        """Return the last allocated sequence number and when it was allocated.
+
+        Together they version the catalog: any write since a snapshot moves
+        the sequence number on. Both are 0 before the first write.
+        """
+        item = self.index_table.get_item(Key=SEQUENCE_KEY, ConsistentRead=True).get('Item', {})
+        return int(item.get('count', 0)), int(item.get('updated_at', 0))
+
+    def stamp(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Return the ``seq`` and ``updated_at`` attributes for a song write."""
+        return {'seq': self.next_sequence(), 'updated_at': int(now if now is not None else time.time())}
+
+    def add_tombstone(self, transaction: WriteTransaction, song_id: str,
+                      stamp: Dict[str, Any]) -> WriteTransaction:
+        """Add the tombstone for a deleted song to its delete transaction."""
+        return transaction.put(self.index_table, {
+            'pk': TOMBSTONE_PK,
+            'sk': _tombstone_sk(stamp['seq']),
+            'song_id': song_id,
+            'seq': stamp['seq'],
+            'updated_at': stamp['updated_at'],
+            'expires_at': stamp['updated_at'] + self.tombstone_ttl,
+        })
+
+    def changes(self, songs_table, token: Optional[str] = None, limit: int = 100,
+                now: Optional[float] = None) -> Dict[str, Any]:
+        """Return the changes after a sync token, oldest first.
+
+        Args:
+            songs_table: Songs table with ``changes-index``
+            token: ``next_token`` of a previous call; None starts from the beginning
+            limit: Maximum number of changes
+            now: Current time (defaults to the clock)
+
+        Returns:
+            Dict with ``changes`` (raw song items as ``upserted``, tombstones
+            as ``deleted``), ``next_token`` and ``has_more``
+
+        Raises:
+            ValueError: If the token is malformed
+            SyncTokenExpired: If tombstones since the token may have expired
+        """
+        now = now if now is not None else time.time()
+        since, issued_at = decode_token(token) if token else (0, int(now))
+        if now - issued_at > self.tombstone_ttl:
+            raise SyncTokenExpired("sync token has expired; download the full catalog")
+
+        index_name, key = CHANGES_INDEX
+        songs = songs_table.query(
+            IndexName=index_name,
+            KeyConditionExpression=Key(LISTING_ATTR).eq(LISTING_VALUE) & Key(key).gt(since),
+            Limit=limit
+        )
+        tombstones = self.index_table.query(
+            KeyConditionExpression=Key('pk').eq(TOMBSTONE_PK) & Key('sk').gt(_tombstone_sk(since)),
+            Limit=limit,
+            ConsistentRead=True
+        )
+        merged = sorted(
+            [('upserted', item) for item in songs.get('Items', [])] +
+            [('deleted', item) for item in tombstones.get('Items', [])],
+            key=lambda change: int(change[1]['seq'])
+        )
+
+        changes: List[Tuple[str, Dict[str, Any]]] = []
+        settled = True
+        for change in merged:
+            if len(changes) == limit:
+                break
+            if change[1].get('updated_at', 0) > now - self.settle_seconds:
+                settled = False
+                break
+            changes.append(change)
+
+        more_stored = 'LastEvaluatedKey' in songs or 'LastEvaluatedKey' in tombstones
+        has_more = settled and (len(changes) < len(merged) or more_stored)
+        seq = int(changes[-1][1]['seq']) if changes else since
+        next_token = encode_token(seq, self._issued_at(merged[len(changes):], tombstones, now))
+        return {'changes': changes, 'next_token': next_token, 'has_more': has_more}
+
+    def _issued_at(self, pending: List[Tuple[str, Dict[str, Any]]], tombstones: Dict[str, Any], now: float) -> float:
+        """Return the time a token is valid from: the oldest tombstone it has yet to serve.
+
+        Tombstones written after ``now - settle_seconds`` are not served yet
+        but are not older than that either, so a token with nothing left to
+        serve is stamped with that time, however old its last change is.
+        Tombstones past their TTL that DynamoDB has not removed yet are
+        ignored, as they may go at any time.
+        """
+        pending_at = [int(item['updated_at']) for kind, item in pending
+                      if kind == 'deleted' and item['expires_at'] > now]
+        if not pending_at and 'LastEvaluatedKey' in tombstones:
+            # The tombstones after this page are no older than its last one
+            pending_at = [int(tombstones['Items'][-1]['updated_at'])]
+        return min(pending_at, default=now - self.settle_seconds)
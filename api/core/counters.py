@@ -0,0 +1,109 @@
+"""
+Maintained catalog counters.
+
+Song counts for the whole catalog, each artist and each lineage live in
+the index table under ``pk = COUNTER`` and are adjusted in the same
+transaction as the song write, so list endpoints can report ``total``
+with a single GetItem instead of scanning. ``reconcile`` recomputes the
+counts from a full scan and corrects any drift.
+"""
+
+from typing import Any, Dict, Iterable, Optional
+from boto3.dynamodb.conditions import Key
+from .aggregates import plain, slugify
+from .transactions import WriteTransaction
+
+COUNTER_PK = 'COUNTER'
+CATALOG = 'catalog'
+
+def artist_counter(artist: Optional[str]) -> str:
+    """Return the counter key for an artist."""
+    return f'artist#{slugify(artist)}'
+
+def lineage_counter(lineage: str) -> str:
+    """Return the counter key for a lineage."""
+    return f'lineage#{slugify(lineage)}'
+
+def counter_keys(song: Optional[Dict[str, Any]]) -> set:
+    """Return every counter a song contributes to."""
+    if not song:
+        return set()
+    keys = {CATALOG, artist_counter(song.get('artist'))}
+    keys.update(lineage_counter(name) for name in song.get('lineage') or [] if name)
+    return keys
+
+def counter_deltas(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Return the counter adjustments for a song moving from ``old`` to ``new``."""
+    before, after = counter_keys(old), counter_keys(new)
+    deltas = {key: 1 for key in after - before}
+    deltas.update({key: -1 for key in before - after})
+    return deltas
+
+class CounterStore:
+    """Reads, adjusts and reconciles counters in the index table."""
+
+    def __init__(self, index_table):
+        """Initialize with the index table."""
+        self.index_table = index_table
+
+    def get(self, key: str = CATALOG) -> int:
+        """Return a counter's value (0 if it was never written)."""
+        response = self.index_table.get_item(Key={'pk': COUNTER_PK, 'sk': key})
+        return int(response.get('Item', {}).get('count', 0))
+
+    def add_to(self, transaction: WriteTransaction, deltas: Dict[str, int]) -> WriteTransaction:
+        """Add counter adjustments to a transaction."""
+        for key, delta in sorted(deltas.items()):
+            if delta:
+                transaction.update(
+                    self.index_table,
+                    {'pk': COUNTER_PK, 'sk': key},
+                    'ADD #count :delta',
+                    names={'#count': 'count'},
+                    values={':delta': delta}
+                )
+        return transaction
+
+    def reconcile(self, songs: Iterable[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+        """Recompute every counter from the catalog and correct drift.
+
+        Writes that land while the scan is running can make a counter look
+        off by one; the next reconciliation settles it.
+
+        Args:
+            songs: Every song in the catalog (e.g. from ``parallel_scan``)
+            dry_run: Only report drift, do not write
+
+        Returns:
+            Report with the number of counters checked and each corrected
+            counter as ``{key: {"stored": n, "expected": m}}``
+        """
+        expected: Dict[str, int] = {CATALOG: 0}
+        for song in songs:
+            for key in counter_keys(song):
+                expected[key] = expected.get(key, 0) + 1
+
+        stored: Dict[str, int] = {}
+        query: Dict[str, Any] = {'KeyConditionExpression': Key('pk').eq(COUNTER_PK)}
+        while True:
+            response = self.index_table.query(**query)
+            for item in response.get('Items', []):
+                stored[item['sk']] = plain(item.get('count', 0))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        corrected = {}
+        for key in sorted(expected.keys() | stored.keys()):
+            want, have = expected.get(key, 0), stored.get(key, 0)
+            if want == have:
+                continue
+            corrected[key] = {'stored': have, 'expected': want}
+            if dry_run:
+                continue
+            if want or key == CATALOG:
+                self.index_table.put_item(Item={'pk': COUNTER_PK, 'sk': key, 'count': want})
+            else:
+                self.index_table.delete_item(Key={'pk': COUNTER_PK, 'sk': key})
+
+        return {'checked': len(expected), 'corrected': corrected}
@@ -0,0 +1,63 @@
+"""
+Request deadlines.
+
+Lambda stops an invocation at its timeout, and API Gateway then answers
+with a bodiless 502. ``Deadline`` carries the time left from the Lambda
+context into ``SongsApi`` and the AWS clients:
+- scans check it between pages and stop early
+- downstream calls get timeouts that fit in what is left
+
+Once it has passed, the handler answers 503 itself or returns a partial
+page with a cursor.
+"""
+
+import time
+from typing import Optional
+
+# Kept back from the Lambda timeout to build and return the response
+RESERVE_SECONDS = 1.0
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time before it can finish."""
+
+class Deadline:
+    """A point in time by which a request must have answered."""
+
+    def __init__(self, expires_at: float):
+        """Initialize with an expiry on the ``time.monotonic`` clock."""
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> 'Deadline':
+        """Return a deadline ``seconds`` from now."""
+        return cls(time.monotonic() + seconds)
+
+    @classmethod
+    def from_context(cls, context, reserve: float = RESERVE_SECONDS) -> Optional['Deadline']:
+        """Return the deadline of a Lambda invocation, or None without a context."""
+        remaining_ms = getattr(context, 'get_remaining_time_in_millis', None)
+        if remaining_ms is None:
+            return None
+        return cls.after(remaining_ms() / 1000 - reserve)
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return time.monotonic() >= self.expires_at
+
+    def check(self) -> None:
+        """Raise ``DeadlineExceeded`` if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded("request ran out of time")
+
+    def timeout(self, cap: float, floor: float = 0.1) -> float:
+        """Return a timeout for one downstream call: at most ``cap``, at least ``floor``."""
+        return max(floor, min(cap, self.remaining()))
+
+def check(deadline: Optional[Deadline]) -> None:
+    """``Deadline.check`` that accepts None for no deadline."""
+    if deadline is not None:
+        deadline.check()
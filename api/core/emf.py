@@ -0,0 +1,188 @@
+"""
+CloudWatch Embedded Metric Format (EMF) documents.
+
+CloudWatch turns log lines in EMF into metrics without an agent or
+``PutMetricData`` calls. ``InvocationMetrics`` collects what one
+invocation served and ``documents`` renders it as EMF:
+
+- One document per route and status class, with every latency of that
+  group as a value array. CloudWatch builds percentiles from the values.
+  Dimension sets: ``[Route]``, ``[Route, StatusClass]`` and ``[Start]``.
+- With consumed capacity recorded, one document per route and DynamoDB
+  operation, with dimensions ``[Route, Operation]`` and ``[Operation]``.
+- One document for the invocation, with dimension ``[Start]``. It holds
+  time spent per dependency (from ``Timings``) and the sandbox's counters
+  (cache hits, retries, breaker changes).
+
+``Route`` is the method and route template (``GET /songs/{song_id}``),
+never the raw path, so the number of metric streams stays bounded.
+``Start`` is ``cold`` for the first invocation of a sandbox and
+``warm`` after that.
+
+The handler makes the collector current with ``recording``; ``record``
+adds to it from any thread that copied the context.
+"""
+
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from .capacity import ConsumedCapacity
+from .timing import Timings
+
+NAMESPACE = 'OurChants/Api'
+# EMF accepts at most 100 values per metric
+MAX_VALUES = 100
+
+STATIC_ROUTES = frozenset({
+    '/songs', '/songs/random', '/songs/changes', '/search', '/artists', '/presigned-url', '/batch',
+})
+PARAMETER_ROUTES = (
+    ('/songs/', '/songs/{song_id}'),
+    ('/artists/', '/artists/{artist}'),
+    ('/albums/', '/albums/{album}'),
+)
+METHODS = frozenset({'GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'})
+
+_invocation: ContextVar[Optional['InvocationMetrics']] = ContextVar('invocation', default=None)
+
+# Timings spans reported per invocation, and the prefix of their metric names
+SPAN_METRICS = {
+    'dynamodb': 'DynamoDB',
+    'sqlite': 'SQLite',
+    's3': 'S3',
+    'dump': 'Dump',
+    'json': 'Json',
+}
+
+def route_template(method: Optional[str], path: Optional[str]) -> str:
+    """Return ``"<METHOD> <template>"`` for a request, with IDs replaced by placeholders."""
+    method = method if method in METHODS else 'OTHER'
+    if path in STATIC_ROUTES:
+        return f'{method} {path}'
+    for prefix, template in PARAMETER_ROUTES:
+        if path and path.startswith(prefix):
+            return f'{method} {template}'
+    return f'{method} other'
+
+def status_class(status: int) -> str:
+    """Return ``2xx``, ``4xx`` or ``5xx`` for a status code."""
+    return f'{status // 100}xx'
+
+class InvocationMetrics:
+    """Latencies and statuses of the requests one invocation served."""
+
+    def __init__(self, cold: bool, namespace: str = NAMESPACE):
+        """Initialize an empty collector.
+
+        Args:
+            cold: Whether this is the sandbox's first invocation
+            namespace: CloudWatch namespace of the metrics
+        """
+        self.cold = cold
+        self.namespace = namespace
+        self._groups: Dict[Tuple[str, str], List[float]] = {}
+        # Read and write units per route and status class, and [units, calls] per route and operation
+        self._units: Dict[Tuple[str, str], List[float]] = {}
+        self._operations: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: Optional[str], path: Optional[str], status: int, ms: float,
+               capacity: Optional[ConsumedCapacity] = None) -> None:
+        """Record one served request (thread-safe, for batch sub-requests)."""
+        route = route_template(method, path)
+        key = (route, status_class(status))
+        with self._lock:
+            self._groups.setdefault(key, []).append(round(ms, 1))
+            if capacity is None:
+                return
+            units = self._units.setdefault(key, [0.0, 0.0])
+            units[0] += capacity.read_units()
+            units[1] += capacity.write_units()
+            for operation, stats in capacity.operations().items():
+                totals = self._operations.setdefault((route, operation), [0.0, 0])
+                totals[0] += stats['units']
+                totals[1] += stats['calls']
+
+    def _document(self, dimensions: List[List[str]], metrics: Dict[str, Tuple[Any, str]],
+                  properties: Dict[str, Any], timestamp_ms: int) -> Dict[str, Any]:
+        document = {
+            '_aws': {
+                'Timestamp': timestamp_ms,
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': dimensions,
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()],
+                }],
+            },
+            'Start': 'cold' if self.cold else 'warm',
+        }
+        document.update(properties)
+        document.update({name: value for name, (value, _) in metrics.items()})
+        return document
+
+    def documents(self, timings: Optional[Timings] = None, counters: Optional[Dict[str, int]] = None,
+                  timestamp_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Render the invocation as EMF documents, one per log line.
+
+        Args:
+            timings: Spans of the invocation, for dependency latencies (optional)
+            counters: Counters flushed from ``Metrics`` (optional)
+            timestamp_ms: Metric timestamp (defaults to now)
+        """
+        timestamp_ms = timestamp_ms if timestamp_ms is not None else int(time.time() * 1000)
+        documents = []
+        with self._lock:
+            groups = sorted(self._groups.items())
+            units = dict(self._units)
+            operations = sorted(self._operations.items())
+        for (route, status), latencies in groups:
+            errors = len(latencies) if status == '5xx' else 0
+            metrics = {
+                'Latency': (latencies[:MAX_VALUES], 'Milliseconds'),
+                'Requests': (len(latencies), 'Count'),
+                'Errors': (errors, 'Count'),
+            }
+            if (route, status) in units:
+                read, write = units[route, status]
+                metrics['ReadCapacityUnits'] = (round(read, 2), 'Count')
+                metrics['WriteCapacityUnits'] = (round(write, 2), 'Count')
+            documents.append(self._document(
+                [['Route'], ['Route', 'StatusClass'], ['Start']],
+                metrics,
+                {'Route': route, 'StatusClass': status},
+                timestamp_ms,
+            ))
+        for (route, operation), (capacity_units, calls) in operations:
+            documents.append(self._document(
+                [['Route', 'Operation'], ['Operation']],
+                {'CapacityUnits': (round(capacity_units, 2), 'Count'), 'Operations': (calls, 'Count')},
+                {'Route': route, 'Operation': operation},
+                timestamp_ms,
+            ))
+        metrics = {'Invocations': (1, 'Count')}
+        for span, stats in (timings.spans() if timings is not None else {}).items():
+            if span in SPAN_METRICS:
+                metrics[f'{SPAN_METRICS[span]}Latency'] = (stats['ms'], 'Milliseconds')
+                metrics[f'{SPAN_METRICS[span]}Calls'] = (stats['count'], 'Count')
+        for name, value in sorted((counters or {}).items()):
+            metrics[name] = (value, 'Count')
+        documents.append(self._document([['Start']], metrics, {}, timestamp_ms))
+        return documents
+
+@contextlib.contextmanager
+def recording(invocation: Optional[InvocationMetrics]):
+    """Make ``invocation`` the collector of ``record`` calls in this context (None records nothing)."""
+    token = _invocation.set(invocation)
+    try:
+        yield
+    finally:
+        _invocation.reset(token)
+
+def record(method: Optional[str], path: Optional[str], status: int, ms: float,
+           capacity: Optional[ConsumedCapacity] = None) -> None:
+    """Record a served request in the current invocation's metrics, if there are any."""
+    invocation = _invocation.get()
+    if invocation is not None:
+        invocation.record(method, path, status, ms, capacity)
@@ -0,0 +1,205 @@
+"""
+Write-time derived keys for the Songs API.
+
+Sortable values are normalized when a song is written, so listings can
+be served in order straight from a DynamoDB index instead of being
+sorted in memory (or, worse, in the browser):
+
+- ``title_key``: collation-folded title with digit runs zero-padded
+- ``date_added_ts``: epoch seconds the song was added to the catalog
+- ``bpm_value``: numeric BPM, ``0`` when unknown
+
+Every song also carries a constant ``listing`` attribute, the partition
+key shared by the sort indexes. Range filters on BPM and duration are
+served by the same ``bpm-index`` and by a sparse ``duration-index`` on
+the numeric ``duration_s`` field.
+"""
+
+import re
+import time
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Optional, Tuple
+from .search import normalize_text
+
+LISTING_ATTR = 'listing'
+LISTING_VALUE = 'song'
+
+# sort field -> (index name, index sort key)
+SORT_INDEXES = {
+    'title': ('title-index', 'title_key'),
+    'date_added': ('date-added-index', 'date_added_ts'),
+    'bpm': ('bpm-index', 'bpm_value'),
+}
+
+DERIVED_ATTRIBUTES = (LISTING_ATTR, 'title_key', 'date_added_ts', 'bpm_value')
+
+# Range filters: query parameter -> (field, bound)
+RANGE_FILTERS = {
+    'bpm_min': ('bpm', 'min'),
+    'bpm_max': ('bpm', 'max'),
+    'duration_min': ('duration', 'min'),
+    'duration_max': ('duration', 'max'),
+}
+DURATION_INDEX = ('duration-index', 'duration_s')
+
+# bpm_value 0 means "unknown", so BPM ranges start just above it
+MIN_KNOWN_BPM = Decimal('0.01')
+MAX_BPM = Decimal(10000)
+MAX_DURATION = Decimal(10 ** 9)
+
+_DIGITS = re.compile(r'\d+')
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+_DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%Y')
+
+def collation_key(title: Optional[str]) -> str:
+    """Fold a title for sorting so "10 Icaros" sorts after "9 Icaros"."""
+    folded = normalize_text(title)
+    return _DIGITS.sub(lambda match: match.group().zfill(8), folded)[:512]
+
+def parse_bpm(bpm: Any) -> Decimal:
+    """Parse a free-form BPM string ("120", "96.5 bpm") into a number, 0 if unknown."""
+    if bpm is None:
+        return Decimal(0)
+    match = _NUMBER.search(str(bpm))
+    if not match:
+        return Decimal(0)
+    try:
+        value = Decimal(match.group()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return Decimal(0)
+    return value.to_integral_value() if value == value.to_integral_value() else value.normalize()
+
+def parse_duration(value: Any) -> Optional[int]:
+    """Parse a duration ("245", "245.7", "4:05", "1:02:03") into whole seconds, None if unknown."""
+    if value is None or value == '':
+        return None
+    text = str(value).strip()
+    try:
+        if ':' in text:
+            seconds = 0.0
+            for part in text.split(':'):
+                seconds = seconds * 60 + float(part)
+        else:
+            seconds = float(text)
+    except ValueError:
+        return None
+    if seconds < 0 or seconds != seconds or seconds == float('inf'):
+        return None
+    return int(round(seconds))
+
+def parse_timestamp(value: Any) -> int:
+    """Parse a free-form date string (read as UTC) into epoch seconds, 0 if unknown."""
+    if not value:
+        return 0
+    text = str(value).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return int(datetime.strptime(text, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            continue
+    return 0
+
+def sort_keys(song: Dict[str, Any], partial: bool = False) -> Dict[str, Any]:
+    """Compute the derived sort attributes for a song.
+
+    Args:
+        song: Validated song data
+        partial: Only derive keys for fields present in ``song`` (updates)
+
+    Returns:
+        Dict of derived attributes to store alongside the song
+    """
+    keys: Dict[str, Any] = {LISTING_ATTR: LISTING_VALUE}
+    if 'title' in song:
+        keys['title_key'] = collation_key(song['title'])
+    if 'bpm' in song or not partial:
+        keys['bpm_value'] = parse_bpm(song.get('bpm'))
+    return keys
+
+def date_added(song: Dict[str, Any], now: Optional[float] = None) -> int:
+    """Return the date-added timestamp for a song.
+
+    New songs are stamped with the current time; existing rows fall back to
+    the uploader's ``date_added`` or the file ``date`` when backfilling.
+    """
+    if now is not None:
+        return int(now)
+    return parse_timestamp(song.get('date_added')) or parse_timestamp(song.get('date'))
+
+def parse_sort(sort: str) -> Tuple[str, str, bool]:
+    """Parse a ``sort`` query parameter such as ``-date_added``.
+
+    Returns:
+        (index name, index sort key, ascending)
+
+    Raises:
+        ValueError: If the field is not sortable
+    """
+    ascending = not sort.startswith('-')
+    field = sort.lstrip('-+')
+    if field not in SORT_INDEXES:
+        raise ValueError(f"sort must be one of: {', '.join(sorted(SORT_INDEXES))}, optionally prefixed with '-'")
+    index_name, key = SORT_INDEXES[field]
+    return index_name, key, ascending
+
+def parse_range_filters(params: Dict[str, Any]) -> Dict[str, Decimal]:
+    """Parse ``bpm_min``/``bpm_max``/``duration_min``/``duration_max`` query parameters.
+
+    Raises:
+        ValueError: If a bound is not a non-negative number or min exceeds max
+    """
+    filters: Dict[str, Decimal] = {}
+    for name in RANGE_FILTERS:
+        value = params.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            number = Decimal(str(value))
+        except InvalidOperation:
+            raise ValueError(f"{name} must be a number")
+        if not number.is_finite() or number < 0:
+            raise ValueError(f"{name} must be a non-negative number")
+        filters[name] = number
+    for field in ('bpm', 'duration'):
+        low, high = filters.get(f'{field}_min'), filters.get(f'{field}_max')
+        if low is not None and high is not None and low > high:
+            raise ValueError(f"{field}_min must not exceed {field}_max")
+    return filters
+
+def range_index(filters: Dict[str, Decimal], sort: Optional[str] = None) -> Tuple[str, str, bool]:
+    """Pick the index that serves a set of range filters.
+
+    BPM ranges use ``bpm-index`` (and may be sorted by ``bpm``/``-bpm``);
+    duration-only ranges use ``duration-index``, shortest first.
+
+    Returns:
+        (index name, index sort key, ascending)
+
+    Raises:
+        ValueError: If the requested sort cannot be served by that index
+    """
+    if any(RANGE_FILTERS[name][0] == 'bpm' for name in filters):
+        index_name, key = SORT_INDEXES['bpm']
+        ascending = True
+        if sort:
+            sort_index, _, ascending = parse_sort(sort)
+            if sort_index != index_name:
+                raise ValueError("BPM filters can only be sorted by bpm")
+        return index_name, key, ascending
+    if sort:
+        raise ValueError("duration filters cannot be combined with sort")
+    index_name, key = DURATION_INDEX
+    return index_name, key, True
+
+def range_bounds(filters: Dict[str, Decimal]) -> Tuple[Tuple[Decimal, Decimal], Tuple[Decimal, Decimal]]:
+    """Return the inclusive (low, high) BPM and duration bounds of a set of range filters."""
+    bpm_range = (max(filters.get('bpm_min', MIN_KNOWN_BPM), MIN_KNOWN_BPM), filters.get('bpm_max', MAX_BPM))
+    duration_range = (filters.get('duration_min', 0), filters.get('duration_max', MAX_DURATION))
+    return bpm_range, duration_range
+
+def new_song_keys(song: Dict[str, Any]) -> Dict[str, Any]:
+    """Return all derived attributes for a song being created now."""
+    keys = sort_keys(song)
+    keys['date_added_ts'] = date_added(song, now=time.time())
+    return keys
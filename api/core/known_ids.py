@@ -0,0 +1,212 @@
+"""
+Definite misses for unknown song IDs, without a read.
+
+Crawlers and stale links ask for song IDs that do not exist, and each
+of them used to cost a GetItem. ``KnownSongIds`` answers most of them
+from memory. It keeps two structures:
+
+- A Bloom filter of every song ID. The filter is built from a snapshot
+  of the catalog and tagged with the change feed position it covers.
+  Songs created in this sandbox are added straight away. Songs created
+  elsewhere are read from ``changes-index`` before a miss is trusted,
+  at most once every ``max_staleness`` seconds.
+- A cache of recent misses that expire after ``negative_ttl`` seconds.
+
+A Bloom filter has no false negatives, so an ID it rejects does not
+exist. Requests share the filter from several threads, so bits are set
+under a lock (a lost bit would be a false negative), and a rebuild
+replays the IDs added while its snapshot was being read. A false positive, at a rate of about ``fp_rate``, only costs the
+read it would have cost anyway. Deleted songs stay in the filter until
+the next rebuild.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional
+from boto3.dynamodb.conditions import Key
+from .changes import CHANGES_INDEX, ChangeFeed, SyncTokenExpired, decode_token, encode_token
+from .keys import LISTING_ATTR, LISTING_VALUE
+from .metrics import Metrics
+
+# Room for songs created after the snapshot before the filter is rebuilt
+MIN_CAPACITY = 1024
+GROWTH = 2
+
+class BloomFilter:
+    """A fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity: int, fp_rate: float = 0.01):
+        """Size the filter for ``capacity`` items at a false-positive rate of ``fp_rate``."""
+        if not 0 < fp_rate < 1:
+            raise ValueError("fp_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, value: str):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, value: str) -> None:
+        """Add a value."""
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    @property
+    def size_bytes(self) -> int:
+        """Memory held by the bit array."""
+        return len(self._bits)
+
+class KnownSongIds:
+    """Bloom filter of song IDs plus a negative cache of recent misses."""
+
+    def __init__(self, fp_rate: float = 0.01, negative_ttl: float = 30, max_staleness: float = 1,
+                 max_misses: int = 10000, metrics: Optional[Metrics] = None):
+        """Initialize an empty filter; ``sync`` builds it on first use.
+
+        Args:
+            fp_rate: Target false-positive rate of the Bloom filter
+            negative_ttl: Seconds a recorded miss is answered from memory
+            max_staleness: Seconds between catch-ups with the change feed
+            max_misses: Most recent misses kept
+            metrics: Counters for filter and cache hits (optional)
+        """
+        self.fp_rate = fp_rate
+        self.negative_ttl = negative_ttl
+        self.max_staleness = max_staleness
+        self.max_misses = max_misses
+        self.metrics = metrics or Metrics()
+        self._bloom: Optional[BloomFilter] = None
+        self._token: Optional[str] = None
+        self._synced_at: Optional[float] = None
+        self._reload_after: Optional[float] = None
+        self._misses: 'OrderedDict[str, float]' = OrderedDict()
+        self._rebuilds: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def trusted(self) -> bool:
+        """Whether a song the filter rejects can be reported missing."""
+        return self._bloom is not None and self._reload_after is None
+
+    def sync(self, songs_table, feed: ChangeFeed, snapshot: Callable[[], Iterable[str]],
+             now: Optional[float] = None) -> None:
+        """Bring the filter up to date if it has not been for ``max_staleness`` seconds.
+
+        Args:
+            songs_table: Songs table with ``changes-index``
+            feed: Change feed of the songs table
+            snapshot: Returns every song ID, for (re)building the filter
+            now: Current time (defaults to the clock)
+        """
+        now = now if now is not None else time.time()
+        if self._synced_at is not None and now - self._synced_at < self.max_staleness:
+            return
+        if self._bloom is None or self._bloom.count > self._bloom.capacity or (
+                self._reload_after is not None and now >= self._reload_after):
+            self._rebuild(feed, snapshot, now)
+        else:
+            try:
+                self._catch_up(songs_table, feed, now)
+            except SyncTokenExpired:
+                self._rebuild(feed, snapshot, now)
+        self._synced_at = now
+
+    def _rebuild(self, feed: ChangeFeed, snapshot: Callable[[], Iterable[str]], now: float) -> None:
+        # Read the position first: the snapshot then covers at least that much
+        added: List[str] = []
+        with self._lock:
+            self._rebuilds.append(added)
+        try:
+            seq, allocated_at = feed.current_sequence()
+            song_ids = list(snapshot())
+        finally:
+            with self._lock:
+                self._rebuilds.remove(added)
+        bloom = BloomFilter(max(GROWTH * len(song_ids), MIN_CAPACITY), self.fp_rate)
+        for song_id in song_ids:
+            bloom.add(song_id)
+        with self._lock:
+            for song_id in added:
+                bloom.add(song_id)
+            self._bloom = bloom
+        self._token = encode_token(seq, now)
+        # A write allocated just before the snapshot may have committed after it
+        settled_at = allocated_at + feed.settle_seconds
+        self._reload_after = settled_at if settled_at > now else None
+        self.metrics.increment('known_ids.rebuild')
+
+    def _catch_up(self, songs_table, feed: ChangeFeed, now: float) -> None:
+        # Settled changes move the token on; the unsettled tail is re-read next time
+        while True:
+            page = feed.changes(songs_table, self._token, limit=1000, now=now)
+            for kind, item in page['changes']:
+                if kind == 'upserted':
+                    self.add(item['song_id'])
+            self._token = page['next_token']
+            if not page['has_more']:
+                break
+        index_name, key = CHANGES_INDEX
+        query = {
+            'IndexName': index_name,
+            'KeyConditionExpression': Key(LISTING_ATTR).eq(LISTING_VALUE) & Key(key).gt(decode_token(self._token)[0]),
+            'ProjectionExpression': 'song_id',
+        }
+        while True:
+            response = songs_table.query(**query)
+            for item in response.get('Items', []):
+                self.add(item['song_id'])
+            if 'LastEvaluatedKey' not in response:
+                return
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def might_exist(self, song_id: str, now: Optional[float] = None) -> bool:
+        """Return False only if ``song_id`` is known not to exist."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            expires_at = self._misses.get(song_id)
+            if expires_at is not None and expires_at <= now:
+                del self._misses[song_id]
+                expires_at = None
+        if expires_at is not None:
+            self.metrics.increment('known_ids.negative_cache_hit')
+            return False
+        if self.trusted and song_id not in self._bloom:
+            self.metrics.increment('known_ids.bloom_reject')
+            return False
+        self.metrics.increment('known_ids.lookup')
+        return True
+
+    def record_miss(self, song_id: str, now: Optional[float] = None) -> None:
+        """Remember that a read found no song with this ID."""
+        if self.trusted and song_id in self._bloom:
+            self.metrics.increment('known_ids.false_positive')
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._misses[song_id] = now + self.negative_ttl
+            self._misses.move_to_end(song_id)
+            while len(self._misses) > self.max_misses:
+                self._misses.popitem(last=False)
+
+    def add(self, song_id: str) -> None:
+        """Record a created song."""
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(song_id)
+            for added in self._rebuilds:
+                added.append(song_id)
+            self._misses.pop(song_id, None)
@@ -0,0 +1,109 @@
+"""
+Lineage fan-out index.
+
+``lineage`` is a list attribute, which DynamoDB cannot index, so every
+song also gets one item per lineage in the index table:
+
+- ``pk = LINEAGE#<slug>``, ``sk = <song_id>``, ``lineage = <name>``
+
+Entries are added and removed in the same transaction as the song write.
+Browsing a tradition is then a Query on one partition followed by a
+``BatchGetItem`` on the songs table. ``rebuild`` recomputes the entries
+from a full scan, for backfills and drift repair.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from boto3.dynamodb.conditions import Key
+from .aggregates import slugify
+from .batch import batch_get
+from .transactions import WriteTransaction
+
+LINEAGE_PREFIX = 'LINEAGE#'
+
+def lineage_pk(name: str) -> str:
+    """Return the index partition for a lineage name or slug."""
+    return f'{LINEAGE_PREFIX}{slugify(name)}'
+
+def lineage_entries(song: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Return a song's lineages as ``{partition: display name}``."""
+    if not song:
+        return {}
+    return {lineage_pk(name): name for name in song.get('lineage') or [] if name}
+
+class LineageIndex:
+    """Maintains and queries lineage entries in the index table."""
+
+    def __init__(self, index_table):
+        """Initialize with the index table."""
+        self.index_table = index_table
+
+    def add_to(self, transaction: WriteTransaction, song_id: str,
+               old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> WriteTransaction:
+        """Add the entry puts and deletes for a song moving from ``old`` to ``new``."""
+        before, after = lineage_entries(old), lineage_entries(new)
+        for pk in sorted(after.keys() - before.keys()):
+            transaction.put(self.index_table, {'pk': pk, 'sk': song_id, 'lineage': after[pk]})
+        for pk in sorted(before.keys() - after.keys()):
+            transaction.delete(self.index_table, {'pk': pk, 'sk': song_id})
+        return transaction
+
+    def page(self, songs_table, lineage: str, limit: int = 20,
+             start_key: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return one page of a lineage's songs and the key to resume from.
+
+        Args:
+            songs_table: Songs table to fetch the full items from
+            lineage: Lineage name or slug
+            limit: Page size
+            start_key: LastEvaluatedKey of the previous page
+
+        Returns:
+            (songs ordered by song_id, LastEvaluatedKey or None)
+        """
+        query: Dict[str, Any] = {
+            'KeyConditionExpression': Key('pk').eq(lineage_pk(lineage)),
+            'Limit': limit,
+        }
+        if start_key:
+            query['ExclusiveStartKey'] = start_key
+        response = self.index_table.query(**query)
+        keys = [{'song_id': entry['sk']} for entry in response.get('Items', [])]
+        return batch_get(songs_table, keys), response.get('LastEvaluatedKey')
+
+    def rebuild(self, songs: Iterable[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+        """Recompute every lineage entry from the catalog and fix drift.
+
+        Args:
+            songs: Every song in the catalog (e.g. from ``parallel_scan``)
+            dry_run: Only report drift, do not write
+
+        Returns:
+            Report with the number of entries checked and the number
+            missing and orphaned
+        """
+        expected: Dict[Tuple[str, str], str] = {}
+        for song in songs:
+            for pk, name in lineage_entries(song).items():
+                expected[(pk, song['song_id'])] = name
+
+        stored = set()
+        scan_kwargs: Dict[str, Any] = {'ProjectionExpression': 'pk, sk'}
+        while True:
+            response = self.index_table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                if item['pk'].startswith(LINEAGE_PREFIX):
+                    stored.add((item['pk'], item['sk']))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        missing = sorted(expected.keys() - stored)
+        orphaned = sorted(stored - expected.keys())
+        if not dry_run:
+            with self.index_table.batch_writer() as batch:
+                for pk, song_id in missing:
+                    batch.put_item(Item={'pk': pk, 'sk': song_id, 'lineage': expected[(pk, song_id)]})
+                for pk, song_id in orphaned:
+                    batch.delete_item(Key={'pk': pk, 'sk': song_id})
+
+        return {'checked': len(expected), 'missing': len(missing), 'orphaned': len(orphaned)}
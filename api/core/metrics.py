@@ -0,0 +1,33 @@
+"""
+In-process metric counters.
+
+A ``Metrics`` instance lives at module level in ``app.py`` so warm
+invocations share it. Components increment named counters as they go and
+the handler logs whatever accumulated at the end of each invocation.
+"""
+
+import threading
+from typing import Dict
+
+class Metrics:
+    """Thread-safe named counters."""
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Add ``value`` to a counter."""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return the current counts."""
+        with self._lock:
+            return dict(self._counts)
+
+    def flush(self) -> Dict[str, int]:
+        """Return the current counts and reset them."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
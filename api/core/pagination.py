@@ -0,0 +1,42 @@
+"""
+Cursor pagination for the Songs API.
+
+Cursors are opaque to clients: they wrap DynamoDB's ``LastEvaluatedKey``
+in URL-safe base64 so a page can be resumed from any index.
+"""
+
+import base64
+import binascii
+import json
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+def encode_cursor(last_evaluated_key: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Encode a LastEvaluatedKey as an opaque cursor (None when there are no more pages)."""
+    if not last_evaluated_key:
+        return None
+    tagged = {
+        name: {'N': str(value)} if isinstance(value, Decimal) else {'S': value}
+        for name, value in last_evaluated_key.items()
+    }
+    raw = json.dumps(tagged, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor back into an ExclusiveStartKey.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        tagged = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        key = {}
+        for name, value in tagged.items():
+            if 'N' in value:
+                key[name] = Decimal(value['N'])
+            else:
+                key[name] = str(value['S'])
+        return key
+    except (binascii.Error, UnicodeError, ValueError, TypeError, AttributeError, KeyError) as e:
+        raise ValueError("cursor is not valid") from e
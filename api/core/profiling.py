@@ -0,0 +1,160 @@
+"""
+Opt-in profiling of single requests.
+
+``profiled`` wraps the Lambda handler. The handler is only wrapped when
+``PROFILING`` is set, so a disabled profiler costs nothing. A wrapped
+handler profiles a request only when all of these hold:
+
+- the request sends the secret in an ``X-Profile-Token`` header
+- it is picked at ``sample_rate``
+
+A profiled request runs under two profilers:
+
+- ``cProfile``, which writes a ``.pstats`` file with exact call counts
+  for the handler thread.
+- ``StackSampler``, which reads every thread's stack at a fixed interval
+  and writes collapsed stacks (``a;b;c <count>``), the input format of
+  flamegraph tools. It covers the handler thread and every thread
+  started during the request, such as batch workers and scan segments.
+
+Both profiles go to ``/tmp`` or an ``s3://bucket/prefix``. The response
+names them in an ``X-Profile`` header. ``scripts/flamegraph.py`` merges
+collapsed stacks and renders them.
+"""
+
+import cProfile
+import functools
+import hmac
+import logging
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'x-profile-token'
+SAMPLE_INTERVAL_SECONDS = 0.002
+
+def frame_label(code) -> str:
+    """Label of a stack frame: ``function (file.py:line)``."""
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+class StackSampler:
+    """Samples the stacks of the current thread and threads started after ``start``."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ignored: set = set()
+
+    def start(self) -> None:
+        """Start sampling in a background thread."""
+        current = threading.get_ident()
+        # Threads already running (other than the caller) belong to someone else
+        self._ignored = {thread.ident for thread in threading.enumerate()} - {current}
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        self._ignored.add(self._thread.ident)
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident in self._ignored:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Return the samples as collapsed stacks, one ``stack count`` per line."""
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.samples.items()))
+
+class ProfileWriter:
+    """Writes profiles to a local directory or an ``s3://bucket/prefix``."""
+
+    def __init__(self, output: str, s3_client=None):
+        self.output = output
+        self._s3_client = s3_client
+
+    def write(self, name: str, data: bytes) -> str:
+        """Store one file and return where it went."""
+        if self.output.startswith('s3://'):
+            bucket, _, prefix = self.output[len('s3://'):].partition('/')
+            key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+            if self._s3_client is None:
+                import boto3
+                self._s3_client = boto3.client('s3')
+            self._s3_client.put_object(Bucket=bucket, Key=key, Body=data)
+            return f's3://{bucket}/{key}'
+        os.makedirs(self.output, exist_ok=True)
+        path = os.path.join(self.output, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+def should_profile(event: dict, secret: str, sample_rate: float) -> bool:
+    """Whether a request carries the secret and is picked for profiling."""
+    token = (event.get('headers') or {}).get(TOKEN_HEADER)
+    if not token or not hmac.compare_digest(token.encode(), secret.encode()):
+        return False
+    return random.random() < sample_rate
+
+def profile_name(event: dict, context) -> str:
+    """File name stem for a profiled request: time, method, path and request ID."""
+    http = (event.get('requestContext') or {}).get('http', {})
+    route = re.sub(r'[^A-Za-z0-9]+', '_', f"{http.get('method', '')}{http.get('path', '')}").strip('_')
+    request_id = getattr(context, 'aws_request_id', None) or f'{random.getrandbits(32):08x}'
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{route}-{request_id}"
+
+def profiled(handler: Callable, secret: str, writer: ProfileWriter, sample_rate: float = 1.0,
+             interval: float = SAMPLE_INTERVAL_SECONDS) -> Callable:
+    """Wrap a Lambda handler so that requests with the secret token are profiled.
+
+    Args:
+        handler: The Lambda handler
+        secret: Value the ``X-Profile-Token`` header must carry
+        writer: Where profiles are stored
+        sample_rate: Fraction of requests with the token that are profiled
+        interval: Seconds between stack samples
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not should_profile(event, secret, sample_rate):
+            return handler(event, context)
+        profile, sampler = cProfile.Profile(), StackSampler(interval)
+        sampler.start()
+        profile.enable()
+        try:
+            response = handler(event, context)
+        finally:
+            profile.disable()
+            sampler.stop()
+        name = profile_name(event, context)
+        locations: Dict[str, str] = {}
+        try:
+            # What Profile.dump_stats writes, without needing a local file
+            profile.create_stats()
+            locations['pstats'] = writer.write(f'{name}.pstats', marshal.dumps(profile.stats))
+            locations['collapsed'] = writer.write(f'{name}.collapsed', sampler.collapsed().encode())
+        except Exception as e:
+            logger.error(f"Failed to store profile {name}: {str(e)}")
+        if locations and isinstance(response, dict):
+            response.setdefault('headers', {})['X-Profile'] = ', '.join(locations.values())
+        logger.info(f"Profiled request stored: {locations}")
+        return response
+    return wrapper
@@ -0,0 +1,244 @@
+"""
+Retries, circuit breakers and load shedding for AWS calls.
+
+Every DynamoDB and S3 call goes through hooks that ``Resilience.attach``
+registers on the botocore client. These hooks replace botocore's own
+retries:
+
+- Throttling, 5xx responses and connection errors are retried with
+  full-jitter exponential backoff. A retry is only made if the backoff
+  and another attempt still fit in the request's deadline.
+- Each dependency has one ``CircuitBreaker``, shared by every client of
+  the sandbox. A call that still fails after its retries counts against
+  the breaker. After ``failure_threshold`` such calls in a row the
+  breaker opens, and calls are refused without a request until
+  ``reset_timeout`` has passed. One probe call then decides whether it
+  closes again.
+- A refused call, or one that is still throttled after its retries,
+  raises ``DependencyUnavailable``. It carries the number of seconds
+  until a retry can succeed, which the handler returns as 503 with
+  ``Retry-After``.
+
+The request's deadline is read from a context variable, which the
+handler sets with ``budget``. Thread pools copy the context into their
+workers.
+"""
+
+import contextlib
+import math
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+from .deadline import Deadline
+from .metrics import Metrics
+
+# Error codes meaning the dependency is shedding load rather than rejecting the request
+SATURATION_CODES = frozenset({
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException',
+    'Throttling',
+    'TooManyRequestsException',
+    'SlowDown',
+    'ServiceUnavailable',
+    'InternalServerError',
+    'InternalError',
+})
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar('deadline', default=None)
+
+class DependencyUnavailable(Exception):
+    """Raised when a dependency refuses calls or stays throttled after retries."""
+
+    def __init__(self, dependency: str, retry_after: float, reason: str):
+        super().__init__(f"{dependency} unavailable: {reason}")
+        self.dependency = dependency
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        """``Retry-After`` value: whole seconds, at least one."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+@contextlib.contextmanager
+def budget(deadline: Optional[Deadline]):
+    """Make ``deadline`` the time budget of AWS calls in this context."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def is_saturated(status_code: int, error_code: Optional[str]) -> bool:
+    """Whether a response means the dependency is overloaded or failing."""
+    return status_code >= 500 or status_code == 429 or error_code in SATURATION_CODES
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one dependency."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10,
+                 metrics: Optional[Metrics] = None, clock: Callable[[], float] = time.monotonic):
+        """Initialize a closed breaker.
+
+        Args:
+            name: Dependency name, used in errors and metric names
+            failure_threshold: Failed calls in a row that open the breaker
+            reset_timeout: Seconds the breaker stays open before a probe call
+            metrics: Counters for state changes and refused calls (optional)
+            clock: Monotonic clock (for tests)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics or Metrics()
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a call through again (0 when closed)."""
+        if self.state == self.CLOSED:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def before_call(self) -> None:
+        """Let a call through, or raise ``DependencyUnavailable`` while open.
+
+        Once ``reset_timeout`` has passed, one call is let through as a
+        probe; others are refused until it finishes.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and self.clock() >= self._opened_at + self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            retry_after = self.retry_after() or self.reset_timeout
+        self.metrics.increment(f'{self.name}.rejected')
+        raise DependencyUnavailable(self.name, retry_after, f"circuit {self.state}")
+
+    def record_success(self) -> None:
+        """Record a call the dependency answered."""
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """Record a call that failed after its retries."""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self._opened_at = self.clock()
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        self.metrics.increment(f'{self.name}.breaker_{state}')
+
+class Resilience:
+    """Retry policy and circuit breakers for the sandbox's AWS clients."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.05, max_delay: float = 1.0,
+                 min_attempt_seconds: float = 0.1, failure_threshold: int = 5,
+                 reset_timeout: float = 10, metrics: Optional[Metrics] = None):
+        """Initialize with no breakers; ``attach`` creates one per dependency.
+
+        Args:
+            max_attempts: Attempts per call, including the first
+            base_delay: Backoff cap before the first retry, doubled for each further retry
+            max_delay: Largest backoff cap
+            min_attempt_seconds: Time a retry needs after its backoff to be worth making
+            failure_threshold: Failed calls in a row that open a breaker
+            reset_timeout: Seconds a breaker stays open
+            metrics: Counters for retries and breakers (optional)
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt_seconds = min_attempt_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics or Metrics()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, dependency: str) -> CircuitBreaker:
+        """Return the breaker of a dependency, creating it on first use."""
+        with self._lock:
+            if dependency not in self.breakers:
+                self.breakers[dependency] = CircuitBreaker(
+                    dependency, self.failure_threshold, self.reset_timeout, self.metrics)
+            return self.breakers[dependency]
+
+    def states(self) -> Dict[str, str]:
+        """Return the state of every breaker that is not closed."""
+        return {name: breaker.state for name, breaker in self.breakers.items()
+                if breaker.state != CircuitBreaker.CLOSED}
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter backoff before retry number ``attempt`` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def attach(self, client, dependency: str):
+        """Route a botocore client's calls through the dependency's breaker and this retry policy.
+
+        The policy replaces the client's configured retries. Returns the client.
+        """
+        breaker = self.breaker(dependency)
+        service = client.meta.service_model.service_id.hyphenize()
+        events = client.meta.events
+
+        def before_call(**kwargs):
+            breaker.before_call()
+
+        def needs_retry(response, attempts, caught_exception, **kwargs):
+            # False, not None: botocore's own retry handlers are not consulted
+            if response is not None:
+                http_response, parsed = response
+                if not is_saturated(http_response.status_code, parsed.get('Error', {}).get('Code')):
+                    return False
+            elif caught_exception is None:
+                return False
+            if attempts >= self.max_attempts:
+                return False
+            delay = self.backoff(attempts)
+            deadline = _deadline.get()
+            if deadline is not None and deadline.remaining() < delay + self.min_attempt_seconds:
+                self.metrics.increment(f'{dependency}.retry_skipped')
+                return False
+            self.metrics.increment(f'{dependency}.retry')
+            return delay
+
+        def after_call(http_response, parsed, **kwargs):
+            error_code = parsed.get('Error', {}).get('Code')
+            if not is_saturated(http_response.status_code, error_code):
+                breaker.record_success()
+                return
+            breaker.record_failure()
+            # Saturated after retries: retry once the breaker or the backoff allows
+            retry_after = breaker.retry_after() or self.max_delay
+            raise DependencyUnavailable(dependency, retry_after, error_code or str(http_response.status_code))
+
+        def after_call_error(**kwargs):
+            breaker.record_failure()
+
+        # First, so that these run before botocore's own handlers
+        events.register_first(f'before-call.{service}', before_call)
+        events.register_first(f'needs-retry.{service}', needs_retry)
+        events.register(f'after-call.{service}', after_call)
+        events.register(f'after-call-error.{service}', after_call_error)
+        return client
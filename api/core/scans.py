@@ -0,0 +1,52 @@
+"""
+Full-table scans for maintenance jobs and in-memory snapshots.
+
+Request handlers never read every item to answer a request; these exist
+for repair, reconciliation and backfill jobs, and for building the
+sandbox-wide snapshots (in-memory catalog, song ID filter).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Dict, Iterator, List, Optional
+from .deadline import Deadline, check
+
+def scan_segment(table, segment: int, total_segments: int, deadline: Optional[Deadline] = None,
+                 **kwargs) -> List[Dict[str, Any]]:
+    """Read every item of one parallel-scan segment.
+
+    Raises:
+        DeadlineExceeded: If the deadline passes between pages
+    """
+    items: List[Dict[str, Any]] = []
+    kwargs.update(Segment=segment, TotalSegments=total_segments)
+    while True:
+        check(deadline)
+        response = table.scan(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def parallel_scan(table, total_segments: int = 4, deadline: Optional[Deadline] = None,
+                  **kwargs) -> Iterator[Dict[str, Any]]:
+    """Yield every item in the table, scanning segments concurrently.
+
+    Args:
+        table: DynamoDB table resource
+        total_segments: Number of segments (and worker threads)
+        deadline: Give up once this passes (optional)
+        **kwargs: Extra scan arguments (e.g. ProjectionExpression)
+
+    Raises:
+        DeadlineExceeded: If the deadline passes before the scan completes
+    """
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        # Workers run in a copy of the caller's context, which carries its retry budget
+        futures = [
+            executor.submit(copy_context().run, scan_segment, table, segment, total_segments, deadline,
+                            **kwargs)
+            for segment in range(total_segments)
+        ]
+        for future in futures:
+            yield from future.result()
@@ -2,7 +2,9 @@
 Schemas for data validation in the Songs API.
 """
 
+import os
 from marshmallow import Schema, fields, validate, EXCLUDE
+from .serializer import compile_schema
 
 class SongSchema(Schema):
     """Schema for validating song data."""
@@ -18,6 +20,7 @@ class SongSchema(Schema):
     filepath = fields.String(allow_none=True)
     description = fields.String(allow_none=True)
     lineage = fields.List(fields.String(), allow_none=True)
+    duration_s = fields.Integer(allow_none=True, validate=validate.Range(min=0))
     s3_uri = fields.String(required=True, validate=validate.Length(min=1))
 
     class Meta:
@@ -25,4 +28,10 @@ class SongSchema(Schema):
 
 # Create instances for reuse
 song_schema = SongSchema()
-songs_schema = SongSchema(many=True) 
\ No newline at end of file
+songs_schema = SongSchema(many=True)
+
+# Generated dump/load for the hot paths; invalid payloads still get
+# marshmallow's error messages. SONG_SERIALIZER=marshmallow bypasses it.
+song_serializer = (
+    song_schema if os.getenv('SONG_SERIALIZER') == 'marshmallow' else compile_schema(song_schema)
+) 
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""
+Fuzzy search for the Songs API.
+
+Titles and artists are normalized (accents stripped, case folded,
+punctuation collapsed) and broken into character trigrams. Lookups only
+ever touch the posting lists of the query's trigrams, and trigrams common
+enough to have long lists are intersected as bitsets, so the cost of a
+query depends on the query, not on the size of the catalog.
+"""
+
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+# A trigram found in at least one song in this many also gets its postings as
+# a bitset of ranks, which takes at most 32 bytes per posting
+DENSE_POSTINGS = 256
+
+def normalize_text(text: Optional[str]) -> str:
+    """Fold text for matching: strip accents, casefold, collapse punctuation."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    folded = ''.join(ch if ch.isalnum() else ' ' for ch in stripped.casefold())
+    return ' '.join(folded.split())
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Return the trigrams of already-normalized text.
+
+    Each word is padded like pg_trgm does (two leading blanks, one
+    trailing) so short words and word boundaries still produce grams.
+    """
+    grams: Set[str] = set()
+    for word in text.split():
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return frozenset(grams)
+
+def word_joins(text: str) -> FrozenSet[str]:
+    """Return the trigrams spanning each blank of already-normalized text.
+
+    ``trigrams`` only has blanks as padding, so these never collide with
+    its grams; exact lookups use them to require the words to be adjacent.
+    """
+    return frozenset(text[i - 1:i + 2] for i, ch in enumerate(text) if ch == ' ')
+
+# Maps every non-zero byte to 1, to find them with bytes.find
+_NON_ZERO = bytes([0] + [1] * 255)
+
+def set_bits(bits: int) -> Iterator[int]:
+    """Yield the positions of the set bits of a non-negative int, lowest first."""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    flags = data.translate(_NON_ZERO)
+    i = flags.find(1)
+    while i >= 0:
+        byte = data[i]
+        while byte:
+            low = byte & -byte
+            yield i * 8 + low.bit_length() - 1
+            byte ^= low
+        i = flags.find(1, i + 1)
+
+def song_search_text(song: Dict[str, Any]) -> str:
+    """Return the normalized text a song is indexed under."""
+    return normalize_text(' '.join(
+        str(song.get(field) or '') for field in ('title', 'artist')
+    ))
+
+class TrigramIndex:
+    """In-memory trigram index over song titles and artists.
+
+    The index is built from a full catalog scan and then kept in sync
+    by the write paths of ``SongsApi``, so a warm sandbox answers
+    searches without touching DynamoDB.
+
+    A load ranks the songs by how many trigrams their text has, then by
+    text, which is the order exact matches score in, and keeps each
+    trigram's postings as an array of ranks; common trigrams also get a
+    bitset of ranks. An exact query walks its rarest posting when that is
+    short, or else ANDs the bitsets of its trigrams, and stops at ``limit``
+    matches in rank order. Songs written after the load go into small set
+    postings until the next load.
+
+    It is shared by concurrent requests: lookups and updates take a lock,
+    and a reload builds the new index aside and swaps it in, replaying
+    the updates made while its scan was running.
+    """
+
+    def __init__(self, posting_budget: int = 5000, candidate_limit: int = 200):
+        """Create an empty index.
+
+        Args:
+            posting_budget: Maximum number of postings read per fuzzy query;
+                the rarest trigrams are read first and common ones are then
+                only used for scoring
+            candidate_limit: Maximum number of candidates to rank per fuzzy query
+        """
+        self.posting_budget = posting_budget
+        self.candidate_limit = candidate_limit
+        self._lock = threading.Lock()
+        # Held by whoever is reloading the index in the background
+        self.refresh_lock = threading.Lock()
+        self._reloads: List[List[Tuple[str, Any]]] = []
+        self.clear()
+
+    def clear(self) -> None:
+        """Drop all indexed songs."""
+        with self._lock:
+            # Frozen at load: song IDs and texts by rank, and rank postings per gram
+            self._order: List[str] = []
+            self._ranked_texts: List[str] = []
+            self._ranked: Dict[str, Sequence[int]] = {}
+            self._dense: Dict[str, int] = {}
+            # Rank of each loaded song not rewritten or removed since
+            self._ranks: Dict[str, int] = {}
+            # Postings of the songs written since the load
+            self._recent: Dict[str, Set[str]] = {}
+            self._grams: Dict[str, FrozenSet[str]] = {}
+            self._texts: Dict[str, str] = {}
+            self._songs: Dict[str, Dict[str, Any]] = {}
+            self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._songs)
+
+    def __contains__(self, song_id: str) -> bool:
+        return song_id in self._songs
+
+    def is_fresh(self, ttl: float) -> bool:
+        """Check whether the index was loaded less than ``ttl`` seconds ago."""
+        return self.loaded_at is not None and time.time() - self.loaded_at < ttl
+
+    def load(self, songs: Iterable[Dict[str, Any]]) -> None:
+        """Replace the index contents with the given songs.
+
+        Searches keep using the current contents until the new ones are
+        complete. ``songs`` may be a lazy scan: an add or remove made while
+        it runs may be missing from it, so those are replayed on top.
+        """
+        updates: List[Tuple[str, Any]] = []
+        with self._lock:
+            self._reloads.append(updates)
+        try:
+            fresh = TrigramIndex(self.posting_budget, self.candidate_limit)
+            fresh._freeze({song['song_id']: song for song in songs})
+        finally:
+            with self._lock:
+                self._reloads.remove(updates)
+        with self._lock:
+            for method, argument in updates:
+                getattr(fresh, method)(argument)
+            self._order, self._ranked_texts = fresh._order, fresh._ranked_texts
+            self._ranked, self._dense = fresh._ranked, fresh._dense
+            self._ranks, self._recent = fresh._ranks, fresh._recent
+            self._grams, self._texts, self._songs = fresh._grams, fresh._texts, fresh._songs
+            self.loaded_at = time.time()
+
+    def _freeze(self, songs: Dict[str, Dict[str, Any]]) -> None:
+        """Rank the songs of a new, not yet shared index and build its postings."""
+        for song_id, song in songs.items():
+            text = song_search_text(song)
+            self._texts[song_id] = text
+            self._grams[song_id] = trigrams(text)
+        self._songs = songs
+        self._order = sorted(songs, key=lambda song_id: (
+            len(self._grams[song_id]), self._texts[song_id], song_id))
+        ranked: Dict[str, array] = {}
+        for rank, song_id in enumerate(self._order):
+            self._ranks[song_id] = rank
+            for gram in self._grams[song_id] | word_joins(self._texts[song_id]):
+                postings = ranked.get(gram)
+                if postings is None:
+                    postings = ranked[gram] = array('I')
+                postings.append(rank)
+        self._ranked = ranked
+        for gram, postings in ranked.items():
+            if len(postings) * DENSE_POSTINGS >= len(self._order):
+                bits = bytearray((len(self._order) + 7) // 8)
+                for rank in postings:
+                    bits[rank >> 3] |= 1 << (rank & 7)
+                self._dense[gram] = int.from_bytes(bits, 'little')
+        self._ranked_texts = [self._texts[song_id] for song_id in self._order]
+
+    def add(self, song: Dict[str, Any]) -> None:
+        """Index a song, replacing any previous version with the same ID."""
+        song_id = song['song_id']
+        text = song_search_text(song)
+        grams = trigrams(text)
+        with self._lock:
+            for updates in self._reloads:
+                updates.append(('add', song))
+            if song_id in self._ranks and self._texts[song_id] == text:
+                # Same text: its loaded postings still hold
+                self._songs[song_id] = song
+                return
+            self._discard(song_id)
+            for gram in grams | word_joins(text):
+                self._recent.setdefault(gram, set()).add(song_id)
+            self._grams[song_id] = grams
+            self._texts[song_id] = text
+            self._songs[song_id] = song
+
+    def remove(self, song_id: str) -> None:
+        """Remove a song from the index if present."""
+        with self._lock:
+            for updates in self._reloads:
+                updates.append(('remove', song_id))
+            self._discard(song_id)
+
+    def _discard(self, song_id: str) -> None:
+        """Drop a song's entries; the caller holds the lock."""
+        grams = self._grams.pop(song_id, None)
+        if grams is None:
+            return
+        # Loaded postings are left as they are: searches skip ranks that are no longer current
+        if self._ranks.pop(song_id, None) is None:
+            for gram in grams | word_joins(self._texts[song_id]):
+                postings = self._recent.get(gram)
+                if postings is not None:
+                    postings.discard(song_id)
+                    if not postings:
+                        del self._recent[gram]
+        self._texts.pop(song_id, None)
+        self._songs.pop(song_id, None)
+
+    def _current(self, rank: int) -> Optional[str]:
+        """Return the song ID at a loaded rank, or None if it was rewritten or removed."""
+        song_id = self._order[rank]
+        return song_id if self._ranks.get(song_id) == rank else None
+
+    def search(self, query: str, fuzzy: bool = False, limit: int = 20,
+               threshold: float = 0.3) -> List[Tuple[Dict[str, Any], float]]:
+        """Find songs matching a query.
+
+        Args:
+            query: Free-text query
+            fuzzy: Rank by trigram similarity instead of requiring a substring match
+            limit: Maximum number of results
+            threshold: Minimum similarity for fuzzy matches (0-1)
+
+        Returns:
+            List of (song, score) pairs, best match first
+        """
+        text = normalize_text(query)
+        grams = trigrams(text)
+        if not grams:
+            return []
+        with self._lock:
+            return self._search(text, grams, fuzzy, limit, threshold)
+
+    def _search(self, text: str, grams: FrozenSet[str], fuzzy: bool, limit: int,
+                threshold: float) -> List[Tuple[Dict[str, Any], float]]:
+        keys = grams if fuzzy else grams | word_joins(text)
+        postings = [(self._ranked.get(key, ()), self._recent.get(key, set())) for key in keys]
+
+        if fuzzy:
+            candidates = self._fuzzy_candidates(postings)
+        else:
+            candidates = self._exact_candidates(postings, keys, grams, text, limit)
+
+        scored = []
+        for song_id in candidates:
+            doc_grams = self._grams[song_id]
+            shared = len(grams & doc_grams)
+            score = 2.0 * shared / (len(grams) + len(doc_grams))
+            if fuzzy and score < threshold:
+                continue
+            scored.append((score, song_id))
+
+        scored.sort(key=lambda pair: (-pair[0], self._texts[pair[1]]))
+        return [(self._songs[song_id], round(score, 4)) for score, song_id in scored[:limit]]
+
+    def _exact_candidates(self, postings: List[Tuple[Sequence[int], Set[str]]], keys: FrozenSet[str],
+                          grams: FrozenSet[str], text: str, limit: int) -> List[str]:
+        """Return the best ``limit`` loaded matches and every recent one.
+
+        An exact match shares all of the query's grams, so it scores higher
+        the fewer grams it has: the first matches in rank order are the best.
+        """
+        rarest = min((loaded for loaded, _ in postings), key=len)
+        if rarest and len(rarest) * DENSE_POSTINGS >= len(self._order):
+            # Every key is common: intersect their bitsets instead of walking a long posting
+            bits = -1
+            for key in keys:
+                bits &= self._dense[key]
+            ranks: Iterable[int] = set_bits(bits)
+        else:
+            ranks = rarest
+        texts = self._ranked_texts
+        matches = []
+        for rank in ranks:
+            if text not in texts[rank]:
+                continue
+            song_id = self._current(rank)
+            if song_id is not None and grams <= self._grams[song_id]:
+                matches.append(song_id)
+                if len(matches) >= limit:
+                    break
+        recent = [found for _, found in postings]
+        for song_id in recent[0].intersection(*recent[1:]):
+            if text in self._texts[song_id]:
+                matches.append(song_id)
+        return matches
+
+    def _fuzzy_candidates(self, postings: List[Tuple[Sequence[int], Set[str]]]) -> List[str]:
+        """Count shared trigrams, reading the rarest grams within the budget."""
+        loaded: Counter = Counter()
+        recent: Counter = Counter()
+        read = 0
+        # Rarest grams first: they are the most selective and the cheapest
+        for ranks, song_ids in sorted(postings, key=lambda pair: len(pair[0]) + len(pair[1])):
+            size = len(ranks) + len(song_ids)
+            if not size:
+                continue
+            if read and read + size > self.posting_budget:
+                break
+            loaded.update(ranks)
+            recent.update(song_ids)
+            read += size
+        # Ranks of songs rewritten since the load may take a few of the candidate slots
+        hits = Counter(dict(recent.most_common(self.candidate_limit)))
+        for rank, count in loaded.most_common(self.candidate_limit):
+            song_id = self._current(rank)
+            if song_id is not None:
+                hits[song_id] = count
+        return [song_id for song_id, _ in hits.most_common(self.candidate_limit)]
@@ -0,0 +1,145 @@
+"""
+Compiled serializers for marshmallow schemas.
+
+``compile_schema`` reads a schema's field definitions once and generates
+plain Python ``dump`` and ``load`` functions for them, so list responses
+do not pay marshmallow's per-field dispatch on every item.
+
+- ``dump`` produces exactly what ``schema.dump`` would for any dict item.
+- ``load`` handles the common case (values already of the right type)
+  itself. Anything else, including every invalid payload, goes through
+  ``schema.load``, so coercions and error messages stay marshmallow's.
+
+Only plain ``String``, ``Integer`` and ``List`` fields with ``Length`` and
+``Range`` validators are compiled; ``compile_schema`` raises
+``TypeError`` for anything else rather than guess.
+"""
+
+from typing import Any, Callable, Dict, List
+from marshmallow import EXCLUDE, Schema, fields, missing, validate
+
+_MISSING = object()
+
+def _text(value: Any) -> str:
+    # Same as marshmallow.utils.ensure_text_type
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return str(value)
+
+class CompiledSchema:
+    """Generated ``dump``/``load`` functions with the schema they came from."""
+
+    __slots__ = ('schema', 'dump', 'load', 'source')
+
+    def __init__(self, schema: Schema, dump: Callable, load: Callable, source: str):
+        self.schema = schema
+        self.dump = dump
+        self.load = load
+        self.source = source
+
+    def dump_many(self, items) -> List[Dict[str, Any]]:
+        """Dump a sequence of items."""
+        dump = self.dump
+        return [dump(item) for item in items]
+
+def _check_field(name: str, field: fields.Field) -> None:
+    if field.data_key not in (None, name) or field.attribute not in (None, name):
+        raise TypeError(f'{name}: data_key/attribute are not supported')
+    if field.dump_only or field.load_only:
+        raise TypeError(f'{name}: dump_only/load_only are not supported')
+    if field.load_default is not missing or field.dump_default is not missing:
+        raise TypeError(f'{name}: defaults are not supported')
+    if hasattr(dict, name):
+        raise TypeError(f'{name}: shadows a dict attribute')
+
+def _dump_expr(field: fields.Field, var: str) -> str:
+    """Expression serializing a non-None value the way ``field._serialize`` does."""
+    if type(field) is fields.String:
+        return f'{var} if {var}.__class__ is str else _text({var})'
+    if type(field) is fields.Integer and not field.as_string:
+        return f'{var} if {var}.__class__ is int else int({var})'
+    if type(field) is fields.List:
+        inner = _dump_expr(field.inner, '_e')
+        return f'[None if _e is None else {inner} for _e in {var}]'
+    raise TypeError(f'{type(field).__name__} fields are not supported')
+
+def _load_check(field: fields.Field, var: str) -> str:
+    """Condition under which ``var`` loads unchanged (no coercion, no error)."""
+    if type(field) is fields.String:
+        check = f'{var}.__class__ is str'
+    elif type(field) is fields.Integer:
+        check = f'{var}.__class__ is int'
+    elif type(field) is fields.List:
+        inner = _load_check(field.inner, '_e')
+        check = f'{var}.__class__ is list and all({inner} for _e in {var})'
+        var = f'len({var})'
+    else:
+        raise TypeError(f'{type(field).__name__} fields are not supported')
+    for validator in field.validators:
+        if type(validator) is validate.Length and validator.equal is None:
+            length = var if var.startswith('len(') else f'len({var})'
+            if validator.min is not None:
+                check += f' and {length} >= {validator.min!r}'
+            if validator.max is not None:
+                check += f' and {length} <= {validator.max!r}'
+        elif type(validator) is validate.Range:
+            if validator.min is not None:
+                op = '>=' if validator.min_inclusive else '>'
+                check += f' and {var} {op} {validator.min!r}'
+            if validator.max is not None:
+                op = '<=' if validator.max_inclusive else '<'
+                check += f' and {var} {op} {validator.max!r}'
+        else:
+            raise TypeError(f'{type(validator).__name__} validators are not supported')
+    return check
+
+def compile_schema(schema: Schema) -> CompiledSchema:
+    """Generate ``dump`` and ``load`` functions for a schema instance.
+
+    Raises:
+        TypeError: If the schema uses a feature the compiler does not support
+    """
+    if any(schema._hooks.values()):
+        raise TypeError('schemas with hooks or schema validators are not supported')
+    if schema.many or schema.only or schema.exclude:
+        raise TypeError('many/only/exclude are not supported')
+    if schema.unknown != EXCLUDE:
+        raise TypeError('only unknown = EXCLUDE is supported')
+
+    dump_lines = ['def dump(obj):', '    out = {}', '    get = obj.get']
+    for name, field in schema.dump_fields.items():
+        _check_field(name, field)
+        dump_lines += [
+            f'    v = get({name!r}, _MISSING)',
+            f'    if v is not _MISSING:',
+            f'        out[{name!r}] = None if v is None else {_dump_expr(field, "v")}',
+        ]
+    dump_lines.append('    return out')
+
+    load_lines = [
+        'def load(data):',
+        '    if data.__class__ is not dict:',
+        '        return _slow(data)',
+        '    out = {}',
+        '    get = data.get',
+    ]
+    for name, field in schema.load_fields.items():
+        _check_field(name, field)
+        ok = _load_check(field, 'v')
+        if field.allow_none:
+            ok = f'v is None or ({ok})'
+        load_lines += [
+            f'    v = get({name!r}, _MISSING)',
+            f'    if v is not _MISSING:',
+            f'        if not ({ok}):',
+            f'            return _slow(data)',
+            f'        out[{name!r}] = {"v if v is None else list(v)" if type(field) is fields.List else "v"}',
+        ]
+        if field.required:
+            load_lines += ['    else:', '        return _slow(data)']
+    load_lines.append('    return out')
+
+    source = '\n'.join(dump_lines + [''] + load_lines) + '\n'
+    namespace: Dict[str, Any] = {'_MISSING': _MISSING, '_text': _text, '_slow': schema.load}
+    exec(compile(source, f'<compiled {type(schema).__name__}>', 'exec'), namespace)
+    return CompiledSchema(schema, namespace['dump'], namespace['load'], source)
@@ -0,0 +1,142 @@
+"""
+Random samples without scanning.
+
+A refresh job stores every song ID, in shuffled order, as fixed-size
+chunks in the index table, once for the whole catalog and once per
+lineage:
+
+- ``pk = SHUFFLE#<scope>``, ``sk = META``: ``version``, ``count``, ``chunk_size``
+- ``pk = SHUFFLE#<scope>``, ``sk = <version>#<chunk>``: ``song_ids``
+
+``scope`` is ``catalog`` or ``lineage#<slug>``. A sample draws distinct
+positions uniformly at random and reads only the chunks holding them
+(one BatchGetItem), then the songs themselves (another), so a request
+costs O(n) reads however large the catalog. Songs created since the last
+refresh are not sampled until the next one; deleted songs are skipped by
+over-drawing a few positions.
+"""
+
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from .aggregates import slugify
+from .batch import batch_get
+
+SHUFFLE_PREFIX = 'SHUFFLE#'
+META_SK = 'META'
+CATALOG_SCOPE = 'catalog'
+# ~100 UUIDs fit one 4 KB read unit, so each chunk read costs the minimum
+CHUNK_SIZE = 100
+
+def lineage_scope(lineage: str) -> str:
+    """Return the shuffle scope for a lineage name or slug."""
+    return f'lineage#{slugify(lineage)}'
+
+def _chunk_sk(version: int, chunk: int) -> str:
+    return f'{version:015d}#{chunk:06d}'
+
+class ShuffleIndex:
+    """Stores shuffled song IDs in the index table and samples from them."""
+
+    def __init__(self, index_table, chunk_size: int = CHUNK_SIZE, rng: Optional[random.Random] = None):
+        """Initialize with the index table."""
+        self.index_table = index_table
+        self.chunk_size = chunk_size
+        self.rng = rng or random.SystemRandom()
+
+    def built(self) -> bool:
+        """Return whether the catalog shuffle has been built at least once."""
+        item = self.index_table.get_item(Key={'pk': SHUFFLE_PREFIX + CATALOG_SCOPE, 'sk': META_SK})
+        return 'Item' in item
+
+    def sample(self, songs_table, n: int, scope: str = CATALOG_SCOPE) -> Optional[List[Dict[str, Any]]]:
+        """Return up to ``n`` distinct songs chosen uniformly at random.
+
+        Returns:
+            The songs, or None if the scope has never been built
+        """
+        pk = SHUFFLE_PREFIX + scope
+        meta = self.index_table.get_item(Key={'pk': pk, 'sk': META_SK}).get('Item')
+        if meta is None:
+            return None
+        count, chunk_size, version = int(meta['count']), int(meta['chunk_size']), int(meta['version'])
+        if count == 0:
+            return []
+
+        # A few spare positions cover songs deleted since the refresh
+        positions = self.rng.sample(range(count), min(count, n + n // 4 + 2))
+        chunk_keys = [{'pk': pk, 'sk': _chunk_sk(version, chunk)}
+                      for chunk in sorted({position // chunk_size for position in positions})]
+        chunks = {
+            item['sk']: item['song_ids']
+            for item in batch_get(self.index_table, chunk_keys)
+        }
+        song_ids = []
+        for position in positions:
+            ids = chunks.get(_chunk_sk(version, position // chunk_size))
+            if ids and position % chunk_size < len(ids):
+                song_ids.append(ids[position % chunk_size])
+        songs = batch_get(songs_table, [{'song_id': song_id} for song_id in song_ids])
+        return songs[:n]
+
+    def refresh(self, songs: Iterable[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+        """Rebuild every shuffle from the catalog.
+
+        New chunks are written under a new version before the META item
+        is switched over, so samples never mix two versions; the previous
+        version's chunks are deleted afterwards.
+
+        Args:
+            songs: Every song in the catalog (e.g. from ``parallel_scan``)
+            dry_run: Only report what would be written
+
+        Returns:
+            Report with the number of songs per scope and scopes removed
+        """
+        scopes: Dict[str, List[str]] = {CATALOG_SCOPE: []}
+        for song in songs:
+            scopes[CATALOG_SCOPE].append(song['song_id'])
+            for name in {lineage_scope(name) for name in song.get('lineage') or [] if name}:
+                scopes.setdefault(name, []).append(song['song_id'])
+
+        stored = self._stored_items()
+        removed = sorted(scope for scope in stored if scope not in scopes)
+        report = {'scopes': {scope: len(ids) for scope, ids in sorted(scopes.items())},
+                  'removed': removed}
+        if dry_run:
+            return report
+
+        version = int(time.time() * 1000)
+        with self.index_table.batch_writer() as batch:
+            for scope, song_ids in scopes.items():
+                self.rng.shuffle(song_ids)
+                for chunk, start in enumerate(range(0, len(song_ids), self.chunk_size)):
+                    batch.put_item(Item={
+                        'pk': SHUFFLE_PREFIX + scope,
+                        'sk': _chunk_sk(version, chunk),
+                        'song_ids': song_ids[start:start + self.chunk_size],
+                    })
+        for scope, song_ids in scopes.items():
+            self.index_table.put_item(Item={
+                'pk': SHUFFLE_PREFIX + scope, 'sk': META_SK, 'version': version,
+                'count': len(song_ids), 'chunk_size': self.chunk_size,
+            })
+        with self.index_table.batch_writer() as batch:
+            for scope, sks in stored.items():
+                for sk in sks:
+                    if sk != META_SK or scope in removed:
+                        batch.delete_item(Key={'pk': SHUFFLE_PREFIX + scope, 'sk': sk})
+        return report
+
+    def _stored_items(self) -> Dict[str, List[str]]:
+        """Return every stored shuffle item's sort key, by scope."""
+        stored: Dict[str, List[str]] = {}
+        scan_kwargs: Dict[str, Any] = {'ProjectionExpression': 'pk, sk'}
+        while True:
+            response = self.index_table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                if item['pk'].startswith(SHUFFLE_PREFIX):
+                    stored.setdefault(item['pk'][len(SHUFFLE_PREFIX):], []).append(item['sk'])
+            if 'LastEvaluatedKey' not in response:
+                return stored
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
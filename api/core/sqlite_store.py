@@ -0,0 +1,381 @@
+"""
+SQLite storage for the Songs API.
+
+``SqliteSongStore`` keeps the catalog in one SQLite file, for tests,
+benchmarks and small self-hosted installs that run without AWS:
+
+- ``songs`` holds each stored song as JSON, next to the columns it is
+  listed, filtered and grouped by: the derived sort keys, ``duration_s``,
+  the artist slug and the album ID. Every listing order has an index
+  ending in ``song_id``, so a page resumes after the last key it returned,
+  as a DynamoDB Query does.
+- ``song_lineage`` maps lineage slugs to songs, keyed by lineage
+- ``song_search`` is an FTS5 table with the trigram tokenizer, over the
+  same normalized title and artist text ``TrigramIndex`` indexes.
+  Substring searches match the query as a phrase and all of its
+  trigrams, fuzzy ones any of its trigrams; candidates are then scored
+  exactly as in memory.
+
+The database runs in WAL mode, so reads go on while a write commits.
+Each thread gets its own connection. Statements are fixed strings with
+parameters, so each connection's statement cache prepares them once.
+Writes take the write lock up front (``BEGIN IMMEDIATE``) and change a
+song, its lineage rows and its search text in one transaction.
+
+Counts and artist and album pages are computed by queries instead of
+being maintained, so there is nothing to reconcile. The change feed,
+and the caches versioned by it, are DynamoDB-only.
+"""
+
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from .aggregates import ARTISTS_PK, album_id_for, album_page, artist_list, artist_page, build_aggregates, plain, slugify
+from .deadline import Deadline, check
+from .keys import date_added, parse_sort, range_bounds, range_index, sort_keys
+from .search import normalize_text, song_search_text, trigrams
+from .timing import span
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    song_id TEXT PRIMARY KEY,
+    title_key TEXT NOT NULL,
+    date_added_ts INTEGER NOT NULL,
+    bpm_value REAL NOT NULL,
+    duration_s INTEGER,
+    artist_slug TEXT NOT NULL,
+    album_id TEXT,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_title ON songs (title_key, song_id);
+CREATE INDEX IF NOT EXISTS songs_date_added ON songs (date_added_ts, song_id);
+CREATE INDEX IF NOT EXISTS songs_bpm ON songs (bpm_value, song_id);
+CREATE INDEX IF NOT EXISTS songs_duration ON songs (duration_s, song_id) WHERE duration_s IS NOT NULL;
+CREATE INDEX IF NOT EXISTS songs_artist ON songs (artist_slug);
+CREATE INDEX IF NOT EXISTS songs_album ON songs (album_id) WHERE album_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS song_lineage (
+    lineage TEXT NOT NULL,
+    song_id TEXT NOT NULL,
+    PRIMARY KEY (lineage, song_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS song_lineage_song ON song_lineage (song_id);
+-- rowid is the song's rowid in songs
+CREATE VIRTUAL TABLE IF NOT EXISTS song_search USING fts5(text, tokenize = 'trigram');
+"""
+
+GET = 'SELECT item FROM songs WHERE song_id = ?'
+GET_FOR_WRITE = 'SELECT rowid, item FROM songs WHERE song_id = ?'
+SCAN = 'SELECT item FROM songs'
+COUNT = 'SELECT count(*) FROM songs'
+COUNT_LINEAGE = 'SELECT count(*) FROM song_lineage WHERE lineage = ?'
+INSERT = ('INSERT INTO songs (song_id, title_key, date_added_ts, bpm_value, duration_s, artist_slug, album_id, item) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+UPDATE = ('UPDATE songs SET title_key = ?, date_added_ts = ?, bpm_value = ?, duration_s = ?, artist_slug = ?, '
+          'album_id = ?, item = ? WHERE rowid = ?')
+DELETE = 'DELETE FROM songs WHERE rowid = ?'
+INSERT_LINEAGE = 'INSERT OR IGNORE INTO song_lineage (lineage, song_id) VALUES (?, ?)'
+DELETE_LINEAGE = 'DELETE FROM song_lineage WHERE song_id = ?'
+INSERT_SEARCH = 'INSERT INTO song_search (rowid, text) VALUES (?, ?)'
+DELETE_SEARCH = 'DELETE FROM song_search WHERE rowid = ?'
+SAMPLE = 'SELECT item FROM songs ORDER BY random() LIMIT ?'
+SAMPLE_LINEAGE = ('SELECT songs.item FROM song_lineage JOIN songs USING (song_id) '
+                  'WHERE song_lineage.lineage = ? ORDER BY random() LIMIT ?')
+SEARCH_CANDIDATES = ('SELECT songs.item, song_search.text FROM song_search JOIN songs ON songs.rowid = song_search.rowid '
+                     'WHERE song_search MATCH ? ORDER BY rank LIMIT ?')
+ARTISTS = "SELECT song_id, json_extract(item, '$.artist'), json_extract(item, '$.album') FROM songs"
+ARTIST = ARTISTS + ' WHERE artist_slug = ?'
+ALBUM = ARTISTS + ' WHERE album_id = ?'
+
+def _dumps(item: Dict[str, Any]) -> str:
+    return json.dumps(item, default=plain, separators=(',', ':'))
+
+def _columns(item: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Return the indexed columns and JSON of an item, in ``INSERT`` order after ``song_id``."""
+    return (
+        item['title_key'], int(item['date_added_ts']), float(item['bpm_value']), plain(item.get('duration_s')),
+        slugify(item.get('artist')), album_id_for(item.get('artist'), item.get('album')), _dumps(item),
+    )
+
+def _search_text(item: Dict[str, Any]) -> str:
+    # Padded so the trigrams at word boundaries match those of TrigramIndex
+    return f' {song_search_text(item)} '
+
+def _phrase(text: str) -> str:
+    """Quote text as one FTS5 string (normalized text has no quotes, but be safe)."""
+    return '"' + text.replace('"', '""') + '"'
+
+class SqliteSongStore:
+    """Songs in a SQLite database file."""
+
+    name = 'sqlite'
+    index_table = None
+    changes = None
+
+    def __init__(self, path: str, busy_timeout: float = 5, candidate_limit: int = 200):
+        """Open (or create) the database.
+
+        Args:
+            path: Database file; WAL needs a file, not ``:memory:``
+            busy_timeout: Seconds a write waits for another to commit
+            candidate_limit: Maximum number of candidates to rank per search
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.candidate_limit = candidate_limit
+        self.aggregates = SqliteAggregates(self)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit: reads need no transaction, and writes open their own
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')  # Durable at checkpoints; safe in WAL
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextlib.contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Run the block as one write transaction, holding the write lock from the start."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def close(self) -> None:
+        """Close every thread's connection."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def ping(self) -> None:
+        with span('sqlite'):
+            self._connection().execute('SELECT 1').fetchone()
+
+    def get(self, song_id: str) -> Optional[Dict[str, Any]]:
+        with span('sqlite'):
+            row = self._connection().execute(GET, (song_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def scan(self, deadline: Optional[Deadline] = None, parallel: bool = False,
+             attributes: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield every song (``parallel`` makes no difference to a local file).
+
+        Raises:
+            DeadlineExceeded: If the deadline has passed before the read
+        """
+        check(deadline)
+        with span('sqlite'):
+            rows = self._connection().execute(SCAN).fetchall()
+        for (item,) in rows:
+            item = json.loads(item)
+            yield {name: item[name] for name in attributes if name in item} if attributes else item
+
+    def list_all(self, deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return every song; one local read is never cut short."""
+        return list(self.scan()), None
+
+    def page(self, limit: int, start_key: Optional[Dict[str, Any]] = None, sort: Optional[str] = None,
+             filters: Optional[Dict[str, Decimal]] = None,
+             lineage: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Read one page in the order DynamoDB's matching index would return it.
+
+        Rows are ordered by the index's sort key, then ``song_id``; the key
+        of the last row is the page's resume key.
+
+        Raises:
+            ValueError: If the sort, filters or start key are invalid
+        """
+        key, ascending = 'song_id', True
+        source, conditions, parameters = 'songs', [], []
+        if lineage is not None:
+            source = 'songs JOIN song_lineage USING (song_id)'
+            conditions.append('song_lineage.lineage = ?')
+            parameters.append(slugify(lineage))
+        elif filters:
+            _, key, ascending = range_index(filters, sort)
+            bpm_range, duration_range = range_bounds(filters)
+            if key == 'bpm_value':
+                conditions.append('bpm_value BETWEEN ? AND ?')
+                parameters.extend(plain(list(bpm_range)))
+            if key == 'duration_s' or 'duration_min' in filters or 'duration_max' in filters:
+                conditions.append('duration_s BETWEEN ? AND ?')
+                parameters.extend(plain(list(duration_range)))
+        elif sort:
+            _, key, ascending = parse_sort(sort)
+
+        order = '>' if ascending else '<'
+        if start_key:
+            # A key from another listing order cannot be resumed in this one
+            if set(start_key) != {'song_id', key}:
+                raise ValueError("cursor is not valid")
+            if key == 'song_id':
+                conditions.append(f'song_id {order} ?')
+                parameters.append(start_key['song_id'])
+            else:
+                conditions.append(f'({key}, song_id) {order} (?, ?)')
+                parameters.extend([plain(start_key[key]), start_key['song_id']])
+
+        direction = '' if ascending else ' DESC'
+        ordering = f'song_id{direction}' if key == 'song_id' else f'{key}{direction}, song_id{direction}'
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        sql = f'SELECT item, song_id, {key} FROM {source}{where} ORDER BY {ordering} LIMIT ?'
+        with span('sqlite'):
+            rows = self._connection().execute(sql, parameters + [limit + 1]).fetchall()
+
+        last_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            _, song_id, value = rows[-1]
+            last_key = {'song_id': song_id}
+            if key != 'song_id':
+                last_key[key] = value if isinstance(value, str) else Decimal(str(value))
+        return [json.loads(item) for item, _, _ in rows], last_key
+
+    def count(self, lineage: Optional[str] = None) -> Optional[int]:
+        with span('sqlite'):
+            if lineage:
+                return self._connection().execute(COUNT_LINEAGE, (slugify(lineage),)).fetchone()[0]
+            return self._connection().execute(COUNT).fetchone()[0]
+
+    def _index(self, connection: sqlite3.Connection, rowid: int, item: Dict[str, Any]) -> None:
+        """Write a song's lineage rows and search text; the caller has removed the old ones."""
+        lineages = {slugify(name) for name in item.get('lineage') or [] if name}
+        connection.executemany(INSERT_LINEAGE, [(lineage, item['song_id']) for lineage in sorted(lineages)])
+        connection.execute(INSERT_SEARCH, (rowid, _search_text(item)))
+
+    def create(self, item: Dict[str, Any]) -> None:
+        """Insert a new song.
+
+        Raises:
+            sqlite3.IntegrityError: If a song with its ID already exists
+        """
+        with span('sqlite'), self._write() as connection:
+            rowid = connection.execute(INSERT, (item['song_id'], *_columns(item))).lastrowid
+            self._index(connection, rowid, item)
+
+    def update(self, song_id: str, existing: Dict[str, Any],
+               changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply changes as DynamoDB's UpdateItem would, reading and writing in one transaction."""
+        with span('sqlite'), self._write() as connection:
+            row = connection.execute(GET_FOR_WRITE, (song_id,)).fetchone()
+            if row is None:
+                return None
+            rowid, item = row[0], json.loads(row[1])
+            item.update((key, value) for key, value in changes.items() if key != 'song_id')
+            if item.get('duration_s') is None:
+                item.pop('duration_s', None)
+            item.update(sort_keys(changes, partial=True))
+            item.setdefault('date_added_ts', date_added(changes, now=time.time()))
+            connection.execute(UPDATE, (*_columns(item), rowid))
+            connection.execute(DELETE_LINEAGE, (song_id,))
+            connection.execute(DELETE_SEARCH, (rowid,))
+            self._index(connection, rowid, item)
+        return item
+
+    def delete(self, song_id: str) -> Optional[Dict[str, Any]]:
+        with span('sqlite'), self._write() as connection:
+            row = connection.execute(GET_FOR_WRITE, (song_id,)).fetchone()
+            if row is None:
+                return None
+            connection.execute(DELETE, (row[0],))
+            connection.execute(DELETE_LINEAGE, (song_id,))
+            connection.execute(DELETE_SEARCH, (row[0],))
+        return json.loads(row[1])
+
+    def sample(self, n: int, lineage: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        with span('sqlite'):
+            if lineage:
+                rows = self._connection().execute(SAMPLE_LINEAGE, (slugify(lineage), n)).fetchall()
+            else:
+                rows = self._connection().execute(SAMPLE, (n,)).fetchall()
+        return [json.loads(item) for (item,) in rows]
+
+    def search(self, query: str, fuzzy: bool = False, limit: int = 20,
+               threshold: float = 0.3) -> List[Tuple[Dict[str, Any], float]]:
+        """Find songs matching a query, scored as ``TrigramIndex.search`` scores them.
+
+        Args:
+            query: Free-text query
+            fuzzy: Rank by trigram similarity instead of requiring a substring match
+            limit: Maximum number of results
+            threshold: Minimum similarity for fuzzy matches (0-1)
+
+        Returns:
+            List of (song, score) pairs, best match first
+        """
+        text = normalize_text(query)
+        grams = trigrams(text)
+        if not grams:
+            return []
+        # Grams of a word's first letter and two blanks are not in the padded text, and
+        # are implied by the word's next gram; every other gram is one of its trigrams
+        terms = [_phrase(gram) for gram in sorted(grams) if not gram.startswith('  ')]
+        if not fuzzy and len(text) >= 3:
+            terms.insert(0, _phrase(text))
+        with span('sqlite'):
+            rows = self._connection().execute(
+                SEARCH_CANDIDATES, ((' OR ' if fuzzy else ' AND ').join(terms), self.candidate_limit)
+            ).fetchall()
+
+        scored = []
+        for item, doc_text in rows:
+            doc_text = doc_text.strip()
+            doc_grams = trigrams(doc_text)
+            if not fuzzy and not (grams <= doc_grams and text in doc_text):
+                continue
+            shared = len(grams & doc_grams)
+            score = 2.0 * shared / (len(grams) + len(doc_grams))
+            if fuzzy and score < threshold:
+                continue
+            scored.append((score, doc_text, item))
+
+        scored.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [(json.loads(item), round(score, 4)) for score, _, item in scored[:limit]]
+
+class SqliteAggregates:
+    """Artist and album pages computed from the ``songs`` table on each read.
+
+    Returns the same documents as ``AggregateStore``, built by the same
+    functions over only the songs a page needs, which the artist and
+    album indexes find.
+    """
+
+    def __init__(self, store: SqliteSongStore):
+        self.store = store
+
+    def _songs(self, sql: str, parameters: Tuple[Any, ...] = ()) -> List[Dict[str, Any]]:
+        with span('sqlite'):
+            rows = self.store._connection().execute(sql, parameters).fetchall()
+        return [{'song_id': song_id, 'artist': artist, 'album': album} for song_id, artist, album in rows]
+
+    def get_artists(self) -> List[Dict[str, Any]]:
+        """Return every artist with counts, ordered by name."""
+        items = build_aggregates(self._songs(ARTISTS))
+        return artist_list(item for (pk, _), item in items.items() if pk == ARTISTS_PK)
+
+    def get_artist(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Return one artist's songs grouped by album, or None."""
+        return artist_page(slug, self._songs(ARTIST, (slug,)))
+
+    def get_album(self, album_id: str) -> Optional[Dict[str, Any]]:
+        """Return one album and its songs, or None."""
+        return album_page(album_id, self._songs(ALBUM, (album_id,)))
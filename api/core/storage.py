@@ -0,0 +1,328 @@
+"""
+Storage backends for the Songs API.
+
+``SongsApi`` reads and writes songs through a ``SongStore``:
+
+- ``DynamoDBSongStore``: the songs table and its sort indexes, plus the
+  optional index table, whose counters, lineage entries, aggregates and
+  tombstones are written in the same transaction as the song
+- ``SqliteSongStore`` (in ``sqlite_store``): one SQLite file, for tests,
+  benchmarks and small self-hosted installs that run without AWS
+
+Validation, serialization, the in-process caches and the response shapes
+stay in ``SongsApi``, whatever the backend. Features built on the index
+table (the change feed, and with it the in-memory catalog and the song
+ID filter; the maintenance jobs) exist only with DynamoDB.
+"""
+
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Sequence, Set, Tuple, runtime_checkable
+from .aggregates import AggregateStore
+from .changes import SETTLE_SECONDS, ChangeFeed
+from .counters import CATALOG, CounterStore, counter_deltas, lineage_counter
+from .deadline import Deadline, check
+from .keys import LISTING_ATTR, LISTING_VALUE, date_added, parse_sort, range_bounds, range_index, sort_keys
+from .lineage import LineageIndex
+from .scans import parallel_scan
+from .shuffle import CATALOG_SCOPE, ShuffleIndex, lineage_scope
+from .transactions import TransactionCancelled, WriteTransaction
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+class SongStore(Protocol):
+    """What ``SongsApi`` needs from wherever songs are kept.
+
+    Items are stored songs: validated fields plus the derived keys of
+    ``keys.new_song_keys``. The keys returned by ``page`` and ``list_all``
+    are only passed back as ``start_key``; ``pagination`` makes them cursors.
+    """
+
+    name: str  # Names the backend in the warm-up report
+    index_table: Any  # Table of derived documents for maintenance jobs, or None
+    changes: Optional[ChangeFeed]  # Change feed stamping every write, or None
+    aggregates: Any  # Artist and album pages, with AggregateStore's read methods, or None
+
+    def ping(self) -> None:
+        """Make one cheap call, opening the connection."""
+
+    def get(self, song_id: str) -> Optional[Dict[str, Any]]:
+        """Return a stored song, or None."""
+
+    def scan(self, deadline: Optional[Deadline] = None, parallel: bool = False,
+             attributes: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield every stored song, or only the given attributes of each."""
+
+    def list_all(self, deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return every song, or as many as the deadline allows and the key to resume from."""
+
+    def page(self, limit: int, start_key: Optional[Dict[str, Any]] = None, sort: Optional[str] = None,
+             filters: Optional[Dict[str, Decimal]] = None,
+             lineage: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return one page of songs in index order and the key to resume from (None on the last page)."""
+
+    def count(self, lineage: Optional[str] = None) -> Optional[int]:
+        """Return the number of songs, or of one lineage's songs (None if not known)."""
+
+    def create(self, item: Dict[str, Any]) -> None:
+        """Store a new song."""
+
+    def update(self, song_id: str, existing: Dict[str, Any],
+               changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply validated changes to a song; return it as stored, or None if it is gone."""
+
+    def delete(self, song_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a song; return it as it was, or None if there was none."""
+
+    def sample(self, n: int, lineage: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Return up to n random songs, or None if only a full scan could draw them."""
+
+@runtime_checkable
+class SearchableStore(Protocol):
+    """A store with its own full-text index.
+
+    ``SongsApi`` searches such a store directly; for any other store it
+    keeps a ``TrigramIndex`` in memory.
+    """
+
+    def search(self, query: str, fuzzy: bool = False, limit: int = 20) -> List[Tuple[Dict[str, Any], float]]:
+        """Return (song, score) pairs as ``TrigramIndex.search`` does."""
+
+class DynamoDBSongStore:
+    """Songs in a DynamoDB table, with derived documents in an optional index table."""
+
+    name = 'dynamodb'
+
+    def __init__(self, table, index_table=None, changes_settle_seconds: float = SETTLE_SECONDS):
+        """Initialize with the songs table and, optionally, the index table.
+
+        Without an index table there are no counters (``count`` returns
+        None), lineage pages are scans and writes are single-item.
+        """
+        self.table = table
+        self.index_table = index_table
+        self.aggregates = AggregateStore(index_table) if index_table is not None else None
+        self.counters = CounterStore(index_table) if index_table is not None else None
+        self.lineage = LineageIndex(index_table) if index_table is not None else None
+        self.shuffle = ShuffleIndex(index_table) if index_table is not None else None
+        self.changes = (ChangeFeed(index_table, settle_seconds=changes_settle_seconds)
+                        if index_table is not None else None)
+
+    def ping(self) -> None:
+        self.table.meta.client.describe_table(TableName=self.table.name)
+
+    def get(self, song_id: str) -> Optional[Dict[str, Any]]:
+        return self.table.get_item(Key={'song_id': song_id}).get('Item')
+
+    def scan(self, deadline: Optional[Deadline] = None, parallel: bool = False,
+             attributes: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield every item, following scan pagination (or in parallel segments).
+
+        Raises:
+            DeadlineExceeded: If the deadline passes before the last page
+        """
+        kwargs = {'ProjectionExpression': ', '.join(attributes)} if attributes else {}
+        if parallel:
+            yield from parallel_scan(self.table, deadline=deadline, **kwargs)
+            return
+        while True:
+            check(deadline)
+            response = self.table.scan(**kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def list_all(self, deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        items, scan_kwargs = [], {}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            items.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if last_key is None or (deadline and deadline.expired()):
+                return items, last_key
+            scan_kwargs['ExclusiveStartKey'] = last_key
+
+    def page(self, limit: int, start_key: Optional[Dict[str, Any]] = None, sort: Optional[str] = None,
+             filters: Optional[Dict[str, Decimal]] = None,
+             lineage: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Read one page from the matching index (or the lineage fan-out entries).
+
+        Raises:
+            ValueError: If the start key was not issued for this listing's index
+        """
+        request: Dict[str, Any] = {'Limit': limit}
+        if start_key:
+            if set(start_key) != self._start_key_names(sort, filters, lineage):
+                raise ValueError("cursor is not valid")
+            request['ExclusiveStartKey'] = start_key
+        if lineage is not None and self.lineage:
+            return self.lineage.page(self.table, lineage, limit, start_key)
+        if lineage is not None:
+            response = self.table.scan(FilterExpression=Attr('lineage').contains(lineage), **request)
+        elif filters:
+            response = self.table.query(**self._range_query(filters, sort), **request)
+        elif sort:
+            index_name, _, ascending = parse_sort(sort)
+            response = self.table.query(
+                IndexName=index_name,
+                KeyConditionExpression=Key(LISTING_ATTR).eq(LISTING_VALUE),
+                ScanIndexForward=ascending,
+                **request
+            )
+        else:
+            response = self.table.scan(**request)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    def _start_key_names(self, sort: Optional[str], filters: Optional[Dict[str, Decimal]],
+                         lineage: Optional[str]) -> Set[str]:
+        """Return the attributes of a LastEvaluatedKey from the index a page is read from."""
+        if lineage is not None:
+            return {'pk', 'sk'} if self.lineage else {'song_id'}
+        if filters:
+            return {'song_id', LISTING_ATTR, range_index(filters, sort)[1]}
+        if sort:
+            return {'song_id', LISTING_ATTR, parse_sort(sort)[1]}
+        return {'song_id'}
+
+    def _range_query(self, filters: Dict[str, Decimal], sort: Optional[str]) -> Dict[str, Any]:
+        """Build an index Query for BPM and duration range filters.
+
+        The index's own sort key takes the range as a key condition; the
+        other dimension, if any, is applied as a filter on the same Query.
+        DynamoDB applies ``Limit`` before the filter, so a BPM and duration
+        page can come back short or empty with a ``LastEvaluatedKey``. This
+        is deliberate: a key over both would need an index per combination.
+        """
+        index_name, key, ascending = range_index(filters, sort)
+        bpm_range, duration_range = range_bounds(filters)
+
+        query: Dict[str, Any] = {'IndexName': index_name, 'ScanIndexForward': ascending}
+        listing = Key(LISTING_ATTR).eq(LISTING_VALUE)
+        if key == 'bpm_value':
+            query['KeyConditionExpression'] = listing & Key(key).between(*bpm_range)
+            if 'duration_min' in filters or 'duration_max' in filters:
+                query['FilterExpression'] = Attr('duration_s').between(*duration_range)
+        else:
+            query['KeyConditionExpression'] = listing & Key(key).between(*duration_range)
+        return query
+
+    def count(self, lineage: Optional[str] = None) -> Optional[int]:
+        """Return a maintained song count with one GetItem (None without an index table)."""
+        if not self.counters:
+            return None
+        return self.counters.get(lineage_counter(lineage) if lineage else CATALOG)
+
+    def create(self, item: Dict[str, Any]) -> None:
+        # Index keys cannot be NULL; a song without a duration is left out of duration-index
+        if item.get('duration_s') is None:
+            item.pop('duration_s', None)
+        if self.changes:
+            item.update(self.changes.stamp())
+        if self.counters:
+            transaction = WriteTransaction().put(
+                self.table, item, condition='attribute_not_exists(song_id)'
+            )
+            self.counters.add_to(transaction, counter_deltas(None, item))
+            self.lineage.add_to(transaction, item['song_id'], None, item)
+            self.aggregates.add_to(transaction, None, item)
+            transaction.commit()
+        else:
+            self.table.put_item(Item=item)
+
+    def update(self, song_id: str, existing: Dict[str, Any],
+               changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update a song with one UpdateItem, in a transaction with its counters, lineages and aggregates."""
+        # Build update expression
+        update_expr = 'SET '
+        expr_names = {}
+        expr_values = {}
+
+        remove = []
+
+        for key, value in changes.items():
+            if key == 'duration_s' and value is None:
+                remove.append(key)  # Index keys cannot be NULL
+            elif key != 'song_id':  # Don't update the primary key
+                update_expr += f'#{key} = :{key}, '
+                expr_names[f'#{key}'] = key
+                expr_values[f':{key}'] = value
+
+        # Keep the sort keys in step with the fields being changed
+        for key, value in sort_keys(changes, partial=True).items():
+            update_expr += f'#{key} = :{key}, '
+            expr_names[f'#{key}'] = key
+            expr_values[f':{key}'] = value
+        # Stamp the change feed's sequence number
+        if self.changes:
+            for key, value in self.changes.stamp().items():
+                update_expr += f'#{key} = :{key}, '
+                expr_names[f'#{key}'] = key
+                expr_values[f':{key}'] = value
+        update_expr += '#date_added_ts = if_not_exists(#date_added_ts, :date_added_ts)'
+        expr_names['#date_added_ts'] = 'date_added_ts'
+        expr_values[':date_added_ts'] = date_added(changes, now=time.time())
+        if remove:
+            update_expr += ' REMOVE ' + ', '.join(f'#{key}' for key in remove)
+            expr_names.update({f'#{key}': key for key in remove})
+
+        if self.counters:
+            # Move the song between counters and lineages in the same transaction as the update
+            song = {**existing, **changes, 'song_id': song_id}
+            transaction = WriteTransaction().update(
+                self.table,
+                {'song_id': song_id},
+                update_expr,
+                names=expr_names,
+                values=expr_values,
+                condition='attribute_exists(song_id)'
+            )
+            self.counters.add_to(transaction, counter_deltas(existing, song))
+            self.lineage.add_to(transaction, song_id, existing, song)
+            self.aggregates.add_to(transaction, existing, song)
+            try:
+                transaction.commit()
+            except (ClientError, TransactionCancelled):
+                return None
+            return song
+
+        try:
+            response = self.table.update_item(
+                Key={'song_id': song_id},
+                UpdateExpression=update_expr,
+                ExpressionAttributeNames=expr_names,
+                ExpressionAttributeValues=expr_values,
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError:
+            return None
+        return response.get('Attributes')
+
+    def delete(self, song_id: str) -> Optional[Dict[str, Any]]:
+        if self.counters:
+            old = self.table.get_item(Key={'song_id': song_id}).get('Item')
+            if not old:
+                return None
+            transaction = WriteTransaction().delete(
+                self.table, {'song_id': song_id}, condition='attribute_exists(song_id)'
+            )
+            self.counters.add_to(transaction, counter_deltas(old, None))
+            self.lineage.add_to(transaction, song_id, old, None)
+            self.aggregates.add_to(transaction, old, None)
+            self.changes.add_tombstone(transaction, song_id, self.changes.stamp())
+            try:
+                transaction.commit()
+            except TransactionCancelled:
+                # Deleted concurrently; the other writer adjusted the counters
+                return None
+            return old
+        return self.table.delete_item(Key={'song_id': song_id}, ReturnValues='ALL_OLD').get('Attributes')
+
+    def sample(self, n: int, lineage: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Read a sample from the precomputed shuffle (None until its first refresh)."""
+        if not self.shuffle:
+            return None
+        items = self.shuffle.sample(self.table, n, lineage_scope(lineage) if lineage else CATALOG_SCOPE)
+        if items is None and not self.shuffle.built():
+            return None
+        return items or []
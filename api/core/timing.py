@@ -0,0 +1,100 @@
+"""
+Request timing spans.
+
+A ``Timings`` collector adds up how long a request spent in each kind of
+work:
+
+- ``dynamodb`` and ``s3``: every call, including retries and backoff.
+  ``instrument`` times these with hooks on the botocore client.
+- ``sqlite``: every statement of the SQLite song store, when it is used.
+- ``dump``: serializing songs for the response.
+- ``json``: encoding the response body.
+
+The handler makes the collector current with ``collect`` and reports it
+as a ``Server-Timing`` header, in the slow-request log, or both. When no
+collector is current, ``span`` and the client hooks only read a context
+variable. Spans from concurrent threads (batch sub-requests, scan
+segments) are added together, so they can sum to more than ``total``.
+"""
+
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+_timings: ContextVar[Optional['Timings']] = ContextVar('timings', default=None)
+
+class Timings:
+    """Time spent per span name over one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._spans: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        """Add one timed piece of work to a span."""
+        with self._lock:
+            span = self._spans.setdefault(name, [0.0, 0])
+            span[0] += seconds
+            span[1] += 1
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the collector was created."""
+        return (time.perf_counter() - self.started) * 1000
+
+    def spans(self) -> Dict[str, Dict[str, float]]:
+        """Return ``{name: {'ms', 'count'}}`` for every span recorded so far."""
+        with self._lock:
+            return {name: {'ms': round(seconds * 1000, 1), 'count': count}
+                    for name, (seconds, count) in self._spans.items()}
+
+    def header(self) -> str:
+        """Format the spans and the total as a ``Server-Timing`` header value."""
+        metrics = [f'{name};dur={span["ms"]};desc="{span["count"]}x"' for name, span in self.spans().items()]
+        metrics.append(f'total;dur={round(self.elapsed_ms(), 1)}')
+        return ', '.join(metrics)
+
+@contextlib.contextmanager
+def collect(timings: Optional[Timings]):
+    """Record spans in this context into ``timings`` (None records nothing)."""
+    token = _timings.set(timings)
+    try:
+        yield
+    finally:
+        _timings.reset(token)
+
+@contextlib.contextmanager
+def span(name: str):
+    """Time the enclosed block into the current collector, if there is one."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+def instrument(client, name: str):
+    """Time every call of a botocore client as the span ``name``. Returns the client."""
+    service = client.meta.service_model.service_id.hyphenize()
+
+    def before_call(context, **kwargs):
+        if _timings.get() is not None:
+            context['timing_started'] = time.perf_counter()
+
+    def after_call(context, **kwargs):
+        started = context.pop('timing_started', None)
+        timings = _timings.get()
+        if started is not None and timings is not None:
+            timings.add(name, time.perf_counter() - started)
+
+    events = client.meta.events
+    # First, so that other hooks answering or raising cannot skip the timing
+    events.register_first(f'before-call.{service}', before_call)
+    events.register_first(f'after-call.{service}', after_call)
+    events.register_first(f'after-call-error.{service}', after_call)
+    return client
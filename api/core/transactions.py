@@ -0,0 +1,97 @@
+"""
+Atomic multi-item writes for the Songs API.
+
+``WriteTransaction`` collects puts, updates and deletes against any of
+the API's tables using the same arguments as the boto3 ``Table``
+methods, then commits them with a single ``TransactWriteItems`` call.
+
+The call goes through the table resource's own client, which already
+converts plain Python values into DynamoDB type descriptors; values must
+not be wrapped in ``{"S": ...}`` by hand (see docs/dynamodb.md).
+"""
+
+import random
+import time
+from typing import Any, Dict, List, Optional
+from botocore.exceptions import ClientError
+
+class TransactionCancelled(Exception):
+    """Raised when a transaction is cancelled, e.g. by a failed condition."""
+
+    def __init__(self, reasons: List[str]):
+        super().__init__(f"Transaction cancelled: {', '.join(reasons)}")
+        self.reasons = reasons
+
+class WriteTransaction:
+    """A batch of writes that either all succeed or all fail."""
+
+    MAX_ITEMS = 100
+
+    def __init__(self, max_attempts: int = 3):
+        self.items: List[Dict[str, Any]] = []
+        self.max_attempts = max_attempts
+        self._client = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _add(self, table, operation: str, request: Dict[str, Any],
+             condition: Optional[str], names: Optional[Dict[str, str]],
+             values: Optional[Dict[str, Any]]) -> 'WriteTransaction':
+        if len(self.items) >= self.MAX_ITEMS:
+            raise ValueError(f'A transaction holds at most {self.MAX_ITEMS} items')
+        self._client = self._client or table.meta.client
+        request['TableName'] = table.name
+        if condition:
+            request['ConditionExpression'] = condition
+        if names:
+            request['ExpressionAttributeNames'] = names
+        if values:
+            request['ExpressionAttributeValues'] = values
+        self.items.append({operation: request})
+        return self
+
+    def put(self, table, item: Dict[str, Any], condition: Optional[str] = None,
+            names: Optional[Dict[str, str]] = None,
+            values: Optional[Dict[str, Any]] = None) -> 'WriteTransaction':
+        """Add a put of a full item."""
+        return self._add(table, 'Put', {'Item': item}, condition, names, values)
+
+    def update(self, table, key: Dict[str, Any], update_expression: str,
+               names: Optional[Dict[str, str]] = None, values: Optional[Dict[str, Any]] = None,
+               condition: Optional[str] = None) -> 'WriteTransaction':
+        """Add an update expression against one item."""
+        request = {'Key': key, 'UpdateExpression': update_expression}
+        return self._add(table, 'Update', request, condition, names, values)
+
+    def delete(self, table, key: Dict[str, Any], condition: Optional[str] = None,
+               names: Optional[Dict[str, str]] = None,
+               values: Optional[Dict[str, Any]] = None) -> 'WriteTransaction':
+        """Add a delete of one item."""
+        return self._add(table, 'Delete', {'Key': key}, condition, names, values)
+
+    def commit(self) -> None:
+        """Write every item atomically.
+
+        Conflicts with other in-flight transactions (hot counter items) are
+        retried with jittered backoff; any other cancellation is raised.
+
+        Raises:
+            TransactionCancelled: If a condition failed or conflicts persisted
+        """
+        if not self.items:
+            return
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._client.transact_write_items(TransactItems=self.items)
+                return
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                    raise
+                reasons = [
+                    reason.get('Code', 'None')
+                    for reason in e.response.get('CancellationReasons', [])
+                ]
+                if 'TransactionConflict' not in reasons or attempt == self.max_attempts:
+                    raise TransactionCancelled(reasons) from e
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
@@ -55,4 +55,19 @@ def validate_object_key(key: str) -> Tuple[bool, str]:
     if '//' in key:
         return False, "Object key cannot contain consecutive slashes"
     
-    return True, "" 
\ No newline at end of file
+    return True, "" 
+
+def validate_limit(limit) -> Tuple[bool, str]:
+    """
+    Validate a page size query parameter.
+    Returns (is_valid, error_message)
+    """
+    try:
+        value = int(limit)
+    except (TypeError, ValueError):
+        return False, "limit must be an integer"
+    
+    if value < 1 or value > 100:
+        return False, "limit must be between 1 and 100"
+    
+    return True, ""
@@ -4,17 +4,28 @@ from aws_cdk import (
     aws_apigatewayv2 as apigw,
     aws_apigatewayv2_integrations as integrations,
     aws_iam as iam,
+    aws_events as events,
+    aws_events_targets as targets,
     CfnOutput,
     Duration,
     aws_s3 as s3
 )
 from constructs import Construct
+from typing import Optional
 from .db_stack import DatabaseStack
 import os
 import aws_cdk as cdk
 
 class ApiStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, db_stack: DatabaseStack, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, db_stack: DatabaseStack,
+                 warmup_interval: Optional[Duration] = Duration.minutes(5),
+                 warmup_concurrency: int = 2, **kwargs) -> None:
+        """Create the API.
+
+        Args:
+            warmup_interval: How often to send warm-up events (None disables them)
+            warmup_concurrency: Number of sandboxes each round of warm-up events keeps warm
+        """
         super().__init__(scope, construct_id, **kwargs)
 
         # Get the path to the Lambda code
@@ -41,12 +52,16 @@ class ApiStack(Stack):
             timeout=Duration.seconds(30),  # Increase timeout to 30 seconds
             environment={
                 "DYNAMODB_TABLE_NAME": db_stack.table.table_name,
-                "S3_BUCKET": db_stack.bucket.bucket_name  # Use the bucket name from DatabaseStack
+                "INDEX_TABLE_NAME": db_stack.index_table.table_name,
+                "S3_BUCKET": db_stack.bucket.bucket_name,  # Use the bucket name from DatabaseStack
+                "WARM_ON_INIT": "true",
+                "EMF_METRICS": "true"
             }
         )
 
         # Grant Lambda function access to DynamoDB table
         db_stack.table.grant_read_write_data(function)
+        db_stack.index_table.grant_read_write_data(function)
 
         # Use the bucket from DatabaseStack
         self.audio_bucket = db_stack.bucket
@@ -54,6 +69,40 @@ class ApiStack(Stack):
         # Grant Lambda function access to S3 bucket
         self.audio_bucket.grant_read_write(function)  # Grant read/write access to the bucket
 
+        # Scheduled maintenance: correct counter and aggregate drift nightly
+        for task, hour in [("reconcile_counters", "3"), ("repair_aggregates", "4")]:
+            events.Rule(
+                self, f"Maintenance-{task}",
+                schedule=events.Schedule.cron(minute="0", hour=hour),
+                targets=[targets.LambdaFunction(
+                    function,
+                    event=events.RuleTargetInput.from_object({"maintenance": task})
+                )]
+            )
+
+        # Refresh the shuffled song IDs behind GET /songs/random every hour
+        events.Rule(
+            self, "Maintenance-refresh_shuffle",
+            schedule=events.Schedule.rate(Duration.hours(1)),
+            targets=[targets.LambdaFunction(
+                function,
+                event=events.RuleTargetInput.from_object({"maintenance": "refresh_shuffle"})
+            )]
+        )
+
+        # Keep sandboxes warm: concurrent warm-up events, at most 5 targets per rule
+        if warmup_interval is not None:
+            warmup_targets = [
+                targets.LambdaFunction(function, event=events.RuleTargetInput.from_object({"warmup": True}))
+                for _ in range(warmup_concurrency)
+            ]
+            for group, start in enumerate(range(0, len(warmup_targets), 5)):
+                events.Rule(
+                    self, f"Warmup-{group}",
+                    schedule=events.Schedule.rate(warmup_interval),
+                    targets=warmup_targets[start:start + 5]
+                )
+
         # Create HTTP API with CORS enabled
         api = apigw.HttpApi(
             self, "SongsHttpApi",
@@ -63,7 +112,7 @@ class ApiStack(Stack):
                 allow_methods=[apigw.CorsHttpMethod.GET, apigw.CorsHttpMethod.POST, 
                              apigw.CorsHttpMethod.PUT, apigw.CorsHttpMethod.DELETE,
                              apigw.CorsHttpMethod.OPTIONS],
-                allow_headers=["Content-Type", "Accept"],
+                allow_headers=["Content-Type", "Accept", "X-Server-Timing"],
                 max_age=Duration.seconds(3000)
             )
         )
@@ -105,6 +154,29 @@ class ApiStack(Stack):
             integration=lambda_integration
         )
 
+        # Add change feed and random sample endpoints (matched before /songs/{song_id})
+        for path in ["/songs/changes", "/songs/random"]:
+            api.add_routes(
+                path=path,
+                methods=[apigw.HttpMethod.GET],
+                integration=lambda_integration
+            )
+
+        # Add search endpoint
+        api.add_routes(
+            path="/search",
+            methods=[apigw.HttpMethod.GET],
+            integration=lambda_integration
+        )
+
+        # Add artist and album aggregate endpoints
+        for path in ["/artists", "/artists/{slug}", "/albums/{album_id}"]:
+            api.add_routes(
+                path=path,
+                methods=[apigw.HttpMethod.GET],
+                integration=lambda_integration
+            )
+
         # Add pre-signed URL endpoint
         api.add_routes(
             path="/presigned-url",
@@ -112,6 +184,13 @@ class ApiStack(Stack):
             integration=lambda_integration
         )
 
+        # Add batch endpoint (several sub-requests in one invocation)
+        api.add_routes(
+            path="/batch",
+            methods=[apigw.HttpMethod.POST],
+            integration=lambda_integration
+        )
+
         # Output the API URL
         CfnOutput(
             self, "ApiUrl",
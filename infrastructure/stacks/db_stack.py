@@ -24,6 +24,50 @@ class DatabaseStack(Stack):
             removal_policy=RemovalPolicy.DESTROY
         )
 
+        # Sort indexes: every song shares the "listing" partition, ordered by a
+        # key normalized at write time (see api/core/keys.py). DynamoDB only
+        # creates one GSI per table update, so on an existing table deploy
+        # these one at a time and run utilities/backfill_derived_keys.py.
+        for index_name, sort_key, sort_type in [
+            ("title-index", "title_key", dynamodb.AttributeType.STRING),
+            ("date-added-index", "date_added_ts", dynamodb.AttributeType.NUMBER),
+            ("bpm-index", "bpm_value", dynamodb.AttributeType.NUMBER),
+            # Sparse: only songs with a known duration_s are indexed
+            ("duration-index", "duration_s", dynamodb.AttributeType.NUMBER),
+            # Change feed: every write stamps a monotonic seq
+            ("changes-index", "seq", dynamodb.AttributeType.NUMBER),
+        ]:
+            self.table.add_global_secondary_index(
+                index_name=index_name,
+                partition_key=dynamodb.Attribute(
+                    name="listing",
+                    type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name=sort_key,
+                    type=sort_type
+                ),
+                projection_type=dynamodb.ProjectionType.ALL
+            )
+
+        # Index table for derived documents (artist/album aggregates and
+        # other precomputed views), keyed by a generic pk/sk pair
+        self.index_table = dynamodb.Table(
+            self, "SongsIndexTable",
+            partition_key=dynamodb.Attribute(
+                name="pk",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="sk",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            # Change-feed tombstones expire on their own
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
         # Import existing S3 bucket
         self.bucket = s3.Bucket.from_bucket_name(
             self, "SongsBucket",
@@ -37,6 +81,13 @@ class DatabaseStack(Stack):
             description="Name of the DynamoDB table"
         )
 
+        # Export index table name for other stacks to use
+        CfnOutput(
+            self, "IndexTableName",
+            value=self.index_table.table_name,
+            description="Name of the DynamoDB table holding derived documents"
+        )
+
         # Export bucket name for other stacks to use
         CfnOutput(
             self, "BucketName",
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Merge request profiles into folded stacks and render them.
+
+Reads the ``.collapsed`` (and optionally ``.pstats``) files written by the
+API's opt-in profiler (PROFILING=true), from local paths or an S3 prefix,
+and prints folded stacks (``a;b;c <count>``) for flamegraph.pl or
+speedscope. With --svg it also draws a simple flame graph itself.
+
+Usage:
+    python3 scripts/flamegraph.py /tmp/profiles/*.collapsed > api.folded
+    python3 scripts/flamegraph.py s3://bucket/profiles/ --svg api.svg
+    python3 scripts/flamegraph.py profile.pstats --pstats
+
+.pstats files only record caller/callee pairs, so stacks built from them are
+approximate: each function's time is split across its call paths in
+proportion to the calls along each path.
+"""
+
+import argparse
+import html
+import os
+import pstats
+import sys
+import tempfile
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import boto3
+
+def list_s3(uri: str) -> List[str]:
+    """Download the profiles under an s3:// prefix and return their local paths."""
+    bucket, _, prefix = uri[len('s3://'):].partition('/')
+    client = boto3.client('s3')
+    directory = tempfile.mkdtemp(prefix='profiles-')
+    paths = []
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get('Contents', []):
+            if item['Key'].endswith(('.collapsed', '.pstats')):
+                path = os.path.join(directory, os.path.basename(item['Key']))
+                client.download_file(bucket, item['Key'], path)
+                paths.append(path)
+    return paths
+
+def read_collapsed(path: str) -> Counter:
+    """Read one folded-stacks file."""
+    stacks = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+def pstats_stacks(path: str, scale: float = 1e6) -> Counter:
+    """Approximate folded stacks from a .pstats file, weighted by self time in microseconds."""
+    stats = pstats.Stats(path).stats
+    label = {func: f'{func[2]} ({os.path.basename(func[0])}:{func[1]})' for func in stats}
+    stacks = Counter()
+
+    def walk(func, path: Tuple[str, ...], share: float, seen: frozenset) -> None:
+        self_time = stats[func][2]
+        path = path + (label[func],)
+        weight = int(self_time * share * scale)
+        if weight:
+            stacks[';'.join(path)] += weight
+        for callee, (*_, callee_callers) in stats.items():
+            if func in callee_callers and callee not in seen:
+                calls_from_here = callee_callers[func][1]
+                total = sum(c[1] for c in callee_callers.values()) or 1
+                walk(callee, path, share * calls_from_here / total, seen | {callee})
+
+    roots = [func for func, entry in stats.items() if not entry[4]]
+    for root in roots:
+        walk(root, (), 1.0, frozenset({root}))
+    return stacks
+
+def merge(paths: Iterable[str], include_pstats: bool = False) -> Counter:
+    """Merge the folded stacks of every profile."""
+    stacks = Counter()
+    for path in paths:
+        if path.endswith('.collapsed'):
+            stacks.update(read_collapsed(path))
+        elif include_pstats and path.endswith('.pstats'):
+            stacks.update(pstats_stacks(path))
+    return stacks
+
+def render_svg(stacks: Counter, width: int = 1200, row: int = 16) -> str:
+    """Draw the stacks as a flame graph: one row per depth, widths proportional to samples."""
+    tree: Dict = {}
+    for stack, count in stacks.items():
+        node = tree
+        for frame in stack.split(';'):
+            child = node.setdefault(frame, {'count': 0, 'children': {}})
+            child['count'] += count
+            node = child['children']
+    total = sum(stacks.values()) or 1
+    depth_of = max((stack.count(';') + 1 for stack in stacks), default=1)
+    height = (depth_of + 1) * row
+    rects = []
+
+    def draw(nodes: Dict, x: float, depth: int) -> None:
+        for frame, node in sorted(nodes.items()):
+            w = width * node['count'] / total
+            if w >= 0.5:
+                y = height - (depth + 1) * row
+                hue = 20 + zlib.crc32(frame.encode()) % 40
+                title = html.escape(f"{frame} ({node['count']} samples, {100 * node['count'] / total:.1f}%)")
+                text = html.escape(frame[:int(w / 7)]) if w > 21 else ''
+                rects.append(
+                    f'<g><title>{title}</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" '
+                    f'fill="hsl({hue},90%,60%)"/><text x="{x + 2:.1f}" y="{y + row - 4}">{text}</text></g>')
+                draw(node['children'], x, depth + 1)
+            x += w
+
+    draw(tree, 0.0, 0)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'font-family="monospace" font-size="11">\n' + '\n'.join(rects) + '\n</svg>\n')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help="Profile files, directories or s3://bucket/prefix")
+    parser.add_argument('--pstats', action='store_true', help="Also turn .pstats files into approximate stacks")
+    parser.add_argument('--svg', help="Also write a flame graph to this SVG file")
+    args = parser.parse_args()
+
+    paths = []
+    for source in args.inputs:
+        if source.startswith('s3://'):
+            paths.extend(list_s3(source))
+        elif os.path.isdir(source):
+            paths.extend(os.path.join(source, name) for name in sorted(os.listdir(source)))
+        else:
+            paths.append(source)
+    stacks = merge(paths, args.pstats)
+    if not stacks:
+        print("No stacks found", file=sys.stderr)
+        sys.exit(1)
+    for stack, count in sorted(stacks.items()):
+        print(f'{stack} {count}')
+    if args.svg:
+        with open(args.svg, 'w') as f:
+            f.write(render_svg(stacks))
+        print(f"Wrote {args.svg}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
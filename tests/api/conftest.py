@@ -31,6 +31,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'api'))
 
 # Set up test environment variables
 os.environ['DYNAMODB_TABLE_NAME'] = 'test-songs-table'
+os.environ['INDEX_TABLE_NAME'] = 'test-index-table'
 os.environ['S3_BUCKET'] = 'test-bucket'
 
 @pytest.fixture
@@ -73,7 +74,7 @@ def client():
     """
     from api.app import lambda_handler
     
-    def invoke(method, path, body=None):
+    def invoke(method, path, body=None, query_params=None):
         """
         Simulate an API Gateway call.
         
@@ -81,6 +82,7 @@ def client():
             method (str): HTTP method (GET, POST, etc.)
             path (str): API path
             body (dict, optional): Request body
+            query_params (dict, optional): Query string parameters
             
         Returns:
             dict: Response from the lambda_handler
@@ -92,12 +94,26 @@ def client():
                     'path': path
                 }
             },
-            'body': json.dumps(body) if body else None
+            'body': json.dumps(body) if body else None,
+            'queryStringParameters': query_params
         }
         return lambda_handler(event, None)
     
     return invoke
 
+@pytest.fixture(autouse=True)
+def reset_search_index():
+    """
+    Clear the sandbox-wide search index between tests.
+    
+    The index lives at module level in app.py so warm invocations can reuse
+    it; without this, songs from one test's mock table would leak into the next.
+    """
+    from api.app import search_index
+    search_index.clear()
+    yield
+    search_index.clear()
+
 @pytest.fixture
 def mock_dynamodb():
     """
@@ -122,9 +138,51 @@ def mock_dynamodb():
                 {'AttributeName': 'song_id', 'KeyType': 'HASH'}
             ],
             AttributeDefinitions=[
-                {'AttributeName': 'song_id', 'AttributeType': 'S'}
+                {'AttributeName': 'song_id', 'AttributeType': 'S'},
+                {'AttributeName': 'listing', 'AttributeType': 'S'},
+                {'AttributeName': 'title_key', 'AttributeType': 'S'},
+                {'AttributeName': 'date_added_ts', 'AttributeType': 'N'},
+                {'AttributeName': 'bpm_value', 'AttributeType': 'N'},
+                {'AttributeName': 'duration_s', 'AttributeType': 'N'},
+                {'AttributeName': 'seq', 'AttributeType': 'N'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': index_name,
+                    'KeySchema': [
+                        {'AttributeName': 'listing', 'KeyType': 'HASH'},
+                        {'AttributeName': sort_key, 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+                for index_name, sort_key in [
+                    ('title-index', 'title_key'),
+                    ('date-added-index', 'date_added_ts'),
+                    ('bpm-index', 'bpm_value'),
+                    ('duration-index', 'duration_s'),
+                    ('changes-index', 'seq')
+                ]
             ],
             BillingMode='PAY_PER_REQUEST'
         )
         
-        yield table 
\ No newline at end of file
+        # Create the index table for derived documents (aggregates etc.)
+        dynamodb.create_table(
+            TableName='test-index-table',
+            KeySchema=[
+                {'AttributeName': 'pk', 'KeyType': 'HASH'},
+                {'AttributeName': 'sk', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'pk', 'AttributeType': 'S'},
+                {'AttributeName': 'sk', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        
+        yield table
+
+@pytest.fixture
+def index_table(mock_dynamodb):
+    """Return the mock index table created alongside the songs table."""
+    return boto3.resource('dynamodb').Table('test-index-table') 
\ No newline at end of file
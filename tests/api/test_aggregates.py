@@ -0,0 +1,119 @@
+"""
+Tests for precomputed artist and album aggregates.
+
+These tests verify that:
+1. Creates, updates and deletes keep the aggregates in step, in the song's own transaction
+2. The artist and album routes answer from the aggregates
+3. The repair job detects and fixes drift
+"""
+
+import json
+import pytest
+from boto3.dynamodb.conditions import Key
+from api.core.aggregates import AggregateStore, album_id_for, slugify
+from api.core.api import SongsApi
+from api.core.keys import new_song_keys
+from api.core.scans import parallel_scan
+from api.core.transactions import TransactionCancelled
+
+def test_slugify():
+    """Test display names become stable slugs."""
+    assert slugify('Don Augustín de Rivas') == 'don-augustin-de-rivas'
+    assert slugify('') == 'unknown'
+    assert album_id_for('Virginia', 'Virginia Canta') == 'virginia--virginia-canta'
+    assert album_id_for('Virginia', None) is None
+
+def test_aggregates_follow_writes(mock_dynamodb, index_table, test_song):
+    """Test counts and groupings through create, update and delete."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    first = api.create_song(dict(test_song, artist='Virginia', album='Virginia Canta'))
+    second = api.create_song(dict(test_song, artist='Virginia', album='Virginia Canta'))
+    single = api.create_song(dict(test_song, artist='Virginia', album=None))
+
+    artist = api.get_artist('virginia')
+    assert artist['name'] == 'Virginia'
+    assert artist['song_count'] == 3
+    assert [(a['album_id'], a['song_count']) for a in artist['albums']] == [('virginia--virginia-canta', 2)]
+
+    album = api.get_album('virginia--virginia-canta')
+    assert album['song_ids'] == sorted([first['song_id'], second['song_id']])
+
+    api.update_song(second['song_id'], dict(test_song, artist='Muse', album='Muse'))
+    assert api.get_artist('virginia')['song_count'] == 2
+    assert api.get_album('virginia--virginia-canta')['song_count'] == 1
+    assert api.get_album('muse--muse')['song_ids'] == [second['song_id']]
+
+    api.delete_song(second['song_id'])
+    assert api.get_artist('muse') is None
+    assert api.get_album('muse--muse') is None
+    assert api.list_artists()['items'] == [
+        {'slug': 'virginia', 'name': 'Virginia', 'song_count': 2, 'album_count': 1}
+    ]
+    api.delete_song(single['song_id'])
+    assert api.get_artist('virginia')['song_count'] == 1
+
+def test_counters_are_small_items(mock_dynamodb, index_table, test_song):
+    """Test each artist and album has its own counter, and emptied ones are skipped."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    song = api.create_song(dict(test_song, artist='Muse', album='Muse'))
+    api.create_song(dict(test_song, artist='Virginia', album=None))
+    counters = index_table.query(KeyConditionExpression=Key('pk').eq('ARTISTS'))['Items']
+    assert sorted((item['sk'], item['song_count']) for item in counters) == [
+        ('ALBUM#muse--muse', 1), ('ARTIST#muse', 1), ('ARTIST#virginia', 1)
+    ]
+
+    api.delete_song(song['song_id'])
+    assert [artist['slug'] for artist in api.list_artists()['items']] == ['virginia']
+
+def test_failed_write_leaves_aggregates(mock_dynamodb, index_table, test_song):
+    """Test aggregates only change when the song write itself commits."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    song = api.create_song(dict(test_song, artist='Muse', album='Muse'))
+    duplicate = dict(test_song, artist='Virginia', album='Virginia Canta', song_id=song['song_id'])
+    with pytest.raises(TransactionCancelled):
+        api.store.create({**duplicate, **new_song_keys(duplicate)})
+    assert api.get_artist('virginia') is None
+    assert api.get_album('virginia--virginia-canta') is None
+    assert [artist['slug'] for artist in api.list_artists()['items']] == ['muse']
+
+def test_rebuild_reports_and_fixes_drift(mock_dynamodb, index_table, test_song):
+    """Test the repair job finds missing, stale and orphaned items."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    api.create_song(dict(test_song, artist='Muse', album='Muse'))
+    # Written behind the API's back, so no aggregates exist for it
+    mock_dynamodb.put_item(Item={'song_id': 'raw', 'title': 'Raw', 'artist': 'Virginia',
+                                 's3_uri': 's3://ourchants-songs/raw.mp3'})
+    index_table.put_item(Item={'pk': 'ARTISTS', 'sk': 'ARTIST#muse', 'name': 'Muse', 'slug': 'muse',
+                               'song_count': 3})
+    index_table.put_item(Item={'pk': 'ARTIST#ghost', 'sk': 'SONG#gone', 'artist': 'Ghost'})
+
+    store = AggregateStore(index_table)
+    report = store.rebuild(parallel_scan(mock_dynamodb, total_segments=2), dry_run=True)
+    assert report['missing'] == ['ARTIST#virginia/SONG#raw', 'ARTISTS/ARTIST#virginia']
+    assert report['stale'] == ['ARTISTS/ARTIST#muse']
+    assert report['orphaned'] == ['ARTIST#ghost/SONG#gone']
+    assert report['drift'] == 4
+
+    store.rebuild(parallel_scan(mock_dynamodb, total_segments=2))
+    assert store.rebuild(parallel_scan(mock_dynamodb), dry_run=True)['drift'] == 0
+    assert api.get_artist('virginia')['song_ids'] == ['raw']
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_artist_and_album_routes(client, test_song):
+    """Test GET /artists, /artists/{slug} and /albums/{id}."""
+    client('POST', '/songs', dict(test_song, artist='Muse', album='Muse'))
+
+    response = client('GET', '/artists')
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['items'][0]['slug'] == 'muse'
+
+    response = client('GET', '/artists/muse')
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['albums'][0]['album_id'] == 'muse--muse'
+
+    response = client('GET', '/albums/muse--muse')
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['song_count'] == 1
+
+    assert client('GET', '/artists/nobody')['statusCode'] == 404
+    assert client('GET', '/albums/nobody--nothing')['statusCode'] == 404
@@ -0,0 +1,100 @@
+"""
+Tests for the ASGI adapter.
+
+These tests verify that:
+1. HTTP requests become the API Gateway events the handler already serves
+2. Requests and responses round-trip through the same router and SongsApi
+3. The adapter warms up on lifespan startup and sheds load past its limit
+"""
+
+import asyncio
+import json
+import pytest
+from api.asgi import SongsAsgi, to_event
+
+def _scope(method, path, query=b'', headers=()):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query, 'headers': [(b'host', b'testserver'), *headers],
+        'client': ('198.51.100.7', 50000), 'server': ('testserver', 80),
+    }
+
+def _request(app, method, path, body=None, query=b'', headers=()):
+    """Send one request through the app; return status, headers and parsed body."""
+    chunks = [json.dumps(body).encode()[:5], json.dumps(body).encode()[5:]] if body is not None else [b'']
+    incoming = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    messages = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(_scope(method, path, query, headers), receive, send))
+    start, end = messages
+    content = end['body']
+    assert int(dict(start['headers'])[b'content-length']) == len(content)
+    return start['status'], dict(start['headers']), json.loads(content) if content else None
+
+@pytest.fixture
+def app():
+    app = SongsAsgi(threads=2, warm_up=False)
+    yield app
+    app.executor.shutdown()
+
+def test_to_event():
+    """Test an ASGI scope maps onto an API Gateway v2 event, with repeated names joined."""
+    event = to_event(_scope('GET', '/songs', b'limit=5&sort=title&x=1&x=2',
+                            [(b'X-Server-Timing', b'1'), (b'Accept', b'a'), (b'accept', b'b')]), b'')
+    assert event['requestContext']['http']['method'] == 'GET'
+    assert event['requestContext']['http']['path'] == '/songs'
+    assert event['requestContext']['http']['sourceIp'] == '198.51.100.7'
+    assert event['queryStringParameters'] == {'limit': '5', 'sort': 'title', 'x': '1,2'}
+    assert event['headers']['x-server-timing'] == '1' and event['headers']['accept'] == 'a,b'
+    assert event['body'] is None
+    assert to_event(_scope('GET', '/songs'), b'')['queryStringParameters'] is None
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_round_trip(app, test_song):
+    """Test create, read and delete through the adapter, with a chunked request body."""
+    status, _, created = _request(app, 'POST', '/songs', test_song)
+    assert status == 201 and created['title'] == test_song['title']
+
+    status, headers, song = _request(app, 'GET', f"/songs/{created['song_id']}",
+                                     headers=[(b'x-server-timing', b'1')])
+    assert status == 200 and song['song_id'] == created['song_id']
+    assert b'Server-Timing' in headers
+
+    status, _, page = _request(app, 'GET', '/songs', query=b'limit=1')
+    assert status == 200 and len(page['items']) == 1
+
+    assert _request(app, 'DELETE', f"/songs/{created['song_id']}")[0] == 204
+    assert _request(app, 'GET', f"/songs/{created['song_id']}")[0] == 404
+
+def test_sheds_load_past_the_limit(app):
+    """Test requests beyond max_pending get a 503 without reaching the handler."""
+    app.pending = app.max_pending
+    status, headers, body = _request(app, 'GET', '/songs')
+    assert status == 503 and body['code'] == 'SERVICE_UNAVAILABLE'
+    assert headers[b'Retry-After'] == b'1'
+
+def test_lifespan_warms_up(monkeypatch):
+    """Test startup warms the pooled clients and caches, and shutdown stops the pool."""
+    warmed = []
+    monkeypatch.setattr(SongsAsgi, '_warm_up', lambda self: warmed.append(True))
+    app = SongsAsgi(threads=1)
+    incoming = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(app({'type': 'lifespan', 'asgi': {'version': '3.0'}}, receive, send))
+    assert warmed == [True]
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
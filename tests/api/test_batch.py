@@ -0,0 +1,92 @@
+"""
+Tests for POST /batch.
+
+These tests verify that:
+1. Sub-requests go through the same router and come back in order
+2. Malformed, nested and oversized batches are rejected
+3. Reads run concurrently and slow ones time out on their own
+4. Writes are never abandoned: a slow write finishes, later ones are not started
+"""
+
+import json
+import time
+import pytest
+
+def _batch(client, requests):
+    response = client('POST', '/batch', {'requests': requests})
+    return response['statusCode'], json.loads(response['body'])
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_batch_routes_in_order(client, test_song):
+    """Test reads, writes and errors come back in request order."""
+    created = json.loads(client('POST', '/songs', test_song)['body'])
+    status, body = _batch(client, [
+        {'method': 'GET', 'path': '/songs?limit=5'},
+        {'method': 'GET', 'path': f"/songs/{created['song_id']}"},
+        {'method': 'GET', 'path': '/songs/missing'},
+        {'method': 'GET', 'path': '/songs', 'query': {'sort': 'nope'}},
+        {'method': 'POST', 'path': '/songs', 'body': dict(test_song, title='Second')},
+    ])
+    assert status == 200
+    responses = body['responses']
+    assert [r['status'] for r in responses] == [200, 200, 404, 400, 201]
+    assert [song['song_id'] for song in responses[0]['body']['items']] == [created['song_id']]
+    assert responses[1]['body']['title'] == 'Test Song'
+    assert responses[3]['body']['code'] == 'INVALID_SORT'
+    assert responses[4]['body']['title'] == 'Second'
+
+@pytest.mark.parametrize('requests, reason', [
+    ([], "non-empty"),
+    ([{'method': 'GET', 'path': '/batch'}], "nested"),
+    ([{'method': 'PATCH', 'path': '/songs'}], "method"),
+    ([{'method': 'GET', 'path': 'songs'}], "path"),
+    ([{'method': 'GET', 'path': '/songs', 'query': {'limit': 5}}], "query"),
+    ([{'method': 'GET', 'path': '/songs'}] * 11, "at most 10"),
+])
+def test_invalid_batches(client, requests, reason):
+    """Test malformed batches are rejected as a whole."""
+    status, body = _batch(client, requests)
+    assert status == 400 and body['code'] == 'INVALID_BATCH'
+    assert reason in body['details']['reason']
+
+def test_batch_runs_concurrently_with_time_limit(monkeypatch, client):
+    """Test sub-requests overlap and only the slow one times out."""
+    import api.app
+
+    def slow_route(api, s3_client, method, path, query_params, body):
+        time.sleep(float(query_params['sleep']))
+        return {'statusCode': 200, 'headers': {}, 'body': json.dumps({'slept': query_params['sleep']})}
+
+    monkeypatch.setattr(api.app, 'route', slow_route)
+    monkeypatch.setattr(api.app, 'BATCH_TIMEOUT_SECONDS', 0.5)
+    start = time.monotonic()
+    status, body = _batch(client, [{'path': f'/songs?sleep={s}'} for s in ('0.2', '0.2', '0.2', '2')])
+    elapsed = time.monotonic() - start
+    assert status == 200
+    assert [r['status'] for r in body['responses']] == [200, 200, 200, 504]
+    assert body['responses'][3]['body']['code'] == 'BATCH_TIMEOUT'
+    assert elapsed < 1
+
+def test_slow_write_is_not_abandoned(monkeypatch, client):
+    """Test a write running past the time limit reports its outcome, and later writes are not started."""
+    import api.app
+    started, finished = [], []
+
+    def slow_route(api, s3_client, method, path, query_params, body):
+        started.append((method, path))
+        time.sleep(float(query_params.get('sleep', 0)))
+        finished.append((method, path))
+        return {'statusCode': 200, 'headers': {}, 'body': json.dumps({'path': path})}
+
+    monkeypatch.setattr(api.app, 'route', slow_route)
+    monkeypatch.setattr(api.app, 'BATCH_TIMEOUT_SECONDS', 0.2)
+    status, body = _batch(client, [
+        {'method': 'PUT', 'path': '/songs/a?sleep=0.4'},
+        {'method': 'GET', 'path': '/songs/b'},
+        {'method': 'DELETE', 'path': '/songs/c'},
+    ])
+    assert status == 200
+    assert [r['status'] for r in body['responses']] == [200, 200, 504]
+    assert body['responses'][0]['body'] == {'path': '/songs/a'}
+    assert body['responses'][2]['body']['code'] == 'BATCH_TIMEOUT'
+    assert ('PUT', '/songs/a') in finished and ('DELETE', '/songs/c') not in started
@@ -0,0 +1,70 @@
+"""
+Tests for consumed-capacity accounting.
+
+These tests verify that:
+1. Capacity is requested and collected only while a collector is current
+2. The handler emits capacity per route and per operation
+3. The offline report turns those lines into cost per 1,000 requests
+"""
+
+import json
+import os
+import boto3
+import pytest
+import api.app
+from api.core.capacity import ConsumedCapacity, instrument, metering
+from utilities.capacity_report import aggregate, parse_documents
+
+@pytest.fixture
+def emf(monkeypatch):
+    """EMF enabled, with clients created inside each test's mocks."""
+    monkeypatch.setattr(api.app, 'EMF_METRICS', True)
+    monkeypatch.setattr(api.app, '_aws_clients', None)
+
+def test_collector_totals():
+    """Test single and batched responses add up per operation and per read/write."""
+    capacity = ConsumedCapacity()
+    capacity.add('Query', {'TableName': 'songs', 'CapacityUnits': 0.5})
+    capacity.add('Query', {'TableName': 'songs', 'CapacityUnits': 1.0})
+    capacity.add('TransactWriteItems', [{'CapacityUnits': 2.0}, {'CapacityUnits': 2.0}])
+    assert capacity.operations() == {'Query': {'units': 1.5, 'calls': 2},
+                                     'TransactWriteItems': {'units': 4.0, 'calls': 1}}
+    assert capacity.read_units() == 1.5 and capacity.write_units() == 4.0
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_capacity_requested_only_while_metering():
+    """Test table operations ask for capacity only inside ``metering``."""
+    client = instrument(boto3.client('dynamodb', region_name='us-east-1'))
+    key = {'song_id': {'S': 'missing'}}
+    table_name = os.environ['DYNAMODB_TABLE_NAME']
+    assert 'ConsumedCapacity' not in client.get_item(TableName=table_name, Key=key)
+
+    capacity = ConsumedCapacity()
+    with metering(capacity):
+        client.get_item(TableName=table_name, Key=key)
+        client.describe_table(TableName=table_name)
+    assert capacity.operations() == {'GetItem': {'units': 0.5, 'calls': 1}}
+
+@pytest.mark.usefixtures('mock_dynamodb', 'emf')
+def test_capacity_per_route_and_report(client, capsys, test_song):
+    """Test routes are charged for their own operations, and the report prices them."""
+    created = json.loads(client('POST', '/songs', test_song)['body'])
+    client('GET', '/songs')
+    client('POST', '/batch', {'requests': [{'path': f"/songs/{created['song_id']}"}] * 2})
+    lines = capsys.readouterr().out.splitlines()
+    documents = list(parse_documents(f'2026-01-01T00:00:00Z\trequest-id\t{line}' for line in lines))
+
+    routes = {d['Route']: d for d in documents if 'ReadCapacityUnits' in d}
+    assert routes['POST /songs']['WriteCapacityUnits'] > 0
+    assert routes['GET /songs']['ReadCapacityUnits'] > 0
+    assert routes['GET /songs/{song_id}']['Requests'] == 2
+    assert routes['POST /batch']['ReadCapacityUnits'] == 0
+    operations = {(d['Route'], d['Operation']) for d in documents if 'Operation' in d}
+    assert ('GET /songs', 'Scan') in operations and ('GET /songs/{song_id}', 'GetItem') in operations
+
+    report = aggregate(documents, read_price=0.25, write_price=1.25)
+    get = report['GET /songs/{song_id}']
+    assert get['read_units_per_1k'] == 1000 * get['read_units'] / 2
+    assert get['usd_per_1k'] == round(get['read_units_per_1k'] * 0.25 / 1e6, 6)
+    assert list(get['operations']) == ['GetItem']
+    assert list(report)[0] == 'POST /songs'
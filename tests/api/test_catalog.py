@@ -0,0 +1,139 @@
+"""
+Tests for the in-memory columnar catalog.
+
+These tests verify that:
+1. A snapshot gives back exactly the items it was loaded from
+2. Pages served from memory match the DynamoDB indexes, with exact totals
+3. The snapshot is reloaded in the background when the change feed's sequence
+   moves on, and a reload never shows a half-built snapshot or replaces a newer one
+"""
+
+import pytest
+from decimal import Decimal
+from api.core.api import SongsApi
+from api.core.catalog import ColumnarCatalog
+from api.core.keys import parse_range_filters
+
+def _all_pages(api, **kwargs):
+    ids, cursor = [], None
+    while True:
+        page = api.list_songs(limit=3, cursor=cursor, **kwargs)
+        ids.extend(song['song_id'] for song in page['items'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            return ids, page['total']
+
+@pytest.fixture
+def catalog_songs(mock_dynamodb, index_table, test_song):
+    api = SongsApi(mock_dynamodb, index_table=index_table, changes_settle_seconds=0)
+    for i, (bpm, duration) in enumerate([(90, 240), (120, 180), ('', 300), (72, None),
+                                         (140, 150), (101, 420), (128, 200)]):
+        song = dict(test_song, title=f'Hino {chr(ord("g") - i)}', bpm=str(bpm),
+                    date=f'2024-03-{10 + i} 12:00:00', lineage=['Santo Daime'] if i % 2 else ['Shipibo'])
+        song.pop('song_id')
+        if duration is not None:
+            song['duration_s'] = duration
+        api.create_song(song)
+    return api
+
+def test_materialize_round_trip():
+    """Test rows come back as the stored items, missing and None attributes included."""
+    items = [
+        {'song_id': 'b', 'title': 'B', 'artist': None, 'lineage': ['Shipibo', 'Santo Daime'],
+         'bpm_value': Decimal('96.5'), 'duration_s': Decimal('200'), 'date_added_ts': Decimal('1700000000')},
+        {'song_id': 'a', 'title': 'A', 'lineage': None},
+        {'song_id': 'c', 'title': 'C', 'lineage': []},
+    ]
+    catalog = ColumnarCatalog()
+    catalog.load(items, version=3)
+    songs, total = catalog.query(limit=10)
+    assert total == 3 and catalog.version == 3
+    assert songs == sorted(items, key=lambda item: item['song_id'])
+    assert catalog.query(lineage='santo-daime')[0][0]['song_id'] == 'b'
+    assert catalog.query(lineage='umbanda') == ([], 0)
+
+@pytest.mark.parametrize('sort, params', [
+    ('title', {}),
+    ('-date_added', {}),
+    ('-bpm', {}),
+    (None, {'bpm_min': '100'}),
+    ('-bpm', {'bpm_max': '130', 'duration_min': '190'}),
+    (None, {'duration_min': '180', 'duration_max': '300'}),
+])
+def test_pages_match_indexes(catalog_songs, mock_dynamodb, index_table, sort, params):
+    """Test memory pages follow the DynamoDB index order, with exact totals."""
+    filters = parse_range_filters(params)
+    expected, _ = _all_pages(catalog_songs, sort=sort, filters=filters)
+    memory = SongsApi(mock_dynamodb, index_table=index_table, changes_settle_seconds=0,
+                      catalog=ColumnarCatalog())
+    ids, total = _all_pages(memory, sort=sort, filters=filters)
+    assert ids == expected
+    assert total == len(expected)
+
+def test_lineage_pages(catalog_songs, mock_dynamodb, index_table):
+    """Test lineage pages from memory cover the same songs as the fan-out index."""
+    expected, _ = _all_pages(catalog_songs, lineage='Santo Daime')
+    memory = SongsApi(mock_dynamodb, index_table=index_table, catalog=ColumnarCatalog())
+    ids, total = _all_pages(memory, lineage='santo-daime')
+    assert ids == sorted(expected) and total == 3
+
+def _reloaded(catalog):
+    """Wait for a background reload to finish."""
+    with catalog.reload_lock:
+        pass
+
+def test_reloads_when_version_moves(mock_dynamodb, index_table, test_song):
+    """Test writes invalidate the snapshot and unsettled snapshots are retaken in the background."""
+    catalog = ColumnarCatalog()
+    api = SongsApi(mock_dynamodb, index_table=index_table, changes_settle_seconds=0, catalog=catalog)
+    api.create_song(test_song)
+    assert api.list_songs(limit=5)['total'] == 1
+    loaded_at = catalog.loaded_at
+
+    assert api.list_songs(limit=5)['total'] == 1
+    assert catalog.loaded_at == loaded_at
+
+    # The request that finds the snapshot stale is answered from it and starts the reload
+    api.create_song(dict(test_song, song_id='second'))
+    assert api.list_songs(limit=5)['total'] == 1
+    _reloaded(catalog)
+    assert api.list_songs(limit=5)['total'] == 2
+    assert catalog.version == api.changes.current_sequence()[0]
+
+    catalog.loaded_at = 0
+    api.list_songs(limit=5)
+    _reloaded(catalog)
+    assert catalog.loaded_at > loaded_at
+
+def test_known_ids_see_a_current_snapshot(mock_dynamodb, index_table, test_song):
+    """Test the song ID filter is never rebuilt from a snapshot that misses a write."""
+    catalog = ColumnarCatalog()
+    api = SongsApi(mock_dynamodb, index_table=index_table, changes_settle_seconds=0, catalog=catalog)
+    first = api.create_song(test_song)['song_id']
+    api.list_songs(limit=5)
+    second = api.create_song(test_song)['song_id']
+    assert set(api._song_ids()) == {first, second}
+    assert catalog.version == api.changes.current_sequence()[0]
+
+def test_reload_swaps_whole_snapshots():
+    """Test queries see the old snapshot until a reload is complete, and an overtaken reload is dropped."""
+    catalog = ColumnarCatalog()
+    catalog.load([{'song_id': 'a', 'title': 'A'}], version=1)
+
+    def scan():
+        yield {'song_id': 'b', 'title': 'B'}
+        assert catalog.query(limit=10) == ([{'song_id': 'a', 'title': 'A'}], 1)
+        # Another request starts its reload later and finishes first
+        catalog.load([{'song_id': 'c', 'title': 'C'}], version=3)
+
+    catalog.load(scan(), version=2)
+    assert catalog.song_ids() == ['c'] and catalog.version == 3
+
+def test_offset_cursor_needs_catalog(mock_dynamodb, index_table, test_song):
+    """Test an in-memory cursor is rejected once no catalog serves it."""
+    memory = SongsApi(mock_dynamodb, index_table=index_table, catalog=ColumnarCatalog())
+    for i in range(3):
+        memory.create_song(dict(test_song, song_id=f'song-{i}'))
+    cursor = memory.list_songs(limit=2)['next_cursor']
+    with pytest.raises(ValueError):
+        SongsApi(mock_dynamodb, index_table=index_table).list_songs(limit=2, cursor=cursor)
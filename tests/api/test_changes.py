@@ -0,0 +1,116 @@
+"""
+Tests for the change feed.
+
+These tests verify that:
+1. Writes are stamped with increasing sequence numbers and deletes leave tombstones
+2. A sync token returns only what changed since, page by page
+3. Unsettled, malformed and expired tokens are handled
+"""
+
+import json
+import time
+import pytest
+from api.core.api import SongsApi
+from api.core.changes import ChangeFeed, SyncTokenExpired, decode_token, encode_token
+
+def test_token_round_trip():
+    """Test sync tokens are opaque and reject garbage."""
+    assert decode_token(encode_token(42, 1700000000)) == (42, 1700000000)
+    with pytest.raises(ValueError):
+        decode_token('not-a-token')
+
+def test_changes_since_token(mock_dynamodb, index_table, test_song):
+    """Test a client sees creates, updates and deletes since its token."""
+    api = SongsApi(mock_dynamodb, index_table=index_table, changes_settle_seconds=0)
+    first = api.create_song(dict(test_song, title='First'))
+    second = api.create_song(dict(test_song, title='Second'))
+
+    initial = api.list_changes()
+    assert [c['song']['title'] for c in initial['changes']] == ['First', 'Second']
+    assert 'seq' not in initial['changes'][0]['song']
+
+    api.update_song(first['song_id'], dict(test_song, title='First (live)'))
+    api.delete_song(second['song_id'])
+    third = api.create_song(dict(test_song, title='Third'))
+
+    changes, token = [], initial['next_token']
+    while True:
+        page = api.list_changes(token, limit=2)
+        changes.extend(page['changes'])
+        token = page['next_token']
+        if not page['has_more']:
+            break
+    assert [(c['type'], c.get('song', {}).get('title'), c.get('song_id')) for c in changes] == [
+        ('upserted', 'First (live)', None),
+        ('deleted', None, second['song_id']),
+        ('upserted', 'Third', None),
+    ]
+    assert third['song_id'] == changes[-1]['song']['song_id']
+    assert api.list_changes(token)['changes'] == []
+
+def test_unsettled_changes_wait(mock_dynamodb, index_table, test_song):
+    """Test changes younger than the settle window are held back."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    api.create_song(test_song)
+    page = api.list_changes()
+    assert page['changes'] == [] and page['has_more'] is False
+
+    feed = ChangeFeed(index_table)
+    page = feed.changes(mock_dynamodb, page['next_token'], now=time.time() + 60)
+    assert len(page['changes']) == 1
+
+def test_expired_token(index_table, mock_dynamodb):
+    """Test a token older than the tombstone TTL forces a full download."""
+    feed = ChangeFeed(index_table, tombstone_ttl=3600)
+    with pytest.raises(SyncTokenExpired):
+        feed.changes(mock_dynamodb, encode_token(5, time.time() - 7200))
+
+def test_old_catalog_token_is_accepted(mock_dynamodb, index_table, test_song):
+    """Test a full download of songs older than the tombstone TTL hands back a usable token."""
+    api = SongsApi(mock_dynamodb, index_table=index_table, changes_settle_seconds=0)
+    songs = [api.create_song(dict(test_song, title=f'Hino {i}')) for i in range(3)]
+    backdated = int(time.time()) - 40 * 24 * 3600
+    for song in songs:
+        mock_dynamodb.update_item(Key={'song_id': song['song_id']}, UpdateExpression='SET updated_at = :ts',
+                                  ExpressionAttributeValues={':ts': backdated})
+
+    titles, token = [], None
+    while True:
+        page = api.list_changes(token, limit=2)
+        titles.extend(c['song']['title'] for c in page['changes'])
+        token = page['next_token']
+        if not page['has_more']:
+            break
+    assert titles == ['Hino 0', 'Hino 1', 'Hino 2']
+    assert api.list_changes(token)['changes'] == []
+
+def test_token_waits_on_pending_tombstones(index_table, mock_dynamodb):
+    """Test a token is stamped with the oldest tombstone it has yet to serve."""
+    feed = ChangeFeed(index_table, settle_seconds=0)
+    now = int(time.time())
+    assert feed._issued_at([('deleted', {'updated_at': now - 100, 'expires_at': now + 10})], {}, now) == now - 100
+    # Past its TTL, a tombstone may vanish whether or not the token waits for it
+    assert feed._issued_at([('deleted', {'updated_at': now - 100, 'expires_at': now - 1})], {}, now) == now
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_changes_route(client, test_song, monkeypatch):
+    """Test GET /songs/changes and its error codes."""
+    monkeypatch.setattr('api.app.CHANGES_SETTLE_SECONDS', 0)
+    client('POST', '/songs', test_song)
+
+    response = client('GET', '/songs/changes')
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert len(body['changes']) == 1
+    assert body['next_token']
+
+    response = client('GET', '/songs/changes', query_params={'since': body['next_token']})
+    assert json.loads(response['body'])['changes'] == []
+
+    response = client('GET', '/songs/changes', query_params={'since': '%%%'})
+    assert json.loads(response['body'])['code'] == 'INVALID_TOKEN'
+
+    expired = encode_token(1, 0)
+    response = client('GET', '/songs/changes', query_params={'since': expired})
+    assert response['statusCode'] == 410
+    assert json.loads(response['body'])['code'] == 'SYNC_TOKEN_EXPIRED'
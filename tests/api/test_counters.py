@@ -0,0 +1,75 @@
+"""
+Tests for maintained catalog counters.
+
+These tests verify that:
+1. Counters move in the same transaction as song writes
+2. List responses report total from the counter
+3. Reconciliation corrects drift, including from the scheduled event
+"""
+
+import json
+import pytest
+from api.app import lambda_handler
+from api.core.api import SongsApi
+from api.core.counters import CounterStore, counter_deltas
+
+def test_counter_deltas():
+    """Test only the counters that change are adjusted."""
+    old = {'artist': 'Muse', 'lineage': ['Santo Daime']}
+    new = {'artist': 'Muse', 'lineage': ['Santo Daime', 'Shipibo']}
+    assert counter_deltas(None, old) == {'catalog': 1, 'artist#muse': 1, 'lineage#santo-daime': 1}
+    assert counter_deltas(old, new) == {'lineage#shipibo': 1}
+    assert counter_deltas(new, None) == {
+        'catalog': -1, 'artist#muse': -1, 'lineage#santo-daime': -1, 'lineage#shipibo': -1
+    }
+
+def test_counters_follow_writes(mock_dynamodb, index_table, test_song):
+    """Test create, update and delete keep the counters exact."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    counters = CounterStore(index_table)
+    first = api.create_song(dict(test_song, artist='Muse', lineage=['Shipibo']))
+    api.create_song(dict(test_song, artist='Muse'))
+    assert counters.get() == 2
+    assert counters.get('artist#muse') == 2
+    assert counters.get('lineage#shipibo') == 1
+
+    api.update_song(first['song_id'], dict(test_song, artist='Virginia', lineage=[]))
+    assert counters.get('artist#muse') == 1
+    assert counters.get('artist#virginia') == 1
+    assert counters.get('lineage#shipibo') == 0
+
+    api.delete_song(first['song_id'])
+    api.delete_song(first['song_id'])
+    assert counters.get() == 1
+    assert api.list_songs(limit=5)['total'] == 1
+    assert api.list_songs()['total'] == 1
+
+def test_reconcile_counters(mock_dynamodb, index_table, test_song):
+    """Test reconciliation fixes counters that drifted."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    api.create_song(dict(test_song, artist='Muse'))
+    index_table.put_item(Item={'pk': 'COUNTER', 'sk': 'catalog', 'count': 7})
+    index_table.put_item(Item={'pk': 'COUNTER', 'sk': 'artist#ghost', 'count': 2})
+
+    report = api.reconcile_counters(dry_run=True)
+    assert report['corrected'] == {
+        'artist#ghost': {'stored': 2, 'expected': 0},
+        'catalog': {'stored': 7, 'expected': 1},
+    }
+    api.reconcile_counters()
+    assert api.reconcile_counters()['corrected'] == {}
+    assert CounterStore(index_table).get() == 1
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_scheduled_reconciliation(client, index_table, test_song):
+    """Test the EventBridge maintenance event runs reconciliation."""
+    client('POST', '/songs', test_song)
+    index_table.put_item(Item={'pk': 'COUNTER', 'sk': 'catalog', 'count': 5})
+
+    result = lambda_handler({'maintenance': 'reconcile_counters'}, None)
+    assert result['report']['corrected']['catalog'] == {'stored': 5, 'expected': 1}
+
+    body = json.loads(client('GET', '/songs', query_params={'limit': '10'})['body'])
+    assert body['total'] == 1
+
+    assert 'error' in lambda_handler({'maintenance': 'vacuum'}, None)
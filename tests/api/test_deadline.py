@@ -0,0 +1,70 @@
+"""
+Tests for request deadlines.
+
+These tests verify that:
+1. The deadline follows the Lambda context's remaining time
+2. A full listing stops early with a cursor the client can resume from
+3. Work that cannot stop early answers 503 instead of timing out
+"""
+
+import json
+import pytest
+from api.core.api import SongsApi
+from api.core.deadline import Deadline, DeadlineExceeded
+from api.core.scans import parallel_scan
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+def test_deadline_from_context():
+    """Test the deadline keeps the reserve back and caps downstream timeouts."""
+    assert Deadline.from_context(None) is None
+    deadline = Deadline.from_context(FakeContext(30000), reserve=1)
+    assert 28.5 < deadline.remaining() <= 29
+    assert deadline.timeout(5) == 5
+    assert Deadline.after(0.2).timeout(5) <= 0.2
+    expired = Deadline.after(-1)
+    assert expired.expired() and expired.timeout(5) == 0.1
+    with pytest.raises(DeadlineExceeded):
+        expired.check()
+
+def test_full_listing_stops_early(monkeypatch, mock_dynamodb, test_song):
+    """Test an expired deadline returns the pages read so far and a cursor."""
+    for i in range(3):
+        SongsApi(mock_dynamodb).create_song(dict(test_song, title=f'Song {i}'))
+    scan = mock_dynamodb.scan
+    monkeypatch.setattr(mock_dynamodb, 'scan', lambda **kwargs: scan(**dict(kwargs, Limit=1)))
+
+    api = SongsApi(mock_dynamodb, deadline=Deadline.after(-1))
+    page = api.list_songs()
+    assert len(page['items']) == 1 and page['has_more'] is True and page['total'] is None
+
+    monkeypatch.undo()
+    rest = SongsApi(mock_dynamodb).list_songs(limit=5, cursor=page['next_cursor'])
+    ids = {song['song_id'] for song in page['items'] + rest['items']}
+    assert len(ids) == 3
+    assert 'next_cursor' not in SongsApi(mock_dynamodb, deadline=Deadline.after(60)).list_songs()
+
+def test_scans_give_up(mock_dynamodb, test_song):
+    """Test snapshot scans raise instead of running past the deadline."""
+    SongsApi(mock_dynamodb).create_song(test_song)
+    with pytest.raises(DeadlineExceeded):
+        list(parallel_scan(mock_dynamodb, deadline=Deadline.after(-1)))
+    assert len(list(parallel_scan(mock_dynamodb, deadline=Deadline.after(60)))) == 1
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_out_of_time_answers_503(test_song):
+    """Test a search index build that runs out of time answers 503, not a gateway timeout."""
+    from api.app import lambda_handler
+    event = {
+        'requestContext': {'http': {'method': 'GET', 'path': '/search'}},
+        'queryStringParameters': {'q': 'test'},
+    }
+    response = lambda_handler(event, FakeContext(remaining_ms=500))
+    assert response['statusCode'] == 503
+    assert json.loads(response['body'])['code'] == 'DEADLINE_EXCEEDED'
+    assert lambda_handler(event, FakeContext(remaining_ms=30000))['statusCode'] == 200
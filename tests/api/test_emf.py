@@ -0,0 +1,109 @@
+"""
+Tests for Embedded Metric Format output.
+
+These tests verify that:
+1. Paths are reduced to route templates, so dimensions stay bounded
+2. Every document is valid EMF: declared metrics and dimensions are present
+3. The handler prints per-route latencies, cold/warm starts, dependency time and cache counters
+"""
+
+import json
+import pytest
+import api.app
+from api.core.emf import InvocationMetrics, route_template
+
+def _documents(capsys):
+    """Parse the EMF lines printed so far, checking each against its own metadata."""
+    documents = []
+    for line in capsys.readouterr().out.splitlines():
+        if not line.startswith('{"_aws"'):
+            continue
+        document = json.loads(line)
+        directive, = document['_aws']['CloudWatchMetrics']
+        assert directive['Namespace'] == 'OurChants/Api'
+        for dimension_set in directive['Dimensions']:
+            assert all(isinstance(document[name], str) for name in dimension_set)
+        for metric in directive['Metrics']:
+            assert metric['Name'] in document
+        documents.append(document)
+    return documents
+
+def _by_route(documents):
+    return {(d['Route'], d['StatusClass']): d for d in documents if 'StatusClass' in d}
+
+def _totals(documents):
+    totals, = [d for d in documents if 'Invocations' in d]
+    return totals
+
+@pytest.fixture
+def emf(monkeypatch):
+    """EMF enabled in a sandbox that has not been invoked yet."""
+    monkeypatch.setattr(api.app, 'EMF_METRICS', True)
+    monkeypatch.setattr(api.app, '_cold_start', True)
+    monkeypatch.setattr(api.app, '_aws_clients', None)
+
+@pytest.mark.parametrize('method, path, route', [
+    ('GET', '/songs', 'GET /songs'),
+    ('GET', '/songs/random', 'GET /songs/random'),
+    ('DELETE', '/songs/3f2a-41bc', 'DELETE /songs/{song_id}'),
+    ('GET', '/albums/Some%20Album', 'GET /albums/{album}'),
+    ('GET', '/wp-admin/login.php', 'GET other'),
+    ('PATCH', '/songs', 'OTHER /songs'),
+    (None, None, 'OTHER other'),
+])
+def test_route_template(method, path, route):
+    """Test IDs and unknown paths never become dimension values."""
+    assert route_template(method, path) == route
+
+def test_documents():
+    """Test latencies are grouped per route and status class, with counters per invocation."""
+    invocation = InvocationMetrics(cold=False)
+    for song_id, status, ms in (('a', 200, 12.34), ('b', 200, 3.0), ('c', 404, 1.0), ('d', 503, 40.0)):
+        invocation.record('GET', f'/songs/{song_id}', status, ms)
+    *routes, totals = invocation.documents(counters={'catalog.hit': 2}, timestamp_ms=1000)
+
+    groups = {d['StatusClass']: d for d in routes}
+    assert all(d['Route'] == 'GET /songs/{song_id}' and d['Start'] == 'warm' for d in routes)
+    assert groups['2xx']['Latency'] == [12.3, 3.0] and groups['2xx']['Requests'] == 2
+    assert groups['5xx']['Errors'] == 1 and groups['4xx']['Errors'] == 0
+    assert totals == {
+        '_aws': {'Timestamp': 1000, 'CloudWatchMetrics': [{
+            'Namespace': 'OurChants/Api',
+            'Dimensions': [['Start']],
+            'Metrics': [{'Name': 'Invocations', 'Unit': 'Count'}, {'Name': 'catalog.hit', 'Unit': 'Count'}],
+        }]},
+        'Start': 'warm',
+        'Invocations': 1,
+        'catalog.hit': 2,
+    }
+
+@pytest.mark.usefixtures('mock_dynamodb', 'emf')
+def test_handler_prints_emf(client, capsys, test_song):
+    """Test cold and warm invocations report route latency, DynamoDB time and cache counters."""
+    created = json.loads(client('POST', '/songs', test_song)['body'])
+    first = _documents(capsys)
+    assert {d['Start'] for d in first} == {'cold'}
+    assert ('POST /songs', '2xx') in _by_route(first)
+
+    client('GET', '/search', query_params={'q': 'test'})
+    search = _documents(capsys)
+    assert ('GET /search', '2xx') in _by_route(search)
+    assert _totals(search)['search_index.rebuild'] == 1
+
+    client('GET', f"/songs/{created['song_id']}")
+    documents = _documents(capsys)
+    assert {d['Start'] for d in documents} == {'warm'}
+    assert len(_by_route(documents)[('GET /songs/{song_id}', '2xx')]['Latency']) == 1
+    totals = _totals(documents)
+    assert totals['DynamoDBCalls'] >= 1 and totals['DynamoDBLatency'] >= 0
+    assert 'JsonCalls' in totals and 'known_ids.lookup' not in totals
+
+@pytest.mark.usefixtures('mock_dynamodb', 'emf')
+def test_batch_sub_requests_are_recorded(client, capsys):
+    """Test a batch reports itself and each sub-request under their own routes."""
+    client('POST', '/batch', {'requests': [
+        {'method': 'GET', 'path': f'/songs/missing-{i}'} for i in range(3)
+    ] + [{'method': 'GET', 'path': '/songs', 'query': {'sort': 'nope'}}]})
+    routes = _by_route(_documents(capsys))
+    assert set(routes) == {('POST /batch', '2xx'), ('GET /songs/{song_id}', '4xx'), ('GET /songs', '4xx')}
+    assert routes[('GET /songs/{song_id}', '4xx')]['Requests'] == 3
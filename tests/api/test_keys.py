@@ -0,0 +1,204 @@
+"""
+Tests for write-time sort keys and sorted, paginated listings.
+
+These tests verify that:
+1. Free-form titles, BPMs and dates are normalized into sortable keys
+2. Cursors round-trip and reject garbage
+3. GET /songs?sort= pages through an index in the right order
+4. BPM and duration range filters are answered from an index
+"""
+
+import json
+import pytest
+from decimal import Decimal
+from api.core.api import SongsApi
+from api.core.keys import (
+    collation_key, parse_bpm, parse_duration, parse_range_filters, parse_sort,
+    parse_timestamp, range_index, sort_keys
+)
+from api.core.pagination import decode_cursor, encode_cursor
+
+def test_collation_key():
+    """Test titles fold case and accents and sort digits naturally."""
+    assert collation_key('Ayahuasca Chacrunita') == collation_key('ayahuasca  chacrunita!')
+    assert collation_key('Icaro Ñañu') == 'icaro nanu'
+    assert collation_key('9 Icaros') < collation_key('10 Icaros')
+
+def test_parse_bpm():
+    """Test BPM strings become numbers, unknown as 0."""
+    assert parse_bpm('120') == Decimal(120)
+    assert parse_bpm('96.5 bpm') == Decimal('96.5')
+    assert parse_bpm('') == Decimal(0)
+    assert parse_bpm(None) == Decimal(0)
+
+def test_parse_duration():
+    """Test uploader strings and clock formats become whole seconds."""
+    assert parse_duration('245') == 245
+    assert parse_duration('4:05') == 245
+    assert parse_duration('1:02:03') == 3723
+    assert parse_duration('') is None
+    assert parse_duration('long') is None
+
+def test_parse_timestamp():
+    """Test date strings in the formats the uploader writes."""
+    assert parse_timestamp('2011-04-05 22:41:00') == 1302043260
+    assert parse_timestamp('2011-04-05') == 1301961600
+    assert parse_timestamp('sometime') == 0
+
+def test_sort_keys_partial():
+    """Test updates only derive keys for the fields they change."""
+    assert set(sort_keys({'title': 'A'})) == {'listing', 'title_key', 'bpm_value'}
+    assert set(sort_keys({'title': 'A'}, partial=True)) == {'listing', 'title_key'}
+
+def test_parse_sort():
+    """Test sort parameters map to indexes."""
+    assert parse_sort('title') == ('title-index', 'title_key', True)
+    assert parse_sort('-date_added') == ('date-added-index', 'date_added_ts', False)
+    with pytest.raises(ValueError):
+        parse_sort('lyrics')
+
+def test_cursor_round_trip():
+    """Test cursors preserve string and number key values."""
+    key = {'song_id': 'abc', 'listing': 'song', 'bpm_value': Decimal('96.5')}
+    assert decode_cursor(encode_cursor(key)) == key
+    assert encode_cursor(None) is None
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor!')
+
+def test_list_songs_sorted_pages(mock_dynamodb, test_song):
+    """Test sorted pages come back in order and cover every song."""
+    api = SongsApi(mock_dynamodb)
+    for title, bpm in [('Song 10', '90'), ('song 2', '140'), ('Ábaco', ''), ('Song 1', '120.5')]:
+        api.create_song(dict(test_song, title=title, bpm=bpm))
+
+    titles, cursor = [], None
+    while True:
+        page = api.list_songs(limit=3, cursor=cursor, sort='title')
+        titles.extend(song['title'] for song in page['items'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    assert titles == ['Ábaco', 'Song 1', 'song 2', 'Song 10']
+
+    page = api.list_songs(limit=10, sort='-bpm')
+    assert [song['bpm'] for song in page['items']] == ['140', '120.5', '90', '']
+    assert 'bpm_value' not in page['items'][0]
+
+def test_update_song_refreshes_sort_keys(mock_dynamodb, test_song):
+    """Test an update moves a song within the sort order."""
+    api = SongsApi(mock_dynamodb)
+    first = api.create_song(dict(test_song, title='A'))
+    api.create_song(dict(test_song, title='B'))
+    api.update_song(first['song_id'], dict(test_song, title='C'))
+
+    page = api.list_songs(limit=10, sort='title')
+    assert [song['title'] for song in page['items']] == ['B', 'C']
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_list_songs_route_sorted(client, test_song):
+    """Test GET /songs with sort and cursor parameters."""
+    for title in ['Song B', 'Song A', 'Song C']:
+        client('POST', '/songs', dict(test_song, title=title))
+
+    response = client('GET', '/songs', query_params={'sort': '-date_added', 'limit': '2'})
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert len(body['items']) == 2
+    assert body['has_more'] is True
+
+    response = client('GET', '/songs', query_params={
+        'sort': '-date_added', 'limit': '2', 'cursor': body['next_cursor']
+    })
+    body = json.loads(response['body'])
+    assert len(body['items']) == 1
+
+    response = client('GET', '/songs', query_params={'sort': 'lyrics'})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['code'] == 'INVALID_SORT'
+
+    response = client('GET', '/songs', query_params={'cursor': '%%%'})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['code'] == 'INVALID_CURSOR'
+
+def test_parse_range_filters():
+    """Test range parameters are parsed and checked, and pick an index."""
+    filters = parse_range_filters({'bpm_min': '90', 'bpm_max': '110', 'duration_max': '300'})
+    assert filters == {'bpm_min': Decimal(90), 'bpm_max': Decimal(110), 'duration_max': Decimal(300)}
+    assert range_index(filters, '-bpm') == ('bpm-index', 'bpm_value', False)
+    assert range_index({'duration_max': Decimal(300)}) == ('duration-index', 'duration_s', True)
+
+    for params in ({'bpm_min': 'fast'}, {'duration_max': '-1'}, {'bpm_min': '120', 'bpm_max': '90'}):
+        with pytest.raises(ValueError):
+            parse_range_filters(params)
+    with pytest.raises(ValueError):
+        range_index(filters, 'title')
+    with pytest.raises(ValueError):
+        range_index({'duration_max': Decimal(300)}, 'bpm')
+
+def test_list_songs_range_filters(mock_dynamodb, test_song):
+    """Test BPM and duration ranges, including songs with unknown values."""
+    api = SongsApi(mock_dynamodb)
+    for title, bpm, duration in [('Slow', '80', 200), ('Mid', '100', 280), ('Long', '105', 420),
+                                 ('Fast', '130', 240), ('Unknown', '', None)]:
+        api.create_song(dict(test_song, title=title, bpm=bpm, duration_s=duration))
+
+    page = api.list_songs(filters={'bpm_min': Decimal(90), 'bpm_max': Decimal(110),
+                                   'duration_max': Decimal(300)})
+    assert [song['title'] for song in page['items']] == ['Mid']
+    assert page['total'] is None
+
+    page = api.list_songs(filters={'bpm_max': Decimal(110)}, sort='-bpm')
+    assert [song['title'] for song in page['items']] == ['Long', 'Mid', 'Slow']
+
+    titles, cursor = [], None
+    while True:
+        page = api.list_songs(limit=2, cursor=cursor, filters={'duration_max': Decimal(300)})
+        titles.extend(song['title'] for song in page['items'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    assert titles == ['Slow', 'Fast', 'Mid']
+
+def test_combined_ranges_may_return_empty_pages(mock_dynamodb, test_song):
+    """Test BPM and duration pages can be empty yet carry a cursor to the songs after them."""
+    api = SongsApi(mock_dynamodb)
+    for bpm, duration in [('90', 400), ('95', 410), ('100', 420), ('105', 430), ('110', 240)]:
+        api.create_song(dict(test_song, title=f'Hino {bpm}', bpm=bpm, duration_s=duration))
+
+    filters = {'bpm_min': Decimal(90), 'duration_max': Decimal(300)}
+    page = api.list_songs(limit=2, filters=filters)
+    assert page['items'] == [] and page['has_more'] and page['next_cursor']
+
+    titles, cursor = [], None
+    while True:
+        page = api.list_songs(limit=2, cursor=cursor, filters=filters)
+        titles.extend(song['title'] for song in page['items'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    assert titles == ['Hino 110']
+
+def test_update_song_clears_duration(mock_dynamodb, test_song):
+    """Test a null duration removes the song from duration ranges."""
+    api = SongsApi(mock_dynamodb)
+    song = api.create_song(dict(test_song, duration_s=200))
+    updated = api.update_song(song['song_id'], dict(test_song, duration_s=None))
+    assert updated.get('duration_s') is None
+    assert api.list_songs(filters={'duration_max': Decimal(300)})['items'] == []
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_list_songs_route_range_filters(client, test_song):
+    """Test GET /songs with range filters and their error codes."""
+    client('POST', '/songs', dict(test_song, bpm='100', duration_s=240))
+
+    response = client('GET', '/songs', query_params={'bpm_min': '90', 'bpm_max': '110'})
+    assert response['statusCode'] == 200
+    assert len(json.loads(response['body'])['items']) == 1
+
+    response = client('GET', '/songs', query_params={'duration_max': 'short'})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['code'] == 'INVALID_FILTER'
+
+    response = client('GET', '/songs', query_params={'duration_max': '300', 'sort': 'title'})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['code'] == 'INVALID_SORT'
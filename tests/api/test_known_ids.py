@@ -0,0 +1,100 @@
+"""
+Tests for the song ID Bloom filter and negative cache.
+
+These tests verify that:
+1. The Bloom filter never rejects an added ID and stays near its false-positive rate
+2. Unknown IDs are answered without a read, known and newly created ones are not,
+   even when they are created while the filter is being rebuilt
+3. Recent misses are cached for their TTL and every outcome is counted
+"""
+
+import json
+import logging
+import pytest
+from api.core.api import SongsApi
+from api.core.changes import ChangeFeed
+from api.core.known_ids import BloomFilter, KnownSongIds
+from api.core.metrics import Metrics
+
+def _count_reads(monkeypatch, table):
+    reads = []
+    get_item = table.get_item
+    monkeypatch.setattr(table, 'get_item', lambda **kwargs: reads.append(kwargs) or get_item(**kwargs))
+    return reads
+
+def test_bloom_filter_rates():
+    """Test no false negatives and a false-positive rate close to the target."""
+    bloom = BloomFilter(5000, fp_rate=0.01)
+    for i in range(5000):
+        bloom.add(f'song-{i}')
+    assert all(f'song-{i}' in bloom for i in range(5000))
+    false_positives = sum(f'other-{i}' in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+    assert BloomFilter(5000, fp_rate=0.001).size_bytes > bloom.size_bytes
+    with pytest.raises(ValueError):
+        BloomFilter(10, fp_rate=1)
+
+def test_unknown_ids_skip_reads(monkeypatch, mock_dynamodb, index_table, test_song):
+    """Test unknown IDs cost no read while known ones are still read."""
+    metrics = Metrics()
+    api = SongsApi(mock_dynamodb, index_table=index_table, changes_settle_seconds=0,
+                   known_ids=KnownSongIds(metrics=metrics))
+    song = SongsApi(mock_dynamodb, index_table=index_table).create_song(test_song)
+    reads = _count_reads(monkeypatch, mock_dynamodb)
+
+    assert api.get_song('does-not-exist') is None
+    assert api.get_song(song['song_id'])['title'] == 'Test Song'
+    assert len(reads) == 1
+    assert metrics.flush() == {'known_ids.rebuild': 1, 'known_ids.bloom_reject': 1, 'known_ids.lookup': 1}
+
+def test_songs_created_elsewhere_are_found(mock_dynamodb, index_table, test_song):
+    """Test songs created by another sandbox are picked up before a miss is trusted."""
+    known_ids = KnownSongIds(max_staleness=0)
+    api = SongsApi(mock_dynamodb, index_table=index_table, known_ids=known_ids)
+    other = SongsApi(mock_dynamodb, index_table=index_table)
+    assert api.get_song('missing') is None
+
+    created = other.create_song(test_song)
+    assert api.get_song(created['song_id'])['song_id'] == created['song_id']
+    local = api.create_song(test_song)
+    assert api.get_song(local['song_id'])['song_id'] == local['song_id']
+
+def test_rebuild_keeps_songs_created_meanwhile(mock_dynamodb, index_table):
+    """Test a song created while the snapshot is read is in the rebuilt filter."""
+    known_ids = KnownSongIds()
+
+    def snapshot():
+        yield 'old'
+        known_ids.add('created-meanwhile')
+
+    known_ids.sync(mock_dynamodb, ChangeFeed(index_table), snapshot)
+    assert known_ids.trusted
+    assert known_ids.might_exist('old') and known_ids.might_exist('created-meanwhile')
+    assert not known_ids.might_exist('never-created')
+
+def test_negative_cache_expires():
+    """Test misses are answered from memory until their TTL passes."""
+    metrics = Metrics()
+    known_ids = KnownSongIds(negative_ttl=30, max_misses=2, metrics=metrics)
+    known_ids.record_miss('a', now=100)
+    assert known_ids.might_exist('a', now=120) is False
+    assert known_ids.might_exist('a', now=131) is True
+
+    for song_id in 'bcd':
+        known_ids.record_miss(song_id, now=200)
+    assert known_ids.might_exist('b', now=201) is True
+    known_ids.add('d')
+    assert known_ids.might_exist('d', now=201) is True
+    assert metrics.snapshot()['known_ids.negative_cache_hit'] == 1
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_route_logs_filter_metrics(monkeypatch, client, index_table, caplog):
+    """Test GET and DELETE of unknown IDs return 404 and log the filter counters."""
+    import api.app
+    monkeypatch.setenv('INDEX_TABLE_NAME', index_table.name)
+    monkeypatch.setattr(api.app, 'known_ids', KnownSongIds(metrics=api.app.metrics))
+    with caplog.at_level(logging.INFO):
+        assert client('GET', '/songs/unknown')['statusCode'] == 404
+        assert client('DELETE', '/songs/unknown')['statusCode'] == 404
+    logged = [json.loads(r.message)['metrics'] for r in caplog.records if r.message.startswith('{"metrics"')]
+    assert logged[-1] == {'known_ids.bloom_reject': 1}
@@ -0,0 +1,93 @@
+"""
+Tests for the lineage fan-out index.
+
+These tests verify that:
+1. Entries follow song creates, updates and deletes
+2. GET /songs?lineage= pages through a lineage with its counter as total
+3. The backfill indexes songs written before the index existed
+"""
+
+import json
+import pytest
+from boto3.dynamodb.conditions import Key
+from api.core.api import SongsApi
+from api.core.batch import batch_get
+from api.core.lineage import lineage_entries, lineage_pk
+
+def _entries(index_table, lineage):
+    response = index_table.query(KeyConditionExpression=Key('pk').eq(lineage_pk(lineage)))
+    return sorted(item['sk'] for item in response['Items'])
+
+def test_lineage_entries():
+    """Test lineages map to slugged partitions."""
+    assert lineage_pk('Santo Daime') == 'LINEAGE#santo-daime'
+    assert lineage_entries({'lineage': ['Santo Daime', '']}) == {'LINEAGE#santo-daime': 'Santo Daime'}
+    assert lineage_entries({'lineage': None}) == {}
+
+def test_batch_get_keeps_key_order(mock_dynamodb, test_song):
+    """Test batch reads return items in key order and skip missing keys."""
+    api = SongsApi(mock_dynamodb)
+    ids = [api.create_song(dict(test_song, title=str(i)))['song_id'] for i in range(3)]
+    keys = [{'song_id': song_id} for song_id in [ids[2], 'missing', ids[0]]]
+    assert [item['song_id'] for item in batch_get(mock_dynamodb, keys)] == [ids[2], ids[0]]
+
+def test_entries_follow_writes(mock_dynamodb, index_table, test_song):
+    """Test entries are added, moved and removed with the song."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    song = api.create_song(dict(test_song, lineage=['Santo Daime', 'Shipibo']))
+    assert _entries(index_table, 'Shipibo') == [song['song_id']]
+
+    api.update_song(song['song_id'], dict(test_song, lineage=['Santo Daime', 'Umbanda']))
+    assert _entries(index_table, 'Shipibo') == []
+    assert _entries(index_table, 'umbanda') == [song['song_id']]
+
+    api.delete_song(song['song_id'])
+    assert _entries(index_table, 'Santo Daime') == []
+    assert _entries(index_table, 'Umbanda') == []
+
+def test_list_songs_by_lineage(mock_dynamodb, index_table, test_song):
+    """Test lineage pages cover every song of the lineage and only those."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    expected = {api.create_song(dict(test_song, title=f'Hino {i}', lineage=['Santo Daime']))['song_id']
+                for i in range(5)}
+    api.create_song(dict(test_song, lineage=['Shipibo']))
+
+    seen, cursor = [], None
+    while True:
+        page = api.list_songs(limit=2, cursor=cursor, lineage='santo-daime')
+        assert page['total'] == 5
+        seen.extend(song['song_id'] for song in page['items'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    assert sorted(seen) == sorted(expected)
+
+def test_rebuild_backfills_entries(mock_dynamodb, index_table, test_song):
+    """Test the backfill indexes raw songs and drops orphaned entries."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    mock_dynamodb.put_item(Item={'song_id': 'raw', 'title': 'Raw', 'artist': 'Virginia',
+                                 'lineage': ['Shipibo'], 's3_uri': 's3://ourchants-songs/raw.mp3'})
+    index_table.put_item(Item={'pk': 'LINEAGE#shipibo', 'sk': 'gone', 'lineage': 'Shipibo'})
+
+    report = api.rebuild_lineage_index(dry_run=True)
+    assert report == {'checked': 1, 'missing': 1, 'orphaned': 1}
+    api.rebuild_lineage_index()
+    assert _entries(index_table, 'Shipibo') == ['raw']
+    assert api.rebuild_lineage_index(dry_run=True) == {'checked': 1, 'missing': 0, 'orphaned': 0}
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_list_songs_route_lineage(client, test_song):
+    """Test GET /songs?lineage= and its parameter checks."""
+    client('POST', '/songs', dict(test_song, lineage=['Santo Daime']))
+    client('POST', '/songs', dict(test_song, lineage=['Shipibo']))
+
+    response = client('GET', '/songs', query_params={'lineage': 'Santo Daime'})
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert [song['lineage'] for song in body['items']] == [['Santo Daime']]
+    assert body['total'] == 1
+
+    response = client('GET', '/songs', query_params={'lineage': 'Shipibo', 'sort': 'title'})
+    assert json.loads(response['body'])['code'] == 'INVALID_SORT'
+    response = client('GET', '/songs', query_params={'lineage': ' '})
+    assert json.loads(response['body'])['code'] == 'INVALID_FILTER'
@@ -0,0 +1,135 @@
+"""
+Memory budgets for routes that read the whole catalog.
+
+These tests verify that:
+1. The peak memory of building a full response, measured with tracemalloc,
+   stays within a per-route budget
+2. The measurement covers the request as the Lambda sees it: scan pages
+   and point reads arrive as fresh items, and the response ends as a JSON
+   string
+3. Random samples come from the precomputed shuffle, whose peak does not
+   grow with the catalog
+
+The tables are in-memory stand-ins rather than moto, whose own request
+handling would dominate the measurement. Each scan page and read is decoded
+from JSON, so its items are new objects, as boto3 would return them.
+
+Budgets are bytes per song plus a fixed allowance. Only a 1k catalog is
+measured by default; ``make benchmark`` sets MEMORY_BUDGET_SIZES to
+``1000,10000,100000``.
+"""
+
+import gc
+import os
+import tracemalloc
+from types import SimpleNamespace
+import pytest
+from api.app import route
+from api.core.api import SongsApi
+from api.core.shuffle import ShuffleIndex
+from utilities.synthetic_catalog import dumps, generate, loads
+
+PAGE_SIZE = 2500  # roughly what fits in DynamoDB's 1 MB scan page
+FIXED_BYTES = 2 * 1024 * 1024
+
+# Peak bytes per song for each route, about 25% above what they use now; a
+# random sample reads O(n) items, so it only has the fixed allowance
+BUDGETS = {
+    ('GET', '/songs', None): 2900,
+    ('GET', '/songs/random', None): 0,
+    ('GET', '/search', 'hino'): 11000,
+}
+
+SIZES = [int(size) for size in os.getenv('MEMORY_BUDGET_SIZES', '1000').split(',')]
+
+class ItemTable:
+    """Holds encoded items by key and answers reads by decoding them into new items."""
+
+    def __init__(self, name, key_names):
+        self.name = name
+        self.key_names = key_names
+        self.items = {}
+        # batch_get calls the client, which here is the table itself
+        self.meta = SimpleNamespace(client=self)
+
+    def _key(self, key):
+        return tuple(key[name] for name in self.key_names)
+
+    def put_item(self, Item):
+        self.items[self._key(Item)] = dumps([Item])
+
+    def delete_item(self, Key):
+        self.items.pop(self._key(Key), None)
+
+    def get_item(self, Key):
+        encoded = self.items.get(self._key(Key))
+        return {'Item': loads(encoded)[0]} if encoded else {}
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[self.name]['Keys']
+        found = [loads(self.items[self._key(key)])[0] for key in keys if self._key(key) in self.items]
+        return {'Responses': {self.name: found}}
+
+    def batch_writer(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+class ScanTable(ItemTable):
+    """Serves scan pages of a fixed catalog, and its songs by ID."""
+
+    def __init__(self, items):
+        super().__init__('songs', ['song_id'])
+        for item in items:
+            self.put_item(item)
+        self.pages = [dumps(items[i:i + PAGE_SIZE]) for i in range(0, len(items), PAGE_SIZE)] or ['[]']
+
+    def scan(self, ExclusiveStartKey=None, **kwargs):
+        page = ExclusiveStartKey['page'] if ExclusiveStartKey else 0
+        response = {'Items': loads(self.pages[page])}
+        if page + 1 < len(self.pages):
+            response['LastEvaluatedKey'] = {'page': page + 1}
+        return response
+
+class IndexTable(ItemTable):
+    """Holds the shuffle for a catalog, as the refresh job writes it."""
+
+    def __init__(self, items):
+        super().__init__('index', ['pk', 'sk'])
+        ShuffleIndex(self).refresh(items)
+
+    def scan(self, **kwargs):
+        return {'Items': [loads(encoded)[0] for encoded in self.items.values()]}
+
+def peak_bytes(table, index_table, method, path, query):
+    """Peak traced memory while one request is answered, and its response."""
+    api = SongsApi(table, index_table if path == '/songs/random' else None)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        response = route(api, None, method, path, {'q': query} if query else {}, None)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, response
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: f'{size}_songs')
+def tables(request):
+    items = generate(request.param, seed=request.param)
+    return request.param, ScanTable(items), IndexTable(items)
+
+@pytest.mark.parametrize('method, path, query', list(BUDGETS), ids=lambda value: value or '')
+def test_peak_memory_within_budget(tables, method, path, query):
+    """Test answering the route stays within its memory budget."""
+    size, scan_table, index_table = tables
+    peak, response = peak_bytes(scan_table, index_table, method, path, query)
+    assert response['statusCode'] == 200
+    budget = FIXED_BYTES + BUDGETS[(method, path, query)] * size
+    assert peak <= budget, (
+        f"{method} {path} with {size} songs peaked at {peak / 2**20:.1f} MiB, "
+        f"over its {budget / 2**20:.1f} MiB budget"
+    )
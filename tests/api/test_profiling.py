@@ -0,0 +1,105 @@
+"""
+Tests for the opt-in request profiler.
+
+These tests verify that:
+1. The handler is left unwrapped unless profiling is enabled
+2. Only requests with the secret token, picked by the sample rate, are profiled
+3. Profiles are written as loadable pstats and collapsed stacks, locally or to S3
+"""
+
+import logging
+import os
+import pstats
+import threading
+import time
+import boto3
+import pytest
+import api.app
+from api.core.profiling import ProfileWriter, StackSampler, profiled
+
+def _request(path, token=None):
+    return {
+        'requestContext': {'http': {'method': 'GET', 'path': path}},
+        'headers': {'x-profile-token': token} if token else {},
+    }
+
+def test_disabled_by_default():
+    """Test the deployed handler is the plain function when PROFILING is unset."""
+    assert not hasattr(api.app.lambda_handler, '__wrapped__')
+
+def test_unprofiled_requests(tmp_path):
+    """Test requests without the token, with a wrong one, or not sampled are passed straight through."""
+    calls = []
+    handler = profiled(lambda event, context: calls.append(event) or {'statusCode': 200, 'headers': {}},
+                       'secret', ProfileWriter(str(tmp_path)))
+    for token in (None, 'guess', 'secre'):
+        assert 'X-Profile' not in handler(_request('/songs', token), None)['headers']
+    never = profiled(lambda event, context: {'statusCode': 200, 'headers': {}}, 'secret',
+                     ProfileWriter(str(tmp_path)), sample_rate=0)
+    assert 'X-Profile' not in never(_request('/songs', 'secret'), None)['headers']
+    assert len(calls) == 3 and not list(tmp_path.iterdir())
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_profiled_request(tmp_path, client, test_song):
+    """Test a profiled request writes pstats and collapsed stacks covering the handler."""
+    song = client('POST', '/songs', test_song)
+    handler = profiled(api.app.lambda_handler, 'secret', ProfileWriter(str(tmp_path)), interval=0.0005)
+    response = handler(_request('/songs', 'secret'), None)
+    assert response['statusCode'] == 200 and song['statusCode'] == 201
+
+    pstats_path, collapsed_path = response['headers']['X-Profile'].split(', ')
+    assert os.path.dirname(pstats_path) == str(tmp_path) and '-GET_songs-' in pstats_path
+    functions = {name for _, _, name in pstats.Stats(pstats_path).stats}
+    assert 'list_songs' in functions
+
+    lines = open(collapsed_path).read().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0 and 'stack-sampler' not in stack
+    assert any('lambda_handler (app.py:' in line for line in lines)
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_token_is_not_logged(tmp_path, caplog):
+    """Test the profile token and credentials are masked in the logged event."""
+    caplog.set_level(logging.INFO)
+    handler = profiled(api.app.lambda_handler, 'secret-token', ProfileWriter(str(tmp_path)))
+    event = _request('/songs', 'secret-token')
+    event['headers'].update({'Authorization': 'Bearer credential', 'accept': 'application/json'})
+    assert handler(event, None)['statusCode'] == 200
+    assert 'Received event' in caplog.text and 'application/json' in caplog.text
+    assert 'secret-token' not in caplog.text and 'credential' not in caplog.text
+
+def test_sampler_covers_new_threads():
+    """Test threads started while sampling are included and threads already running are not."""
+    stop = threading.Event()
+
+    def already_running():
+        stop.wait()
+
+    def started_later():
+        end = time.monotonic() + 0.05
+        while time.monotonic() < end:
+            pass
+
+    idle = threading.Thread(target=already_running)
+    idle.start()
+    sampler = StackSampler(interval=0.0005)
+    sampler.start()
+    worker = threading.Thread(target=started_later)
+    worker.start()
+    worker.join()
+    sampler.stop()
+    stop.set()
+    idle.join()
+    assert any('started_later (test_profiling.py' in stack for stack in sampler.samples)
+    assert not any('already_running' in stack for stack in sampler.samples)
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_profiles_to_s3():
+    """Test profiles can be written under an S3 prefix."""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    s3_client.create_bucket(Bucket='profiles')
+    writer = ProfileWriter('s3://profiles/api/', s3_client)
+    assert writer.write('a.collapsed', b'main 1\n') == 's3://profiles/api/a.collapsed'
+    assert s3_client.get_object(Bucket='profiles', Key='api/a.collapsed')['Body'].read() == b'main 1\n'
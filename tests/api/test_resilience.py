@@ -0,0 +1,142 @@
+"""
+Tests for retries, circuit breakers and load shedding.
+
+These tests verify that:
+1. A breaker opens after repeated failures, refuses calls, and closes after a good probe
+2. Throttled calls are retried with backoff, within the time budget
+3. Routes answer 503 with Retry-After instead of an empty or failed response
+"""
+
+import json
+import logging
+import os
+import boto3
+import pytest
+import api.app
+from botocore.awsrequest import AWSResponse
+from api.core.deadline import Deadline
+from api.core.metrics import Metrics
+from api.core.resilience import CircuitBreaker, DependencyUnavailable, Resilience, budget
+
+def _fail_first(client, times, status, body=b''):
+    """Answer the first ``times`` requests of a client with an error instead of sending them."""
+    sent = []
+
+    def handler(request, **kwargs):
+        sent.append(request)
+        if len(sent) <= times:
+            response = AWSResponse(request.url, status, {}, None)
+            response._content = body
+            return response
+    client.meta.events.register_first('before-send', handler)
+    return sent
+
+def _throttle_dynamodb(client, times):
+    body = json.dumps({
+        '__type': 'com.amazonaws.dynamodb.v20120810#ProvisionedThroughputExceededException',
+        'message': 'Rate of requests exceeds the allowed throughput',
+    }).encode()
+    return _fail_first(client, times, 400, body)
+
+@pytest.fixture
+def resilient(monkeypatch):
+    """A sandbox with fresh breakers, fast backoff and no pooled clients yet."""
+    resilience = api.app.Resilience(max_attempts=3, base_delay=0.001, failure_threshold=2,
+                                    reset_timeout=30, metrics=api.app.metrics)
+    monkeypatch.setattr(api.app, 'resilience', resilience)
+    monkeypatch.setattr(api.app, '_aws_clients', None)
+    return resilience
+
+def test_breaker_opens_and_recovers():
+    """Test the breaker refuses calls while open and lets one probe through after the timeout."""
+    now = [0.0]
+    metrics = Metrics()
+    breaker = CircuitBreaker('dynamodb', failure_threshold=2, reset_timeout=10,
+                             metrics=metrics, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 4
+    with pytest.raises(DependencyUnavailable) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == 6 and raised.value.retry_after_header == '6'
+
+    now[0] = 10
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(DependencyUnavailable):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.retry_after() == 10
+
+    now[0] = 20
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert metrics.flush() == {'dynamodb.breaker_open': 2, 'dynamodb.rejected': 2,
+                               'dynamodb.breaker_half_open': 2, 'dynamodb.breaker_closed': 1}
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_throttled_calls_are_retried():
+    """Test throttling is retried until it clears, and reported once retries run out."""
+    metrics = Metrics()
+    resilience = Resilience(max_attempts=3, base_delay=0.001, metrics=metrics)
+    client = resilience.attach(boto3.client('dynamodb', region_name='us-east-1'), 'dynamodb')
+    sent = _throttle_dynamodb(client, 2)
+    assert client.describe_table(TableName=os.environ['DYNAMODB_TABLE_NAME'])['Table']
+    assert len(sent) == 3
+    assert metrics.flush() == {'dynamodb.retry': 2}
+
+    _throttle_dynamodb(client, 3)
+    with pytest.raises(DependencyUnavailable) as raised:
+        client.describe_table(TableName=os.environ['DYNAMODB_TABLE_NAME'])
+    assert raised.value.reason == 'ProvisionedThroughputExceededException'
+    assert resilience.breaker('dynamodb').failures == 1
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_retries_stay_within_budget():
+    """Test no retry is made when its backoff would not fit in the deadline."""
+    metrics = Metrics()
+    resilience = Resilience(base_delay=0.5, max_delay=0.5, min_attempt_seconds=0.5, metrics=metrics)
+    client = resilience.attach(boto3.client('dynamodb', region_name='us-east-1'), 'dynamodb')
+    sent = _throttle_dynamodb(client, 5)
+    with budget(Deadline.after(0.4)), pytest.raises(DependencyUnavailable):
+        client.list_tables()
+    assert len(sent) == 1
+    assert metrics.flush() == {'dynamodb.retry_skipped': 1}
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_throttled_listing_sheds_load(client, resilient, caplog):
+    """Test a throttled listing answers 503 rather than an empty catalog, then fails fast."""
+    dynamodb, _ = api.app.aws_clients()
+    sent = _throttle_dynamodb(dynamodb.meta.client, 100)
+
+    for _ in range(2):
+        response = client('GET', '/songs')
+        assert response['statusCode'] == 503
+        assert json.loads(response['body'])['code'] == 'SERVICE_UNAVAILABLE'
+    assert len(sent) == 6
+    assert response['headers']['Retry-After'] == '30'
+
+    with caplog.at_level(logging.INFO):
+        response = client('GET', '/songs')
+    assert response['statusCode'] == 503 and len(sent) == 6
+    assert 25 < float(response['headers']['Retry-After']) <= 30
+    logged = [json.loads(r.message) for r in caplog.records if r.message.startswith('{"metrics"')]
+    assert logged[-1] == {'metrics': {'dynamodb.rejected': 1}, 'breakers': {'dynamodb': 'open'}}
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_throttled_presigned_url(client, resilient):
+    """Test S3 slowing down gives 503 with Retry-After instead of a fixed 429."""
+    _, s3_client = api.app.aws_clients()
+    s3_client.create_bucket(Bucket=os.environ['S3_BUCKET'])
+    s3_client.put_object(Bucket=os.environ['S3_BUCKET'], Key='song.mp3', Body=b'')
+    _fail_first(s3_client, 3, 503)
+
+    response = client('POST', '/presigned-url', {'key': 'song.mp3'})
+    assert response['statusCode'] == 503
+    assert response['headers']['Retry-After'] == '1'
+    assert json.loads(response['body'])['details'] == {'dependency': 's3', 'retry_after': 1}
+    assert client('POST', '/presigned-url', {'key': 'song.mp3'})['statusCode'] == 200
@@ -0,0 +1,177 @@
+"""
+Tests for trigram search.
+
+These tests verify that:
+1. Titles are normalized before indexing
+2. Exact and fuzzy lookups find the right songs
+3. Exact lookups return the best matches of the whole catalog, whether
+   they walk a posting list or intersect bitsets
+4. The index stays in sync with writes through SongsApi, including
+   writes made while it is being rebuilt, and a stale index is refreshed
+   in the background
+5. The /search route validates its parameters
+"""
+
+import json
+import pytest
+from api.core.api import SongsApi
+from api.core.search import TrigramIndex, normalize_text, song_search_text, trigrams
+from utilities.synthetic_catalog import generate
+
+def make_song(song_id, title, artist='Unknown'):
+    """Build a minimal dumped song for the index."""
+    return {'song_id': song_id, 'title': title, 'artist': artist}
+
+@pytest.fixture
+def index():
+    """Create an index over a few messy titles from utilities/songs.json."""
+    index = TrigramIndex()
+    index.load([
+        make_song('1', '21 Wairaitirai Suntarai snippet-?', 'Muse'),
+        make_song('2', 'Leo Cavalcante 14_15-Segue_Inflorescencia'),
+        make_song('3', 'Ayahuasca Chacrunita', 'Don Augustín de Rivas'),
+        make_song('4', 'Tonant, tonant, tonantiu', 'Virginia'),
+    ])
+    return index
+
+def test_normalize_text():
+    """Test accents, case and punctuation are folded."""
+    assert normalize_text('Don Augustín') == 'don augustin'
+    assert normalize_text('14_15-Segue_Inflorescencia') == '14 15 segue inflorescencia'
+    assert normalize_text('snippet-?') == 'snippet'
+    assert normalize_text(None) == ''
+
+def test_trigrams_pad_words():
+    """Test short words still produce grams."""
+    assert trigrams('ab') == {'  a', ' ab', 'ab '}
+    assert trigrams('') == frozenset()
+
+def test_exact_search(index):
+    """Test substring search over normalized text."""
+    results = index.search('segue inflorescencia')
+    assert [song['song_id'] for song, _ in results] == ['2']
+    assert index.search('augustin')[0][0]['song_id'] == '3'
+    assert index.search('nothing like this') == []
+
+def test_exact_search_returns_the_best_matches():
+    """Test exact results are the best-scoring matches of the catalog, common terms included."""
+    catalog = generate(3000, seed=5)
+    index = TrigramIndex()
+    index.load(catalog)
+    texts = {song['song_id']: song_search_text(song) for song in catalog}
+    queries = {' '.join(song['title'].split()[:2]) for song in catalog[:30]} | {'hino', 'snippet', 'do', 'a b'}
+    for query in sorted(queries):
+        text = normalize_text(query)
+        grams = trigrams(text)
+        expected = sorted(
+            (-2.0 * len(grams) / (len(grams) + len(trigrams(texts[song_id]))), texts[song_id])
+            for song_id in texts
+            if text in texts[song_id] and grams <= trigrams(texts[song_id])
+        )[:5]
+        results = index.search(query, limit=5)
+        assert [(score, song_search_text(song)) for song, score in results] == \
+            [(round(-score, 4), text) for score, text in expected], query
+
+def test_fuzzy_search_tolerates_typos(index):
+    """Test misspelled queries still rank the right song first."""
+    results = index.search('wairaitiray suntaray', fuzzy=True)
+    assert results[0][0]['song_id'] == '1'
+    results = index.search('cavalcanti inflorecencia', fuzzy=True)
+    assert results[0][0]['song_id'] == '2'
+    assert 0 < results[0][1] <= 1
+
+def test_fuzzy_search_respects_threshold(index):
+    """Test unrelated queries return nothing."""
+    assert index.search('xyzzy qwerty', fuzzy=True) == []
+
+def test_add_replaces_and_remove(index):
+    """Test re-adding a song replaces its old grams."""
+    index.add(make_song('3', 'Icaro de la Selva'))
+    assert index.search('chacrunita') == []
+    assert index.search('selva')[0][0]['song_id'] == '3'
+    index.remove('3')
+    assert '3' not in index
+    assert index.search('selva') == []
+    index.remove('missing')
+
+def test_writes_after_a_load(index):
+    """Test rewritten and new songs are found by both lookups until the next load."""
+    index.add(make_song('2', 'Leo Cavalcante 14_15-Segue_Inflorescencia', 'Muse'))
+    index.add(make_song('4', 'Tonant, tonant, tonantiu', 'Virginia'))
+    index.add(make_song('6', 'Tonantiu Novo'))
+    assert [song['song_id'] for song, _ in index.search('tonantiu')] == ['4', '6']
+    assert index.search('segue inflorescencia')[0][0]['artist'] == 'Muse'
+    assert index.search('tonantiu novo', fuzzy=True)[0][0]['song_id'] == '6'
+    index.remove('4')
+    assert [song['song_id'] for song, _ in index.search('tonantiu')] == ['6']
+
+def test_reload_keeps_writes_made_during_the_scan(index):
+    """Test searches use the old contents while a reload scans, and writes made meanwhile survive it."""
+    def scan():
+        yield make_song('1', '21 Wairaitirai Suntarai snippet-?', 'Muse')
+        # Another request searches and writes while the scan is running
+        assert index.search('chacrunita')[0][0]['song_id'] == '3'
+        index.add(make_song('5', 'Hino Novo'))
+        index.add(make_song('1', 'Icaro de la Selva'))
+        index.remove('4')
+        yield make_song('4', 'Tonant, tonant, tonantiu', 'Virginia')
+
+    index.load(scan())
+    assert index.search('novo')[0][0]['song_id'] == '5'
+    assert index.search('selva')[0][0]['song_id'] == '1'
+    assert index.search('tonant') == []
+    assert index.search('chacrunita') == []
+
+def test_search_songs_syncs_with_writes(mock_dynamodb, test_song):
+    """Test the index is built lazily and kept up to date."""
+    api = SongsApi(mock_dynamodb)
+    created = api.create_song(dict(test_song, title='Ayahuasca Chacrunita'))
+
+    result = api.search_songs('ayahuaska', fuzzy=True)
+    assert result['items'][0]['song_id'] == created['song_id']
+
+    api.update_song(created['song_id'], dict(test_song, title='Icaro de la Selva'))
+    assert api.search_songs('selva')['items'][0]['song_id'] == created['song_id']
+    assert api.search_songs('chacrunita')['items'] == []
+
+    api.delete_song(created['song_id'])
+    assert api.search_songs('selva')['items'] == []
+
+def test_stale_index_refreshes_in_background(mock_dynamodb, test_song):
+    """Test a stale index answers at once while a background scan refreshes it."""
+    api = SongsApi(mock_dynamodb, search_index_ttl=60)
+    api.warm_caches()
+    # Written by another sandbox, so this index only sees it after a refresh
+    song = SongsApi(mock_dynamodb).create_song(dict(test_song, title='Icaro de la Selva'))
+    assert api.search_songs('selva')['items'] == []
+
+    api.search_index.loaded_at -= 120
+    with api.search_index.refresh_lock:
+        # A refresh is already running, so the request does not start another
+        assert api.search_songs('selva')['items'] == []
+    assert 'search_index.refresh' not in api.metrics.snapshot()
+
+    api.search_songs('selva')
+    assert api.metrics.snapshot()['search_index.refresh'] == 1
+    with api.search_index.refresh_lock:
+        assert [item['song_id'] for item in api.search_songs('selva')['items']] == [song['song_id']]
+    assert api.metrics.snapshot()['search_index.rebuild'] == 1
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_search_route(client, test_song):
+    """Test GET /search through the Lambda handler."""
+    client('POST', '/songs', dict(test_song, title='21 Wairaitirai Suntarai snippet-?'))
+
+    event_params = {'q': 'wairaitiray', 'fuzzy': '1'}
+    response = client('GET', '/search', query_params=event_params)
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['items'][0]['title'] == '21 Wairaitirai Suntarai snippet-?'
+
+    response = client('GET', '/search', query_params={'q': ''})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['code'] == 'INVALID_QUERY'
+
+    response = client('GET', '/search', query_params={'q': 'x', 'limit': '500'})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['code'] == 'INVALID_LIMIT'
@@ -0,0 +1,77 @@
+"""
+Tests for the compiled song serializer.
+
+These tests verify that:
+1. Dump output is byte-identical to marshmallow's for stored items
+2. Load returns the same data, coercions and error messages as marshmallow
+3. Schema features the compiler does not understand are refused
+"""
+
+import json
+import random
+import pytest
+from decimal import Decimal
+from marshmallow import Schema, ValidationError, fields, validates
+from api.core.schemas import song_schema
+from api.core.serializer import compile_schema
+
+compiled = compile_schema(song_schema)
+
+VALUES = ['', 'Hino 1', 'Ñañu', None, Decimal('120'), Decimal('96.5'), 7, True, b'bytes',
+          ['Santo Daime'], ['a', None], ('tuple',), [], -1, 245, '245', 3.5, 2 ** 40]
+
+def random_items(count, seed=7):
+    """Items mixing valid values, wrong types and missing fields."""
+    rng = random.Random(seed)
+    names = list(song_schema.fields) + ['unknown', 'seq']
+    return [
+        {name: rng.choice(VALUES) for name in rng.sample(names, rng.randint(0, len(names)))}
+        for _ in range(count)
+    ]
+
+def outcome(load, data):
+    try:
+        return 'ok', load(data)
+    except ValidationError as e:
+        return 'error', e.messages
+
+def test_dump_parity():
+    """Test dump output is byte-identical for typical and odd items."""
+    items = random_items(500) + [{'song_id': 'x', 'duration_s': Decimal('245'), 'bpm_value': Decimal(1)}]
+    for item in items:
+        try:
+            expected = json.dumps(song_schema.dump(item))
+        except (TypeError, ValueError):
+            with pytest.raises((TypeError, ValueError)):
+                compiled.dump(item)
+            continue
+        assert json.dumps(compiled.dump(item)) == expected
+
+def test_load_parity(test_song):
+    """Test valid and invalid payloads load, or fail, exactly as marshmallow's do."""
+    payloads = random_items(500, seed=11) + [
+        test_song,
+        dict(test_song, duration_s=245, lineage=['Santo Daime']),
+        dict(test_song, duration_s='245'),
+        dict(test_song, title=''),
+        dict(test_song, lineage=('tuple',)),
+        [test_song],
+    ]
+    for payload in payloads:
+        assert outcome(compiled.load, payload) == outcome(song_schema.load, payload)
+
+def test_unsupported_schemas_are_refused():
+    """Test the compiler raises instead of guessing."""
+    class Dated(Schema):
+        when = fields.DateTime()
+
+    class Checked(Schema):
+        title = fields.String()
+
+        @validates('title')
+        def check_title(self, value, **kwargs):
+            pass
+
+    for schema in (Dated(), Checked()):
+        with pytest.raises(TypeError):
+            compile_schema(schema)
@@ -0,0 +1,83 @@
+"""
+Tests for random samples from the precomputed shuffle.
+
+These tests verify that:
+1. Samples are distinct, respect the lineage and skip deleted songs
+2. Every song is equally likely to be drawn (chi-square test)
+3. GET /songs/random works before and after the refresh job has run
+"""
+
+import json
+import random
+import pytest
+from collections import Counter
+from api.app import lambda_handler
+from api.core.api import SongsApi
+from api.core.scans import parallel_scan
+from api.core.shuffle import ShuffleIndex, lineage_scope
+
+def _catalog(api, test_song, size):
+    return [api.create_song(dict(test_song, title=f'Hino {i}',
+                                 lineage=['Santo Daime'] if i % 2 else ['Shipibo']))
+            for i in range(size)]
+
+def test_sample_scopes_and_deletes(mock_dynamodb, index_table, test_song):
+    """Test samples are distinct, scoped and skip songs deleted since the refresh."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    songs = _catalog(api, test_song, 12)
+    shuffle = ShuffleIndex(index_table, chunk_size=5)
+    report = shuffle.refresh(parallel_scan(mock_dynamodb))
+    assert report['scopes'] == {'catalog': 12, 'lineage#santo-daime': 6, 'lineage#shipibo': 6}
+
+    sample = shuffle.sample(mock_dynamodb, 8)
+    assert len({song['song_id'] for song in sample}) == 8
+
+    shipibo = shuffle.sample(mock_dynamodb, 10, lineage_scope('Shipibo'))
+    assert len(shipibo) == 6
+    assert all(song['lineage'] == ['Shipibo'] for song in shipibo)
+    assert shuffle.sample(mock_dynamodb, 3, lineage_scope('Umbanda')) is None
+
+    for song in songs[:6]:
+        api.delete_song(song['song_id'])
+    remaining = {song['song_id'] for song in songs[6:]}
+    assert {song['song_id'] for song in shuffle.sample(mock_dynamodb, 6)} <= remaining
+
+    api.delete_song(songs[7]['song_id'])
+    assert shuffle.refresh(parallel_scan(mock_dynamodb))['scopes']['catalog'] == 5
+
+def test_sample_is_uniform(mock_dynamodb, index_table, test_song):
+    """Test draws across chunks are uniform (chi-square, 19 dof, p = 0.001)."""
+    api = SongsApi(mock_dynamodb, index_table=index_table)
+    songs = _catalog(api, test_song, 20)
+    shuffle = ShuffleIndex(index_table, chunk_size=6, rng=random.Random(3))
+    shuffle.refresh(parallel_scan(mock_dynamodb))
+
+    draws, n = 60, 10
+    counts = Counter()
+    for _ in range(draws):
+        counts.update(song['song_id'] for song in shuffle.sample(mock_dynamodb, n))
+    expected = draws * n / len(songs)
+    chi_square = sum((counts[song['song_id']] - expected) ** 2 / expected for song in songs)
+    assert chi_square < 43.82
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_random_route(client, test_song):
+    """Test GET /songs/random with and without a built shuffle."""
+    for i in range(4):
+        client('POST', '/songs', dict(test_song, title=f'Hino {i}', lineage=['Santo Daime'] if i else []))
+
+    response = client('GET', '/songs/random', query_params={'n': '3'})
+    assert response['statusCode'] == 200
+    assert len(json.loads(response['body'])['items']) == 3
+
+    result = lambda_handler({'maintenance': 'refresh_shuffle'}, None)
+    assert result['report']['scopes']['catalog'] == 4
+
+    response = client('GET', '/songs/random', query_params={'n': '5', 'lineage': 'santo-daime'})
+    assert len(json.loads(response['body'])['items']) == 3
+    response = client('GET', '/songs/random', query_params={'lineage': 'Umbanda'})
+    assert json.loads(response['body'])['items'] == []
+
+    response = client('GET', '/songs/random', query_params={'n': '0'})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['details']['reason'] == 'n must be between 1 and 100'
@@ -0,0 +1,177 @@
+"""
+Tests for the SQLite storage backend.
+
+These tests verify that:
+1. SongsApi serves songs, pages, counts and aggregates from SQLite as it does from DynamoDB
+2. Sorted, range-filtered and lineage pages resume from their cursors without gaps
+3. FTS5 search returns what the in-memory trigram index returns
+4. Writes from many threads commit without losing or corrupting songs
+"""
+
+import threading
+import pytest
+from api.core.aggregates import AggregateStore, plain
+from api.core.api import SongsApi
+from api.core.keys import collation_key, parse_bpm
+from api.core.search import TrigramIndex
+from api.core.sqlite_store import SqliteSongStore
+from api.core.storage import DynamoDBSongStore, SearchableStore
+from utilities.synthetic_catalog import generate
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteSongStore(str(tmp_path / 'songs.db'))
+    yield store
+    store.close()
+
+@pytest.fixture
+def catalog(store):
+    """A store loaded with 300 synthetic songs."""
+    items = generate(300, seed=3)
+    for item in items:
+        store.create(item)
+    return items
+
+def _pages(api, **kwargs):
+    """Follow next_cursor through every page; return the song IDs and totals seen."""
+    seen, totals, cursor = [], set(), None
+    while True:
+        page = api.list_songs(limit=25, cursor=cursor, **kwargs)
+        seen.extend(song['song_id'] for song in page['items'])
+        totals.add(page['total'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return seen, totals
+
+def test_crud(store, test_song):
+    """Test create, get, update and delete through SongsApi without any AWS resources."""
+    api = SongsApi(store=store)
+    assert api.search_index is None and api.changes is None
+
+    song = api.create_song(dict(test_song, lineage=['Santo Daime']))
+    assert api.get_song(song['song_id'])['title'] == 'Test Song'
+    assert api.list_songs()['total'] == 1
+
+    updated = api.update_song(song['song_id'], dict(test_song, title='Hino 10', bpm='96.5 bpm'))
+    assert updated['title'] == 'Hino 10'
+    stored = store.get(song['song_id'])
+    assert stored['title_key'] == collation_key('Hino 10')
+    assert plain(stored['bpm_value']) == plain(parse_bpm('96.5 bpm'))
+    assert store.count('santo-daime') == 0  # The update dropped the lineage
+
+    assert api.update_song('missing', test_song) is None
+    api.delete_song(song['song_id'])
+    assert api.get_song(song['song_id']) is None
+    assert api.list_songs() == {'items': [], 'total': 0}
+    assert api.list_changes() == {'changes': [], 'next_token': None, 'has_more': False}
+
+@pytest.mark.parametrize('sort,key', [
+    ('title', 'title_key'), ('-date_added', 'date_added_ts'), ('bpm', 'bpm_value'), (None, 'song_id'),
+])
+def test_sorted_pages(store, catalog, sort, key):
+    """Test pages come in index order, then song_id, and cover the catalog once."""
+    api = SongsApi(store=store)
+    seen, totals = _pages(api, sort=sort)
+    descending = bool(sort and sort.startswith('-'))
+    expected = sorted(catalog, key=lambda item: (plain(item[key]), item['song_id']), reverse=descending)
+    assert seen == [item['song_id'] for item in expected]
+    assert totals == {len(catalog)}
+
+def test_range_filtered_pages(store, catalog):
+    """Test BPM and duration ranges select the same songs the DynamoDB indexes would."""
+    api = SongsApi(store=store)
+    seen, totals = _pages(api, filters={'bpm_min': 60, 'bpm_max': 120, 'duration_max': 300})
+    expected = [item for item in catalog
+                if 60 <= item['bpm_value'] <= 120 and item.get('duration_s') is not None and item['duration_s'] <= 300]
+    assert expected
+    assert seen == [item['song_id'] for item in sorted(expected, key=lambda item: (item['bpm_value'], item['song_id']))]
+    assert totals == {None}
+
+    seen, _ = _pages(api, filters={'duration_min': 200})
+    assert set(seen) == {item['song_id'] for item in catalog if item.get('duration_s', -1) >= 200}
+
+    with pytest.raises(ValueError):
+        api.list_songs(filters={'duration_min': 200}, sort='title')
+
+def test_lineage_pages(store, test_song):
+    """Test lineage pages cover every song of the lineage, with its count as total."""
+    api = SongsApi(store=store)
+    expected = {api.create_song(dict(test_song, title=f'Hino {i}', lineage=['Santo Daime']))['song_id']
+                for i in range(30)}
+    api.create_song(dict(test_song, lineage=['Shipibo']))
+    seen, totals = _pages(api, lineage='Santo Daime')
+    assert sorted(seen) == sorted(expected)
+    assert totals == {30}
+    assert {song['song_id'] for song in api.random_songs(50, lineage='santo-daime')['items']} == expected
+
+def test_invalid_cursor(store, catalog):
+    """Test a cursor from another listing order is rejected."""
+    api = SongsApi(store=store)
+    cursor = api.list_songs(limit=5, sort='title')['next_cursor']
+    with pytest.raises(ValueError, match='cursor is not valid'):
+        api.list_songs(limit=5, cursor=cursor, sort='bpm')
+
+def test_search_matches_trigram_index(store, catalog):
+    """Test substring search returns the in-memory index's songs and scores."""
+    api = SongsApi(store=store)
+    index = TrigramIndex()
+    index.load(api._dump_songs(catalog))
+    queries = {word for item in catalog[:40] for word in (item.get('title') or '').split()[:2]}
+    queries |= {'hino', 'ayahuasca', 'do', 'x', 'zzzz'}
+    for query in sorted(queries):
+        result = api.search_songs(query, limit=10)
+        expected = index.search(query, limit=10)
+        assert [song['song_id'] for song in result['items']] == [song['song_id'] for song, _ in expected], query
+        assert result['scores'] == [score for _, score in expected], query
+
+def test_search_is_optional(store, mock_dynamodb):
+    """Test only stores with their own full-text index are searched directly."""
+    assert isinstance(store, SearchableStore)
+    assert SongsApi(store=store).search_index is None
+    assert not isinstance(DynamoDBSongStore(mock_dynamodb), SearchableStore)
+    assert SongsApi(mock_dynamodb).search_index is not None
+
+def test_fuzzy_search_tolerates_typos(store, test_song):
+    """Test fuzzy search finds a title with a typo, and exact search does not."""
+    api = SongsApi(store=store)
+    song = api.create_song(dict(test_song, title='Ayahuasca Chacrunita', artist='Don Augustín de Rivas'))
+    assert api.search_songs('chacrunitta')['items'] == []
+    assert [item['song_id'] for item in api.search_songs('chacrunitta', fuzzy=True)['items']] == [song['song_id']]
+
+def test_aggregates_match_dynamodb(store, catalog, mock_dynamodb, index_table):
+    """Test artist and album pages are the ones DynamoDB's aggregates give for the same songs."""
+    api = SongsApi(store=store)
+    aggregates = AggregateStore(index_table)
+    aggregates.rebuild(catalog)
+    artists = api.list_artists()['items']
+    assert artists == aggregates.get_artists()
+    for artist in artists[:10]:
+        page = api.get_artist(artist['slug'])
+        assert page == aggregates.get_artist(artist['slug'])
+        for album in page['albums']:
+            assert api.get_album(album['album_id']) == aggregates.get_album(album['album_id'])
+    assert api.get_artist('nobody') is None
+
+def test_concurrent_writes(store, test_song):
+    """Test creates and updates from many threads all commit."""
+    api = SongsApi(store=store)
+    created, errors = [], []
+
+    def write(n):
+        try:
+            for i in range(10):
+                song = api.create_song(dict(test_song, title=f'Hino {n}-{i}', lineage=['Santo Daime']))
+                api.update_song(song['song_id'], dict(test_song, title=f'Hino {n}-{i} revisado'))
+                created.append(song['song_id'])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert store.count() == len(created) == 80
+    assert store.count('santo-daime') == 0
+    assert len(api.search_songs('revisado', limit=100)['items']) == 80
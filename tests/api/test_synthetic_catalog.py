@@ -0,0 +1,74 @@
+"""
+Tests for the synthetic catalog generator.
+
+These tests verify that:
+1. Catalogs are reproducible for a size and seed
+2. Generated songs keep the seed's shape: missing fields, accents, artist and album fan-out
+3. API-shaped songs pass validation, and items load into a table the API can serve
+"""
+
+import io
+import json
+import pytest
+from api.core.schemas import song_schema
+from utilities.synthetic_catalog import (
+    CatalogModel, SONGS_JSON, default_model, generate, load_table, loads, write
+)
+
+def test_reproducible():
+    """Test the same size and seed give the same catalog, and another seed does not."""
+    assert generate(200, seed=7) == generate(200, seed=7)
+    assert generate(200, seed=7) != generate(200, seed=8)
+    assert len({item['song_id'] for item in generate(2000, seed=1)}) == 2000
+
+def test_raw_songs_follow_the_seed():
+    """Test uploader-shaped songs miss fields about as often as the seed and keep its accents."""
+    with open(SONGS_JSON) as f:
+        seed_songs = json.load(f)
+    songs = default_model().songs(5000, seed=1, raw=True)
+    for field in ('title', 'artist', 'album', 'date', 'bpm'):
+        expected = sum(1 for song in seed_songs if song.get(field)) / len(seed_songs)
+        observed = sum(1 for song in songs if song.get(field)) / len(songs)
+        assert abs(observed - expected) < 0.05, field
+    assert any(not song['title'].isascii() for song in songs if song.get('title'))
+    assert 'tracknumber' in {name for song in songs for name in song}
+
+def test_fan_out_scales_with_size():
+    """Test artists and albums grow with the catalog while songs per artist stay near the seed's."""
+    model = CatalogModel([
+        {'title': 'A b', 'artist': 'One', 'album': 'X'},
+        {'title': 'C d', 'artist': 'One', 'album': 'Y'},
+        {'title': 'E f', 'artist': 'One', 'album': 'X'},
+        {'title': 'G h', 'artist': 'Two', 'album': 'Z'},
+    ])
+    songs = model.songs(4000, seed=1)
+    artists = {song['artist'] for song in songs}
+    assert 1500 <= len(artists) <= 2500
+    albums = {(song['artist'], song['album']) for song in songs}
+    assert len(artists) <= len(albums) <= 2 * len(artists)
+
+def test_api_songs_are_valid():
+    """Test default songs pass the API's validation unchanged."""
+    for song in default_model().songs(500, seed=3):
+        assert song_schema.load(song) == song
+
+def test_loaded_catalog_is_served(mock_dynamodb, client):
+    """Test a bulk-loaded catalog is listed and sorted by the API."""
+    items = generate(300, seed=2)
+    assert load_table(mock_dynamodb, items) == 300
+    listed = json.loads(client('GET', '/songs')['body'])['items']
+    assert {song['song_id'] for song in listed} == {item['song_id'] for item in items}
+    page = json.loads(client('GET', '/songs', query_params={'sort': 'title', 'limit': '5'})['body'])
+    assert [song['song_id'] for song in page['items']] == \
+        [item['song_id'] for item in sorted(items, key=lambda item: (item['title_key'], item['song_id']))[:5]]
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_write_round_trip(ndjson):
+    """Test JSON and NDJSON output decode back to the same items."""
+    items = generate(50, seed=4)
+    output = io.StringIO()
+    write(items, output, ndjson=ndjson)
+    text = output.getvalue()
+    decoded = [loads(line) for line in text.splitlines()] if ndjson else loads(text)
+    assert decoded == items
+    assert len(text.splitlines()) == (50 if ndjson else 1)
@@ -0,0 +1,83 @@
+"""
+Tests for Server-Timing headers and the slow-request log.
+
+These tests verify that:
+1. Spans are recorded only while a collector is current
+2. DynamoDB, S3, dump and JSON time is reported when a request asks for it
+3. Requests over the threshold are logged with their breakdown
+"""
+
+import json
+import logging
+import pytest
+import api.app
+from api.core.timing import Timings, collect, span
+
+def _request(method, path, body=None, headers=None):
+    return api.app.lambda_handler({
+        'requestContext': {'http': {'method': method, 'path': path}},
+        'headers': headers or {},
+        'body': json.dumps(body) if body else None,
+    }, None)
+
+def _server_timing(response):
+    spans = {}
+    for metric in response['headers']['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        spans[name] = dict(param.split('=') for param in params)
+    return spans
+
+@pytest.fixture(autouse=True)
+def cold_sandbox(monkeypatch):
+    """Instrumented clients created inside each test's mocks."""
+    monkeypatch.setattr(api.app, '_aws_clients', None)
+
+def test_spans_need_a_collector():
+    """Test spans outside a collector are not recorded and the header lists each span."""
+    timings = Timings()
+    with span('dump'):
+        pass
+    with collect(timings):
+        for _ in range(2):
+            with span('dump'):
+                pass
+    assert timings.spans()['dump']['count'] == 2
+    header = timings.header()
+    assert header.startswith('dump;dur=') and ';desc="2x", total;dur=' in header
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_server_timing_on_request(test_song):
+    """Test the header breaks a request down by dependency and is only sent when asked for."""
+    _request('POST', '/songs', test_song)
+    response = _request('GET', '/songs', headers={'x-server-timing': '1'})
+    assert response['statusCode'] == 200
+    spans = _server_timing(response)
+    assert {'dynamodb', 'dump', 'json', 'total'} <= set(spans)
+    assert float(spans['total']['dur']) >= float(spans['dynamodb']['dur'])
+    assert response['headers']['Timing-Allow-Origin'] == '*'
+    assert 'Server-Timing' not in _request('GET', '/songs')['headers']
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_server_timing_from_env(monkeypatch):
+    """Test SERVER_TIMING adds the header to every response, including errors and S3 calls."""
+    monkeypatch.setattr(api.app, 'SERVER_TIMING', True)
+    response = _request('POST', '/presigned-url', {'key': 'song.mp3'})
+    assert response['statusCode'] == 404
+    assert _server_timing(response)['s3']['desc'] == '"1x"'
+
+@pytest.mark.usefixtures('mock_dynamodb')
+def test_slow_request_log(monkeypatch, caplog):
+    """Test requests over SLOW_REQUEST_MS are logged with their spans, without the header."""
+    monkeypatch.setattr(api.app, 'SLOW_REQUEST_MS', 0.001)
+    with caplog.at_level(logging.WARNING):
+        response = _request('GET', '/songs/missing')
+    assert response['statusCode'] == 404 and 'Server-Timing' not in response['headers']
+    logged = [json.loads(r.message)['slow_request'] for r in caplog.records if r.message.startswith('{"slow_request"')]
+    assert logged[0]['method'] == 'GET' and logged[0]['path'] == '/songs/missing'
+    assert logged[0]['status'] == 404
+    assert logged[0]['spans']['dynamodb']['count'] >= 1
+
+    monkeypatch.setattr(api.app, 'SLOW_REQUEST_MS', 0)
+    caplog.clear()
+    _request('GET', '/songs/missing')
+    assert not [r for r in caplog.records if r.message.startswith('{"slow_request"')]
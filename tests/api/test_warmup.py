@@ -0,0 +1,52 @@
+"""
+Tests for warm-up events and pooled AWS clients.
+
+These tests verify that:
+1. A warm-up event opens connections and loads caches without routing
+2. The first real request after a warm-up reuses the pooled clients
+3. Failed warm-up steps are reported, and clients near the deadline are not pooled
+"""
+
+import os
+import boto3
+import pytest
+import api.app
+from api.core.deadline import Deadline
+
+@pytest.fixture
+def cold_sandbox(monkeypatch):
+    """A sandbox that has not created its AWS clients yet."""
+    monkeypatch.setattr(api.app, '_aws_clients', None)
+
+@pytest.mark.usefixtures('mock_dynamodb', 'cold_sandbox')
+def test_warmup_then_first_request(monkeypatch, client, test_song):
+    """Test the first request after a warm-up creates no clients and finds the caches loaded."""
+    boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=os.environ['S3_BUCKET'])
+    client('POST', '/songs', test_song)
+
+    result = api.app.lambda_handler({'warmup': True, 'hold_ms': 0}, None)
+    assert result['warmup'] is True
+    assert set(result['report']) == {'dynamodb', 's3', 'caches'}
+    assert all('ms' in step for step in result['report'].values())
+    assert len(api.app.search_index) == 1
+
+    def no_new_clients(timeout):
+        raise AssertionError('connection setup on a warm sandbox')
+    monkeypatch.setattr(api.app, 'create_aws_clients', no_new_clients)
+    assert client('GET', '/songs')['statusCode'] == 200
+    assert client('GET', '/search', query_params={'q': 'test'})['statusCode'] == 200
+
+@pytest.mark.usefixtures('mock_dynamodb', 'cold_sandbox')
+def test_warmup_reports_failures():
+    """Test a failing step is reported and the others still run."""
+    dynamodb, s3_client = api.app.aws_clients()
+    report = api.app.warm_up(api.app.build_api(dynamodb), s3_client)
+    assert 'error' in report['s3']
+    assert 'ms' in report['dynamodb'] and 'ms' in report['caches']
+
+@pytest.mark.usefixtures('cold_sandbox')
+def test_clients_near_deadline_are_not_pooled():
+    """Test pooled clients are reused unless the deadline is shorter than their timeout."""
+    pooled = api.app.aws_clients()
+    assert api.app.aws_clients(Deadline.after(60)) is pooled
+    assert api.app.aws_clients(Deadline.after(1)) is not pooled
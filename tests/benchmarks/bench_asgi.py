@@ -0,0 +1,152 @@
+"""
+Throughput of the ASGI adapter against the Lambda event path.
+
+Both paths run the route mix of bench_handler.py over the same synthetic
+catalog in moto, at several levels of concurrency:
+
+- lambda: ``lambda_handler`` called with API Gateway v2 events from N
+  threads, as bench_handler.py does from one
+- asgi: N clients sending ASGI HTTP requests to one ``SongsAsgi`` worker,
+  which runs the handler in its bounded thread pool
+
+The ASGI numbers include building the event from the scope, the hop to
+the thread pool and back, and writing the response, but not an HTTP
+server's parsing: run a server such as uvicorn for that. Calls into moto
+are serialized, so past one client the numbers show how much of a request
+is the handler's own Python, not how DynamoDB would scale. Compare runs
+made on the same machine, not absolute numbers.
+
+Usage:
+    python tests/benchmarks/bench_asgi.py [--concurrency 1 8 32] [--requests 500] [--size 1000]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+from bench_handler import (
+    ROUTE_MIX, LambdaContext, load_catalog, make_event, next_request, percentile, serialize_moto
+)
+
+import app
+from asgi import SongsAsgi
+from moto import mock_aws
+
+serialize_moto()
+
+HEADERS = [(b'host', b'api.example.com'), (b'accept', b'application/json'),
+           (b'user-agent', b'bench-asgi/1.0'), (b'content-type', b'application/json')]
+
+def draw(requests, rng, data):
+    """The same ``requests`` requests for both paths."""
+    kinds, weights = list(ROUTE_MIX), list(ROUTE_MIX.values())
+    return [next_request(rng.choices(kinds, weights)[0], rng, data) for _ in range(requests)]
+
+def run_lambda(requests, concurrency):
+    """Send the requests through lambda_handler from ``concurrency`` threads; return latencies, 5xx, elapsed."""
+    pending, lock = iter(requests), threading.Lock()
+    latencies, errors = [], []
+
+    def client():
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            began = time.perf_counter()
+            response = app.lambda_handler(make_event(*request), LambdaContext())
+            latencies.append((time.perf_counter() - began) * 1000)
+            if response['statusCode'] >= 500:
+                errors.append(response['statusCode'])
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors), time.perf_counter() - start
+
+async def asgi_request(adapter, method, path, query, body):
+    """Send one request to the adapter as a server would; return the status."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'https', 'path': path, 'raw_path': path.encode(),
+        'query_string': urlencode(query or {}).encode(), 'headers': HEADERS,
+        'client': ('203.0.113.10', 50000), 'server': ('api.example.com', 443),
+    }
+    content = json.dumps(body).encode() if body is not None else b''
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': content, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await adapter(scope, receive, send)
+    return status[0]
+
+def run_asgi(adapter, requests, concurrency):
+    """Send the requests to the adapter from ``concurrency`` clients; return latencies, 5xx, elapsed."""
+    latencies, errors = [], []
+
+    async def client(pending):
+        for request in pending:
+            began = time.perf_counter()
+            status = await asgi_request(adapter, *request)
+            latencies.append((time.perf_counter() - began) * 1000)
+            if status >= 500:
+                errors.append(status)
+
+    async def main():
+        pending = iter(requests)  # Shared: each client takes the next request when it is free
+        await asyncio.gather(*(client(pending) for _ in range(concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return latencies, len(errors), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=500, help="Requests per path and level")
+    parser.add_argument('--size', type=int, default=1000, help="Songs in the catalog")
+    parser.add_argument('--threads', type=int, default=16, help="The adapter's thread pool size")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="Keep the handler's log output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    rng = random.Random(args.seed)
+    adapter = SongsAsgi(threads=args.threads, max_pending=max(args.concurrency), warm_up=False)
+    with mock_aws():
+        app._aws_clients = None
+        data = load_catalog(args.size, args.seed)
+        run_lambda(draw(50, rng, data), 1)  # Load the caches before either path is measured
+
+        print(f"{args.requests} requests per run over {args.size} songs, {args.threads} adapter threads")
+        print(f"{'clients':>7} {'path':<7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'5xx':>4} {'vs lambda':>10}")
+        for concurrency in args.concurrency:
+            requests = draw(args.requests, rng, data)
+            rates = {}
+            for path, runner in (('lambda', lambda: run_lambda(requests, concurrency)),
+                                 ('asgi', lambda: run_asgi(adapter, requests, concurrency))):
+                latencies, errors, elapsed = runner()
+                latencies.sort()
+                rates[path] = len(latencies) / elapsed
+                relative = f"{100 * (rates[path] / rates['lambda'] - 1):>+9.1f}%" if path != 'lambda' else ''
+                print(f"{concurrency:>7} {path:<7} {rates[path]:>8.1f} {percentile(latencies, 0.5):>8.2f} "
+                      f"{percentile(latencies, 0.95):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+                      f"{errors:>4} {relative:>10}")
+    adapter.executor.shutdown()
+
+if __name__ == '__main__':
+    main()
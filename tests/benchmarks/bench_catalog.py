@@ -0,0 +1,109 @@
+"""
+Benchmark for the in-memory catalog: columnar snapshot vs a list of dicts.
+
+Builds a synthetic catalog (100k songs by default, from
+utilities/synthetic_catalog.py) of items shaped like DynamoDB returns
+them (fresh strings per item, Decimal numbers) and reports the memory
+each representation holds, measured with tracemalloc, and the latency
+of typical filtered, sorted pages. Results are checked for parity
+first.
+
+Usage:
+    python tests/benchmarks/bench_catalog.py [--size 100000] [--repeat 20]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(os.path.join(ROOT, 'api'))
+sys.path.append(ROOT)
+
+from core.catalog import ColumnarCatalog
+from core.keys import MIN_KNOWN_BPM
+from utilities.synthetic_catalog import dumps, generate, loads
+
+def make_items(size, seed):
+    """Build stored items the way a DynamoDB scan returns them."""
+    # A JSON round trip gives every item its own strings and Decimals, like boto3 does
+    return loads(dumps(generate(size, seed)))
+
+def measure(build):
+    """Return (result, bytes still held, peak bytes) for building something."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+def dict_query(items, low, high, offset, limit):
+    """The list-of-dicts equivalent of a BPM-filtered page sorted by BPM."""
+    matched = [item for item in items if low <= item['bpm_value'] <= high]
+    matched.sort(key=lambda item: (item['bpm_value'], item['song_id']))
+    return [item['song_id'] for item in matched[offset:offset + limit]], len(matched)
+
+def best_ms(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    items, dict_bytes, _ = measure(lambda: make_items(args.size, args.seed))
+    catalog = ColumnarCatalog()
+    _, columnar_bytes, columnar_peak = measure(lambda: catalog.load(items, version=args.size))
+    # tracemalloc slows allocation down, so time a second load without it
+    load_s = best_ms(lambda: catalog.load(items, version=args.size), 1) / 1000
+
+    low, high = Decimal(100), Decimal(120)
+    songs, total = catalog.query('bpm_value', filters={'bpm_min': low, 'bpm_max': high}, offset=40, limit=20)
+    assert ([song['song_id'] for song in songs], total) == dict_query(items, low, high, 40, 20)
+    assert sorted(catalog.query(limit=args.size)[0], key=lambda s: s['song_id']) == \
+        sorted(({k: v for k, v in item.items() if k not in ('listing', 'seq')} for item in items),
+               key=lambda s: s['song_id'])
+
+    print(f'{args.size} songs; columnar load {load_s:.2f} s (peak {columnar_peak / 2**20:.1f} MiB)')
+    print(f"{'representation':>15} {'MiB':>8} {'bytes/song':>11}")
+    for name, size in (('list of dicts', dict_bytes), ('columnar', columnar_bytes)):
+        print(f'{name:>15} {size / 2**20:>8.1f} {size / args.size:>11,.0f}')
+    print(f'columnar holds {columnar_bytes / dict_bytes:.0%} of the list of dicts\n')
+
+    cases = {
+        'bpm 100-120 by bpm, page 3': (
+            lambda: dict_query(items, low, high, 40, 20),
+            lambda: catalog.query('bpm_value', filters={'bpm_min': low, 'bpm_max': high}, offset=40, limit=20)),
+        'all by -date_added, page 1': (
+            lambda: sorted(items, key=lambda item: item['date_added_ts'], reverse=True)[:20],
+            lambda: catalog.query('date_added_ts', ascending=False, limit=20)),
+        'lineage udv, page 1': (
+            lambda: sorted((i for i in items if 'UDV' in (i.get('lineage') or [])),
+                           key=lambda item: item['song_id'])[:20],
+            lambda: catalog.query(lineage='udv', limit=20)),
+        'bpm>0 and 3-5 min, page 1': (
+            lambda: dict_query([i for i in items if 180 <= (i.get('duration_s') or 0) <= 300],
+                               MIN_KNOWN_BPM, Decimal(300), 0, 20),
+            lambda: catalog.query('bpm_value', filters={'bpm_min': 0, 'duration_min': 180,
+                                                        'duration_max': 300}, limit=20)),
+    }
+    print(f"{'query':>28} {'dicts ms':>9} {'columnar ms':>12} {'speedup':>8}")
+    for name, (dicts, columnar) in cases.items():
+        slow, fast = best_ms(dicts, args.repeat), best_ms(columnar, args.repeat)
+        print(f'{name:>28} {slow:>9.2f} {fast:>12.3f} {slow / fast:>7.0f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Stress test for lambda_handler invoked from many threads at once.
+
+A self-hosted server, POST /batch and the thread pools inside a request
+all run the handler concurrently over the same module-level clients,
+caches and indexes. This harness loads a synthetic catalog into moto
+(as bench_handler.py does), turns on the in-memory catalog and song ID
+filter, and then runs 1 to 32 threads. The threads mix reads and writes,
+and every response is checked against what its own thread knows:
+
+- a read returns the song that was asked for, and batch sub-responses
+  match their own sub-requests
+- a thread reads back its own update: by ID, and through search
+- a created song can be read at once and is gone once deleted
+- a page of songs holds distinct, known songs, and its total only
+  differs from the catalog's by songs other threads have in flight
+- only requests asking for Server-Timing get the header
+- no request fails with a 5xx (requests and batch sub-requests that run
+  out of time under load are counted as timeouts instead)
+
+After each level, every song a thread updated is checked by ID and in
+the search index. Throughput is reported per thread count, and the exit
+status is 1 if any invariant was broken. Calls into moto are serialized
+(see below), so throughput past one thread mostly shows how much of a
+request is the handler's own Python rather than how DynamoDB would scale.
+
+Usage:
+    python tests/benchmarks/bench_concurrency.py [--threads 1 2 4 8 16 32] [--seconds 5]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+# The shared caches under test are opt-in; they must be on before app is imported
+os.environ.setdefault('MEMORY_CATALOG', 'true')
+os.environ.setdefault('SONG_ID_FILTER', 'true')
+# Time and log every request, so per-request timings are exercised too
+os.environ.setdefault('SLOW_REQUEST_MS', '0')
+# Rebuild the search index often, so rebuilds race with writes and searches
+os.environ.setdefault('SEARCH_INDEX_TTL_SECONDS', '1')
+
+from bench_handler import LambdaContext, load_catalog, make_event, serialize_moto
+
+import app
+from moto import mock_aws
+
+# Calls into moto are serialized; the handler's own code still runs concurrently
+serialize_moto()
+
+# Out of time under load: shed, not wrong. Counted as timeouts, not violations.
+OVERLOAD_CODES = {'DEADLINE_EXCEEDED', 'UPSTREAM_TIMEOUT', 'BATCH_TIMEOUT'}
+
+class Overloaded(Exception):
+    """A request was shed because it ran out of time."""
+
+class Worker:
+    """One thread's requests, and what it expects the API to say back."""
+
+    def __init__(self, number, rng, data, owned):
+        self.number, self.rng, self.data = number, rng, data
+        self.owned = owned
+        self.titles = {}  # song_id -> title this thread wrote last
+        self.ops = Counter()
+        self.violations = []
+        self.sequence = 0
+
+    def call(self, method, path, query=None, body=None, timing=False):
+        headers = {'x-server-timing': '1'} if timing else None
+        response = app.lambda_handler(make_event(method, path, query, body, headers), LambdaContext())
+        if response['statusCode'] >= 500 and json.loads(response['body']).get('code') in OVERLOAD_CODES:
+            raise Overloaded()
+        if response['statusCode'] >= 500:
+            self.fail(f'{method} {path} returned {response["statusCode"]}: {response.get("body")}')
+        if ('Server-Timing' in (response.get('headers') or {})) != timing:
+            self.fail(f'{method} {path}: Server-Timing header {"missing" if timing else "leaked"}')
+        body = response.get('body')
+        return response['statusCode'], json.loads(body) if body else None
+
+    def fail(self, message):
+        self.violations.append(f'thread {self.number}: {message}')
+
+    def token(self):
+        """A search term no other song or thread uses."""
+        self.sequence += 1
+        return f"zq{self.number:02d}x{self.sequence}".translate(str.maketrans('0123456789', 'abcdefghij'))
+
+    def step(self):
+        kind = self.rng.choices(['get', 'update', 'create', 'page', 'search', 'batch'],
+                                [40, 15, 5, 20, 10, 10])[0]
+        try:
+            getattr(self, f'_{kind}')()
+        except Overloaded:
+            self.ops['timeout'] += 1
+            return
+        self.ops[kind] += 1
+
+    def _get(self):
+        song_id = self.rng.choice(self.data['song_ids'])
+        status, song = self.call('GET', f'/songs/{song_id}', timing=self.rng.random() < 0.5)
+        if status != 200 or song.get('song_id') != song_id:
+            self.fail(f'GET {song_id} returned {status} {song and song.get("song_id")}')
+
+    def _update(self):
+        song_id = self.rng.choice(self.owned)
+        title = f'Hino {self.token()}'
+        status, song = self.call('GET', f'/songs/{song_id}')
+        if status != 200:
+            self.fail(f'GET {song_id} before update returned {status}')
+            return
+        song = {key: value for key, value in song.items() if key != 'song_id'}
+        try:
+            status, song = self.call('PUT', f'/songs/{song_id}', body=dict(song, title=title))
+        except Overloaded:
+            # It may have been written after all: stop expecting any title for this song
+            self.titles.pop(song_id, None)
+            self.owned.remove(song_id)
+            raise
+        if status != 200 or song.get('title') != title:
+            self.fail(f'PUT {song_id} returned {status} {song and song.get("title")!r}')
+            return
+        self.titles[song_id] = title
+        self._expect_title(song_id, title)
+
+    def _expect_title(self, song_id, title):
+        status, song = self.call('GET', f'/songs/{song_id}')
+        if status != 200 or song.get('title') != title:
+            self.fail(f'read after write of {song_id}: {status} {song and song.get("title")!r} != {title!r}')
+        status, found = self.call('GET', '/search', {'q': title.split()[-1]})
+        if status != 200 or song_id not in [item['song_id'] for item in found['items']]:
+            self.fail(f'search for {title!r} did not find {song_id}')
+
+    def _create(self):
+        song = dict(self.rng.choice(self.data['new_songs']), title=f'Hino {self.token()}')
+        song.pop('song_id', None)
+        try:
+            status, created = self.call('POST', '/songs', body=song)
+        except Overloaded:
+            self.data['orphans'].append(None)  # May exist, and will not be deleted
+            raise
+        if status != 201 or created.get('title') != song['title']:
+            self.fail(f'POST returned {status} {created and created.get("title")!r}')
+            return
+        song_id = created['song_id']
+        status, read = self.call('GET', f'/songs/{song_id}')
+        if status != 200 or read.get('song_id') != song_id:
+            self.fail(f'new song {song_id} read back as {status}')
+        try:
+            status, _ = self.call('DELETE', f'/songs/{song_id}')
+        except Overloaded:
+            self.data['orphans'].append(song_id)
+            raise
+        if status != 204:
+            self.fail(f'DELETE {song_id} returned {status}')
+        status, _ = self.call('GET', f'/songs/{song_id}')
+        if status != 404:
+            self.fail(f'deleted song {song_id} read back as {status}')
+
+    def _page(self):
+        query = {'limit': 20}
+        if self.rng.random() < 0.5:
+            query['sort'] = self.rng.choice(['title', '-date_added', 'bpm'])
+        status, page = self.call('GET', '/songs', query, timing=self.rng.random() < 0.5)
+        if status != 200:
+            self.fail(f'GET /songs {query} returned {status}')
+            return
+        # Other threads' songs come and go, one each at a time, plus any a timeout left behind
+        song_ids = [item.get('song_id') for item in page['items']]
+        in_flight = self.data['threads'] + len(self.data['orphans'])
+        if not self.data['size'] <= page['total'] <= self.data['size'] + in_flight:
+            self.fail(f'GET /songs {query} total {page["total"]} for {self.data["size"]} songs')
+        if len(song_ids) != min(20, page['total']) or len(set(song_ids)) != len(song_ids):
+            self.fail(f'GET /songs {query} returned {len(song_ids)} songs, {len(set(song_ids))} distinct')
+        for item in page['items']:
+            if item.get('song_id') not in self.data['known'] and not item.get('title', '').startswith('Hino zq'):
+                self.fail(f'GET /songs {query} returned unknown song {item.get("song_id")}')
+
+    def _search(self):
+        if not self.titles:
+            return self._get()
+        song_id = self.rng.choice(list(self.titles))
+        self._expect_title(song_id, self.titles[song_id])
+
+    def _batch(self):
+        song_ids = self.rng.sample(self.data['song_ids'], 5)
+        status, result = self.call('POST', '/batch', body={
+            'requests': [{'method': 'GET', 'path': f'/songs/{song_id}'} for song_id in song_ids]
+        })
+        if status != 200:
+            self.fail(f'POST /batch returned {status}')
+            return
+        for song_id, response in zip(song_ids, result['responses']):
+            body = response.get('body') or {}
+            if body.get('code') in OVERLOAD_CODES:
+                self.ops['timeout'] += 1
+                continue
+            if response.get('status') != 200 or body.get('song_id') != song_id:
+                self.fail(f'batch sub-request for {song_id} got {response.get("status")} {body.get("song_id")}')
+
+    def check_final(self):
+        """After every thread has stopped: the last title written is what the API serves."""
+        try:
+            for song_id, title in self.titles.items():
+                self._expect_title(song_id, title)
+        except Overloaded:
+            self.fail('timed out with no load')
+
+def run_level(threads, seconds, data, seed):
+    """Run ``threads`` workers for ``seconds``; return ops, elapsed time and violations."""
+    owned = defaultdict(list)
+    for i, song_id in enumerate(data['song_ids']):
+        owned[i % threads].append(song_id)
+    data = dict(data, threads=threads)
+    workers = [Worker(n, random.Random(seed * 1000 + n), data, owned[n]) for n in range(threads)]
+    stop = threading.Event()
+    errors = []
+
+    def loop(worker):
+        try:
+            while not stop.is_set():
+                worker.step()
+        except Exception as e:  # A crash in the harness or handler is a violation too
+            errors.append(f'thread {worker.number}: {type(e).__name__}: {e}')
+
+    pool = [threading.Thread(target=loop, args=(worker,)) for worker in workers]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.check_final()
+    ops = sum((worker.ops for worker in workers), Counter())
+    timeouts = ops.pop('timeout', 0)
+    violations = errors + [message for worker in workers for message in worker.violations]
+    return ops, timeouts, elapsed, violations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--seconds', type=float, default=5, help="Duration of each level")
+    parser.add_argument('--size', type=int, default=1000, help="Songs in the catalog")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="Keep the handler's log output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    total_violations = []
+    with mock_aws():
+        app._aws_clients = None
+        data = load_catalog(args.size, args.seed)
+        data.update(size=args.size, known=set(data['song_ids']), orphans=[])
+        # Load the shared caches once, so every level starts warm
+        app.lambda_handler(make_event('GET', '/search', {'q': 'hino'}), LambdaContext())
+        app.lambda_handler(make_event('GET', '/songs', {'limit': 1}), LambdaContext())
+
+        print(f"{'threads':>7} {'ops':>7} {'ops/s':>8} {'scaling':>8} {'timeouts':>9} {'violations':>11}")
+        base = None
+        for threads in args.threads:
+            ops, timeouts, elapsed, violations = run_level(threads, args.seconds, data, args.seed)
+            rate = sum(ops.values()) / elapsed
+            base = base or rate
+            print(f'{threads:>7} {sum(ops.values()):>7} {rate:>8.1f} {rate / base:>7.2f}x {timeouts:>9} {len(violations):>11}')
+            total_violations += violations
+
+    if total_violations:
+        print(f'\n{len(total_violations)} invariant violations, first 20:')
+        for message in total_violations[:20]:
+            print(f'  {message}')
+        sys.exit(1)
+    print('\nNo invariant violations')
+
+if __name__ == '__main__':
+    main()
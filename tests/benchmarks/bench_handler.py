@@ -0,0 +1,356 @@
+"""
+Load test for lambda_handler: a weighted mix of routes against moto.
+
+Loads a synthetic catalog (utilities/synthetic_catalog.py) into moto
+DynamoDB and S3, builds the derived indexes, then invokes lambda_handler
+in process with API Gateway v2 events. Reports throughput and p50/p95/p99
+latency for each kind of request in the mix: a route, or a variant of one
+such as a page vs the whole catalog on GET /songs. Results can be saved
+as JSON and compared with a saved baseline. Handler logs are silenced
+unless --verbose. Moto latencies are not DynamoDB's, so compare runs made
+on the same machine, not absolute numbers. With --storage sqlite the
+catalog is loaded into a SQLite database instead (S3 is still moto's).
+
+Usage:
+    python tests/benchmarks/bench_handler.py [--size 1000] [--requests 1000] [--output results.json]
+    python tests/benchmarks/bench_handler.py --storage sqlite
+    python tests/benchmarks/bench_handler.py --baseline baseline.json [--max-regression 20]
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlencode
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+# First, so that `app` is the API's and not infrastructure/app.py when that is on PYTHONPATH
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+sys.path.append(ROOT)
+
+for name, value in (('AWS_DEFAULT_REGION', 'us-east-1'), ('AWS_ACCESS_KEY_ID', 'testing'),
+                    ('AWS_SECRET_ACCESS_KEY', 'testing'), ('DYNAMODB_TABLE_NAME', 'bench-songs'),
+                    ('INDEX_TABLE_NAME', 'bench-index'), ('S3_BUCKET', 'bench-songs')):
+    os.environ.setdefault(name, value)
+
+import boto3
+from moto import mock_aws
+from moto.core.botocore_stubber import BotocoreStubber
+
+import app
+from core.emf import route_template
+from core.sqlite_store import SqliteSongStore
+from utilities.synthetic_catalog import default_model, generate, load_table
+
+LAMBDA_TIMEOUT_MS = 29000
+UPLOADED = 50  # songs whose audio is in the bucket, for presigned URLs
+
+# Kind of request -> weight; requests are drawn in proportion to weight
+ROUTE_MIX = {
+    'page': 25,          # GET /songs?limit=20, sometimes sorted
+    'get': 25,           # GET /songs/{song_id}
+    'search': 12,        # GET /search?q=
+    'random': 8,         # GET /songs/random
+    'artists': 5,        # GET /artists
+    'artist': 5,         # GET /artists/{slug}
+    'lineage': 5,        # GET /songs?lineage=
+    'create': 5,         # POST /songs
+    'update': 4,         # PUT /songs/{song_id}
+    'missing': 3,        # GET /songs/{song_id} for an unknown ID
+    'presign': 2,        # POST /presigned-url
+    'list_all': 1,       # GET /songs (whole catalog)
+}
+
+class LambdaContext:
+    """The parts of the Lambda context the handler reads."""
+
+    def __init__(self, timeout_ms=LAMBDA_TIMEOUT_MS):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = 'bench-songs-api'
+        self.memory_limit_in_mb = 512
+        self._deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+def serialize_moto():
+    """Let only one thread at a time into moto, for benchmarks that call the handler concurrently.
+
+    moto's backends are not thread-safe (a transaction deep-copies a table
+    that other threads are writing to). Real DynamoDB serializes conflicting
+    writes server-side, so this keeps the service linearizable without
+    changing the handler, whose own code still runs concurrently.
+    """
+    lock = threading.Lock()
+    process_request = BotocoreStubber.process_request
+
+    def serialized(self, request):
+        with lock:
+            return process_request(self, request)
+
+    BotocoreStubber.process_request = serialized
+
+def make_event(method, path, query=None, body=None, headers=None):
+    """Build an API Gateway HTTP API (payload v2.0) event."""
+    event = {
+        'version': '2.0',
+        'routeKey': '$default',
+        'rawPath': path,
+        'rawQueryString': urlencode(query or {}),
+        'headers': {
+            'accept': 'application/json',
+            'host': 'api.example.com',
+            'user-agent': 'bench-handler/1.0',
+            'x-forwarded-for': '203.0.113.10',
+            'x-forwarded-proto': 'https',
+            **({'content-type': 'application/json'} if body is not None else {}),
+            **(headers or {}),
+        },
+        'requestContext': {
+            'accountId': '123456789012',
+            'apiId': 'bench',
+            'domainName': 'api.example.com',
+            'http': {'method': method, 'path': path, 'protocol': 'HTTP/1.1',
+                     'sourceIp': '203.0.113.10', 'userAgent': 'bench-handler/1.0'},
+            'requestId': str(uuid.uuid4()),
+            'routeKey': '$default',
+            'stage': '$default',
+            'timeEpoch': int(time.time() * 1000),
+        },
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False,
+    }
+    if query:
+        event['queryStringParameters'] = {key: str(value) for key, value in query.items()}
+    return event
+
+def create_resources():
+    """Create the songs table, index table and bucket the way the stacks define them."""
+    dynamodb = boto3.resource('dynamodb')
+    indexes = [('title-index', 'title_key', 'S'), ('date-added-index', 'date_added_ts', 'N'),
+               ('bpm-index', 'bpm_value', 'N'), ('duration-index', 'duration_s', 'N'),
+               ('changes-index', 'seq', 'N')]
+    songs = dynamodb.create_table(
+        TableName=os.environ['DYNAMODB_TABLE_NAME'],
+        KeySchema=[{'AttributeName': 'song_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'song_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'listing', 'AttributeType': 'S'}] +
+                             [{'AttributeName': key, 'AttributeType': kind} for _, key, kind in indexes],
+        GlobalSecondaryIndexes=[{
+            'IndexName': index_name,
+            'KeySchema': [{'AttributeName': 'listing', 'KeyType': 'HASH'},
+                          {'AttributeName': key, 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'ALL'},
+        } for index_name, key, _ in indexes],
+        BillingMode='PAY_PER_REQUEST',
+    )
+    dynamodb.create_table(
+        TableName=os.environ['INDEX_TABLE_NAME'],
+        KeySchema=[{'AttributeName': 'pk', 'KeyType': 'HASH'},
+                   {'AttributeName': 'sk', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'pk', 'AttributeType': 'S'},
+                              {'AttributeName': 'sk', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST',
+    )
+    boto3.client('s3').create_bucket(Bucket=os.environ['S3_BUCKET'])
+    return songs
+
+def load_catalog(size, seed, storage='dynamodb'):
+    """Load a synthetic catalog and build everything derived from it.
+
+    Args:
+        storage: ``dynamodb`` (moto tables) or ``sqlite`` (a database in a temporary directory)
+
+    Returns:
+        dict: Values the route mix draws from (song IDs, artist slugs, words, lineages)
+    """
+    items = generate(size, seed)
+    s3_client = boto3.client('s3')
+    if storage == 'sqlite':
+        app.STORAGE_BACKEND = 'sqlite'
+        app._sqlite_store = SqliteSongStore(os.path.join(tempfile.mkdtemp(prefix='bench-songs-'), 'songs.db'))
+        for item in items:
+            app._sqlite_store.create(item)
+        s3_client.create_bucket(Bucket=os.environ['S3_BUCKET'])
+    else:
+        load_table(create_resources(), items)
+    for item in items[:UPLOADED]:
+        s3_client.put_object(Bucket=os.environ['S3_BUCKET'], Key=f"songs/{item['song_id']}.mp3", Body=b'ID3')
+    api = app.build_api(app.aws_clients()[0])
+    if storage == 'dynamodb':
+        api.changes.next_sequence(len(items))  # New writes sort after the loaded items
+        api.reconcile_counters()
+        api.repair_aggregates()
+        api.rebuild_lineage_index()
+        api.refresh_shuffle()
+    artists = json.loads(app.lambda_handler(make_event('GET', '/artists'), LambdaContext())['body'])
+    return {
+        'song_ids': [item['song_id'] for item in items],
+        'slugs': [artist['slug'] for artist in artists['items']],
+        'words': [word for item in items[:500] for word in item['title'].split() if len(word) > 3],
+        'lineages': sorted({name for item in items for name in item.get('lineage') or []}),
+        'new_songs': default_model().songs(1000, seed + 1),
+    }
+
+def next_request(kind, rng, data):
+    """Return (method, path, query, body) for one request of a kind in ROUTE_MIX."""
+    if kind == 'page':
+        query = {'limit': 20}
+        if rng.random() < 0.5:
+            query['sort'] = rng.choice(['title', '-date_added', 'bpm'])
+        return 'GET', '/songs', query, None
+    if kind == 'get':
+        return 'GET', f"/songs/{rng.choice(data['song_ids'])}", None, None
+    if kind == 'search':
+        return 'GET', '/search', {'q': rng.choice(data['words']), 'fuzzy': rng.choice(['true', 'false'])}, None
+    if kind == 'random':
+        return 'GET', '/songs/random', {'n': 20}, None
+    if kind == 'artists':
+        return 'GET', '/artists', None, None
+    if kind == 'artist':
+        return 'GET', f"/artists/{rng.choice(data['slugs'] or ['unknown'])}", None, None
+    if kind == 'lineage':
+        return 'GET', '/songs', {'lineage': rng.choice(data['lineages'] or ['Santo Daime']), 'limit': 20}, None
+    if kind == 'create':
+        song = dict(rng.choice(data['new_songs']))
+        song.pop('song_id', None)
+        return 'POST', '/songs', None, song
+    if kind == 'update':
+        # PUT replaces the whole song, so send a full one
+        song = dict(rng.choice(data['new_songs']), bpm=str(rng.randint(60, 160)))
+        song.pop('song_id', None)
+        return 'PUT', f"/songs/{rng.choice(data['song_ids'])}", None, song
+    if kind == 'missing':
+        return 'GET', f'/songs/{uuid.UUID(int=rng.getrandbits(128))}', None, None
+    if kind == 'presign':
+        return 'POST', '/presigned-url', None, {'key': f"songs/{rng.choice(data['song_ids'][:UPLOADED])}.mp3"}
+    if kind == 'list_all':
+        return 'GET', '/songs', None, None
+    raise ValueError(f'Unknown request kind: {kind}')
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, min(len(values) - 1, math.ceil(q * len(values)) - 1))]
+
+def summarize(latencies, errors, routes, elapsed):
+    """Throughput and latency percentiles per kind of request, and in total."""
+    def stats(values, error_count):
+        values = sorted(values)
+        return {
+            'requests': len(values),
+            'errors': error_count,
+            'rps': round(len(values) / elapsed, 1),
+            'mean_ms': round(statistics.fmean(values), 2),
+            'p50_ms': round(percentile(values, 0.50), 2),
+            'p95_ms': round(percentile(values, 0.95), 2),
+            'p99_ms': round(percentile(values, 0.99), 2),
+        }
+    kinds = {kind: dict(route=routes[kind], **stats(values, errors[kind]))
+             for kind, values in sorted(latencies.items())}
+    everything = [value for values in latencies.values() for value in values]
+    return kinds, stats(everything, sum(errors.values()))
+
+def run(requests, rng, data, mix=None, warmup=50):
+    """Send ``requests`` requests drawn from the mix.
+
+    Returns:
+        tuple: Latencies (ms), 5xx counts and route templates per kind, and elapsed seconds
+    """
+    mix = mix or ROUTE_MIX
+    kinds, weights = list(mix), list(mix.values())
+    for _ in range(warmup):
+        method, path, query, body = next_request(rng.choices(kinds, weights)[0], rng, data)
+        app.lambda_handler(make_event(method, path, query, body), LambdaContext())
+
+    latencies, errors, routes = defaultdict(list), defaultdict(int), {}
+    start = time.perf_counter()
+    for _ in range(requests):
+        kind = rng.choices(kinds, weights)[0]
+        method, path, query, body = next_request(kind, rng, data)
+        event, context = make_event(method, path, query, body), LambdaContext()
+        began = time.perf_counter()
+        response = app.lambda_handler(event, context)
+        latencies[kind].append((time.perf_counter() - began) * 1000)
+        routes[kind] = route_template(method, path)
+        if response['statusCode'] >= 500:
+            errors[kind] += 1
+    return latencies, errors, routes, time.perf_counter() - start
+
+def compare(results, baseline, max_regression):
+    """Print the change from a baseline; return the routes whose p95 regressed too far."""
+    print(f"\n{'vs baseline':<10} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    regressed = []
+    rows = {kind: (row, baseline.get('routes', {}).get(kind)) for kind, row in results['routes'].items()}
+    rows['TOTAL'] = (results['total'], baseline.get('total'))
+    for kind, (row, base) in rows.items():
+        if not base:
+            print(f'{kind:<10} {"(new)":>8}')
+            continue
+        changes = [100 * (row[key] - base[key]) / base[key] if base[key] else 0.0
+                   for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms')]
+        print(f'{kind:<10} ' + ' '.join(f'{change:>+7.1f}%' for change in changes))
+        if max_regression is not None and changes[2] > max_regression and kind != 'TOTAL':
+            regressed.append(kind)
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=1000, help="Songs in the catalog")
+    parser.add_argument('--requests', type=int, default=1000, help="Measured requests")
+    parser.add_argument('--warmup', type=int, default=50, help="Unmeasured requests sent first")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--storage', choices=('dynamodb', 'sqlite'), default='dynamodb', help="Where songs are kept")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare with results saved by an earlier run")
+    parser.add_argument('--max-regression', type=float,
+                        help="Exit with status 1 if a route's p95 is this many percent above the baseline")
+    parser.add_argument('--verbose', action='store_true', help="Keep the handler's log output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    with mock_aws():
+        app._aws_clients = None
+        data = load_catalog(args.size, args.seed, args.storage)
+        latencies, errors, templates, elapsed = run(args.requests, rng, data, warmup=args.warmup)
+    routes, total = summarize(latencies, errors, templates, elapsed)
+    results = {
+        'meta': {
+            'size': args.size, 'requests': args.requests, 'seed': args.seed, 'storage': args.storage, 'mix': ROUTE_MIX,
+            'python': platform.python_version(), 'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'total': total,
+        'routes': routes,
+    }
+
+    print(f"{args.requests} requests over {args.size} songs in {elapsed:.1f} s")
+    print(f"{'kind':<10} {'route':<24} {'count':>6} {'5xx':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for kind, row in list(routes.items()) + [('TOTAL', dict(total, route=''))]:
+        print(f"{kind:<10} {row['route']:<24} {row['requests']:>6} {row['errors']:>4} {row['rps']:>8.1f} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(results, json.load(f), args.max_regression)
+        if regressed:
+            print(f"p95 regressed more than {args.max_regression}%: {', '.join(regressed)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
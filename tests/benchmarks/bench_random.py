@@ -0,0 +1,94 @@
+"""
+Benchmark for GET /songs/random against a moto-backed DynamoDB.
+
+Loads synthetic catalogs (utilities/synthetic_catalog.py), builds the
+shuffle, then times samples of n songs from the shuffle against the old
+approach of scanning the whole catalog and sampling in memory. Moto latencies are not DynamoDB's: a
+sample reads at most n + n/4 + 2 chunk items (each within one 4 KB read
+unit) plus the songs, so its cost levels off once the catalog has that
+many chunks (around 20k songs for n = 20), while the scan keeps growing
+linearly. Moto spends most of the shuffle time decoding the chunk lists.
+
+Usage:
+    python tests/benchmarks/bench_random.py [--sizes 1000 5000] [--n 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(os.path.join(ROOT, 'api'))
+sys.path.append(ROOT)
+
+for name, value in (('AWS_DEFAULT_REGION', 'us-east-1'), ('AWS_ACCESS_KEY_ID', 'testing'),
+                    ('AWS_SECRET_ACCESS_KEY', 'testing')):
+    os.environ.setdefault(name, value)
+
+import boto3
+from moto import mock_aws
+
+from core.scans import parallel_scan
+from core.shuffle import ShuffleIndex
+from utilities.synthetic_catalog import generate, load_table
+
+def create_tables(dynamodb, suffix):
+    """Create a bare songs table and index table."""
+    songs = dynamodb.create_table(
+        TableName=f'bench-songs-{suffix}',
+        KeySchema=[{'AttributeName': 'song_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'song_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    index = dynamodb.create_table(
+        TableName=f'bench-index-{suffix}',
+        KeySchema=[{'AttributeName': 'pk', 'KeyType': 'HASH'},
+                   {'AttributeName': 'sk', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'pk', 'AttributeType': 'S'},
+                              {'AttributeName': 'sk', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    return songs, index
+
+def time_ms(fn, runs):
+    """Return per-run latencies in milliseconds."""
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return sorted(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--n', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'songs':>8} {'method':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        for size in args.sizes:
+            songs, index = create_tables(dynamodb, size)
+            load_table(songs, generate(size, seed=size))
+            shuffle = ShuffleIndex(index)
+            shuffle.refresh(parallel_scan(songs))
+
+            def scan_sample():
+                items = list(parallel_scan(songs, total_segments=1))
+                return rng.sample(items, args.n)
+
+            for method, fn in (('shuffle', lambda: shuffle.sample(songs, args.n)),
+                               ('scan', scan_sample)):
+                runs = args.runs if method == 'shuffle' else max(3, args.runs // 10)
+                latencies = time_ms(fn, runs)
+                p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+                print(f'{size:>8} {method:>8} {statistics.median(latencies):>8.1f} {p95:>8.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark for trigram search latency as the catalog grows.
+
+Builds synthetic catalogs of 1k, 10k and 100k songs with
+utilities/synthetic_catalog.py, then times fuzzy and exact queries with typos.
+Query latency should stay roughly flat across catalog sizes because
+candidates come from posting lists, not from the whole catalog.
+
+Usage:
+    python tests/benchmarks/bench_search.py [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(os.path.join(ROOT, 'api'))
+sys.path.append(ROOT)
+
+from core.search import TrigramIndex
+from utilities.synthetic_catalog import default_model
+
+def add_typo(text, rng):
+    """Swap, drop or replace one character."""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.choice(('swap', 'drop', 'replace'))
+    if kind == 'swap':
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    if kind == 'drop':
+        return text[:i] + text[i + 1:]
+    return text[:i] + rng.choice('aeiou') + text[i + 1:]
+
+def time_queries(index, queries, fuzzy):
+    """Return per-query latencies in microseconds."""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, fuzzy=fuzzy)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'songs':>8} {'build s':>8} {'mode':>6} {'p50 us':>8} {'p95 us':>8} {'p99 us':>8}")
+    for size in args.sizes:
+        catalog = default_model().songs(size, args.seed)
+        index = TrigramIndex()
+        start = time.perf_counter()
+        index.load(catalog)
+        build = time.perf_counter() - start
+
+        targets = rng.sample(catalog, min(args.queries, size))
+        exact = [' '.join(song['title'].split()[:2]) for song in targets]
+        fuzzy = [add_typo(song['title'], rng) for song in targets]
+
+        for mode, queries in (('exact', exact), ('fuzzy', fuzzy)):
+            latencies = sorted(time_queries(index, queries, fuzzy=mode == 'fuzzy'))
+            p50 = statistics.median(latencies)
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            print(f'{size:>8} {build:>8.2f} {mode:>6} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark for song serialization: compiled serializer vs marshmallow.
+
+Dumps and loads a synthetic catalog (10k songs by default) shaped like
+DynamoDB items, with Decimal numbers and derived attributes, and reports
+throughput for each implementation. Output is checked for parity first.
+
+Usage:
+    python tests/benchmarks/bench_serializer.py [--size 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(os.path.join(ROOT, 'api'))
+sys.path.append(ROOT)
+
+from core.schemas import song_schema
+from core.serializer import compile_schema
+from utilities.synthetic_catalog import default_model, stored_items
+
+def make_items(size, seed):
+    """Build stored items and the matching create payloads."""
+    payloads = default_model().songs(size, seed)
+    return stored_items(payloads), payloads
+
+def best_rate(fn, data, repeat):
+    """Return the best items-per-second over several runs."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in data:
+            fn(item)
+        best = max(best, len(data) / (time.perf_counter() - start))
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    items, payloads = make_items(args.size, args.seed)
+
+    start = time.perf_counter()
+    compiled = compile_schema(song_schema)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    for item, payload in zip(items[:1000], payloads[:1000]):
+        assert json.dumps(compiled.dump(item)) == json.dumps(song_schema.dump(item))
+        assert compiled.load(payload) == song_schema.load(payload)
+
+    print(f'compiled in {compile_ms:.1f} ms; {args.size} items, best of {args.repeat}')
+    print(f"{'op':>5} {'marshmallow/s':>14} {'compiled/s':>12} {'speedup':>8}")
+    for op, data in (('dump', items), ('load', payloads)):
+        slow = best_rate(getattr(song_schema, op), data, args.repeat)
+        fast = best_rate(getattr(compiled, op), data, args.repeat)
+        print(f'{op:>5} {slow:>14,.0f} {fast:>12,.0f} {fast / slow:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
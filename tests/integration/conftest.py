@@ -3,19 +3,21 @@ Pytest configuration and fixtures for the Songs API tests.
 
 This module sets up the test environment with:
 - Mocked AWS credentials for testing
-- A test client for making Lambda invocations
-- A mocked DynamoDB table for testing database operations
+- A test client for making Lambda invocations, or requests through the ASGI adapter
+- A mocked DynamoDB table for testing database operations, or a SQLite database in its place
 - A mocked S3 bucket for testing pre-signed URLs
 
 The fixtures defined here are automatically available to all test files.
 """
 
+import asyncio
 import pytest
 import json
 import sys
 import os
 import boto3
 from moto import mock_aws
+from urllib.parse import urlencode
 from uuid import uuid4
 
 # Add the api directory to the Python path
@@ -23,6 +25,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'api'))
 
 # Set environment variables for testing
 os.environ['DYNAMODB_TABLE_NAME'] = 'test-songs-table'
+os.environ['INDEX_TABLE_NAME'] = 'test-index-table'
 os.environ['S3_BUCKET'] = 'ourchants-songs'  # Update to match new bucket name
 os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
 os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
@@ -30,6 +33,19 @@ os.environ['AWS_SECURITY_TOKEN'] = 'testing'
 os.environ['AWS_SESSION_TOKEN'] = 'testing'
 os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
 
+@pytest.fixture(autouse=True)
+def reset_search_index():
+    """
+    Clear the sandbox-wide search index between tests.
+    
+    The index lives at module level in app.py so warm invocations can reuse
+    it; without this, songs from one test's mock table would leak into the next.
+    """
+    from api.app import search_index
+    search_index.clear()
+    yield
+    search_index.clear()
+
 @pytest.fixture
 def mock_dynamodb():
     """Create a mock DynamoDB table for testing."""
@@ -44,13 +60,55 @@ def mock_dynamodb():
                 {'AttributeName': 'song_id', 'KeyType': 'HASH'}
             ],
             AttributeDefinitions=[
-                {'AttributeName': 'song_id', 'AttributeType': 'S'}
+                {'AttributeName': 'song_id', 'AttributeType': 'S'},
+                {'AttributeName': 'listing', 'AttributeType': 'S'},
+                {'AttributeName': 'title_key', 'AttributeType': 'S'},
+                {'AttributeName': 'date_added_ts', 'AttributeType': 'N'},
+                {'AttributeName': 'bpm_value', 'AttributeType': 'N'},
+                {'AttributeName': 'duration_s', 'AttributeType': 'N'},
+                {'AttributeName': 'seq', 'AttributeType': 'N'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': index_name,
+                    'KeySchema': [
+                        {'AttributeName': 'listing', 'KeyType': 'HASH'},
+                        {'AttributeName': sort_key, 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+                for index_name, sort_key in [
+                    ('title-index', 'title_key'),
+                    ('date-added-index', 'date_added_ts'),
+                    ('bpm-index', 'bpm_value'),
+                    ('duration-index', 'duration_s'),
+                    ('changes-index', 'seq')
+                ]
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        
+        # Create the index table for derived documents (aggregates etc.)
+        dynamodb.create_table(
+            TableName='test-index-table',
+            KeySchema=[
+                {'AttributeName': 'pk', 'KeyType': 'HASH'},
+                {'AttributeName': 'sk', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'pk', 'AttributeType': 'S'},
+                {'AttributeName': 'sk', 'AttributeType': 'S'}
             ],
             BillingMode='PAY_PER_REQUEST'
         )
         
         yield table
 
+@pytest.fixture
+def index_table(mock_dynamodb):
+    """Return the mock index table created alongside the songs table."""
+    return boto3.resource('dynamodb').Table('test-index-table')
+
 @pytest.fixture
 def mock_s3():
     """Create a mock S3 bucket for testing."""
@@ -65,11 +123,61 @@ def mock_s3():
         yield s3
 
 # Import the app after setting up environment variables
+import api.app
 from api.app import lambda_handler
+from api.asgi import SongsAsgi
+from api.core.sqlite_store import SqliteSongStore
+
+def asgi_request(app, method, path, body=None, query_params=None):
+    """Send one request through an ASGI app, as a server would, and return it as a Lambda response."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(query_params or {}).encode(),
+        'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': json.dumps(body).encode() if body else b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, *rest = messages
+    return {
+        'statusCode': start['status'],
+        'headers': {name.decode(): value.decode() for name, value in start['headers']},
+        'body': b''.join(message.get('body', b'') for message in rest).decode(),
+    }
+
+@pytest.fixture(scope='session')
+def asgi_app():
+    """One ASGI adapter for the session, as a server worker would keep it."""
+    app = SongsAsgi(threads=4, warm_up=False)
+    yield app
+    app.executor.shutdown()
 
 @pytest.fixture
-def client(mock_dynamodb):
-    """Create a test client."""
+def sqlite_storage(monkeypatch, tmp_path):
+    """Keep songs in a fresh SQLite database instead of DynamoDB."""
+    store = SqliteSongStore(str(tmp_path / 'songs.db'))
+    monkeypatch.setattr(api.app, 'STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setattr(api.app, '_sqlite_store', store)
+    yield store
+    store.close()
+
+@pytest.fixture(params=['lambda', 'asgi', 'sqlite'])
+def client(request, mock_dynamodb):
+    """Create a test client, calling the Lambda handler, the ASGI adapter, or the handler over SQLite."""
     def invoke(method, path, body=None, query_params=None):
         """Simulate API Gateway call."""
         event = {
@@ -83,7 +191,12 @@ def client(mock_dynamodb):
             'queryStringParameters': query_params
         }
         return lambda_handler(event, None)
-    
+
+    if request.param == 'sqlite':
+        request.getfixturevalue('sqlite_storage')
+    if request.param == 'asgi':
+        app = request.getfixturevalue('asgi_app')
+        return lambda method, path, body=None, query_params=None: asgi_request(app, method, path, body, query_params)
     return invoke
 
 @pytest.fixture
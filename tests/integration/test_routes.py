@@ -124,4 +124,22 @@ def test_delete_nonexistent_song(client, mock_dynamodb):
     assert response['statusCode'] == 404
     
     body = json.loads(response['body'])
-    assert 'error' in body 
\ No newline at end of file
+    assert 'error' in body 
+def test_cursor_from_another_listing(client, mock_dynamodb, test_songs):
+    """Test a cursor reused with another sort or filter is a client error, not a failed query."""
+    for song in test_songs:
+        client('POST', '/songs', song)
+
+    listings = [{'sort': 'title'}, {}, {'bpm_min': '90'}]
+    cursors = [json.loads(client('GET', '/songs', query_params=dict(params, limit='1'))['body'])['next_cursor']
+               for params in listings]
+    for issued, cursor in enumerate(cursors):
+        for reused, params in enumerate(listings):
+            if reused != issued:
+                response = client('GET', '/songs', query_params=dict(params, limit='1', cursor=cursor))
+                assert response['statusCode'] == 400, (listings[issued], params)
+                assert json.loads(response['body'])['code'] == 'INVALID_CURSOR'
+
+    # The same index read the other way round resumes normally
+    response = client('GET', '/songs', query_params={'sort': '-bpm', 'limit': '1', 'cursor': cursors[2]})
+    assert response['statusCode'] == 200
@@ -0,0 +1,85 @@
+import boto3
+import os
+import sys
+from typing import Any, Dict
+
+# Reuse the API's own key derivation so backfilled rows match new writes
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from core.changes import ChangeFeed
+from core.keys import DERIVED_ATTRIBUTES, date_added, parse_duration, sort_keys
+
+def derived_keys(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute the derived attributes an existing song should carry.
+
+    Args:
+        item (dict): Song item as stored in DynamoDB
+
+    Returns:
+        dict: Derived attributes (only those that differ from the item)
+    """
+    keys = sort_keys(item)
+    if 'date_added_ts' not in item:
+        keys['date_added_ts'] = date_added(item)
+    # Migrate the uploader's string duration to the numeric duration_s
+    if 'duration_s' not in item:
+        duration = parse_duration(item.get('duration'))
+        if duration is not None:
+            keys['duration_s'] = duration
+    return {name: value for name, value in keys.items() if item.get(name) != value}
+
+def backfill_derived_keys(table_name: str, dry_run: bool = False,
+                          index_table_name: str = None) -> int:
+    """
+    Add or refresh the derived sort attributes on every song.
+
+    Args:
+        table_name (str): Name of the DynamoDB table
+        dry_run (bool): Only count the songs that would change
+        index_table_name (str): Index table holding the change-feed sequence;
+            when given, songs without a ``seq`` are stamped so they appear
+            in the change feed
+
+    Returns:
+        int: Number of items updated
+    """
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.Table(table_name)
+    changes = ChangeFeed(dynamodb.Table(index_table_name)) if index_table_name else None
+
+    updated_count = 0
+    scan_kwargs = {}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            updates = derived_keys(item)
+            needs_seq = changes is not None and 'seq' not in item
+            if not updates and not needs_seq:
+                continue
+            updated_count += 1
+            if dry_run:
+                continue
+            if needs_seq:
+                updates.update(changes.stamp())
+            table.update_item(
+                Key={'song_id': item['song_id']},
+                UpdateExpression='SET ' + ', '.join(f'#{name} = :{name}' for name in updates),
+                ExpressionAttributeNames={f'#{name}': name for name in updates},
+                ExpressionAttributeValues={f':{name}': value for name, value in updates.items()}
+            )
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    return updated_count
+
+if __name__ == "__main__":
+    # Get table name from environment variable or use the specific table name
+    table_name = os.getenv('DYNAMODB_TABLE_NAME', 'DatabaseStack-SongsTable64F8B317-1AKO0N84TMQ16')
+    dry_run = '--dry-run' in sys.argv
+
+    print(f"Backfilling derived keys ({', '.join(DERIVED_ATTRIBUTES)}, duration_s) on {table_name}...")
+    updated_count = backfill_derived_keys(table_name, dry_run=dry_run,
+                                          index_table_name=os.getenv('INDEX_TABLE_NAME'))
+    print(f"{'Would update' if dry_run else 'Updated'} {updated_count} songs.")
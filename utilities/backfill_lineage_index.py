@@ -0,0 +1,42 @@
+import boto3
+import json
+import os
+import sys
+
+# Reuse the API's own lineage index so backfilled entries match live writes
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from core.lineage import LineageIndex
+from core.scans import parallel_scan
+
+def backfill_lineage_index(table_name: str, index_table_name: str, segments: int = 8,
+                           dry_run: bool = False) -> dict:
+    """
+    Write the lineage fan-out entries for every existing song and remove stale ones.
+
+    Args:
+        table_name (str): Name of the songs table
+        index_table_name (str): Name of the index table holding the entries
+        segments (int): Number of parallel scan segments
+        dry_run (bool): Only report what would change, do not write
+
+    Returns:
+        dict: Report from LineageIndex.rebuild
+    """
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.Table(table_name)
+    index = LineageIndex(dynamodb.Table(index_table_name))
+    return index.rebuild(parallel_scan(table, total_segments=segments), dry_run=dry_run)
+
+if __name__ == "__main__":
+    table_name = os.getenv('DYNAMODB_TABLE_NAME', 'DatabaseStack-SongsTable64F8B317-1AKO0N84TMQ16')
+    index_table_name = os.getenv('INDEX_TABLE_NAME')
+    if not index_table_name:
+        sys.exit("INDEX_TABLE_NAME must be set")
+    dry_run = '--dry-run' in sys.argv
+
+    print(f"Backfilling lineage entries in {index_table_name} from {table_name}...")
+    report = backfill_lineage_index(table_name, index_table_name, dry_run=dry_run)
+    print(json.dumps(report, indent=2))
+    print(f"{report['missing']} missing and {report['orphaned']} orphaned of "
+          f"{report['checked']} entries {'found' if dry_run else 'fixed'}.")
@@ -0,0 +1,126 @@
+"""
+Report DynamoDB cost per 1,000 requests for each API route.
+
+Reads the Embedded Metric Format lines the Lambda handler prints (with
+EMF_METRICS=true), either from CloudWatch Logs or from exported log files,
+and adds up requests and consumed capacity per route and operation.
+
+Usage:
+    python utilities/capacity_report.py --log-group /aws/lambda/<function> --hours 24
+    python utilities/capacity_report.py exported.log [more.log ...] [--json]
+
+Prices default to on-demand us-east-1 rates, in USD per million request units.
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator
+
+READ_PRICE = 0.125
+WRITE_PRICE = 0.625
+
+def parse_documents(lines: Iterable[str]) -> Iterator[dict]:
+    """Yield the EMF documents in log lines, skipping anything else.
+
+    Lines may carry a prefix (timestamp, request ID) before the JSON.
+    """
+    for line in lines:
+        start = line.find('{"_aws"')
+        if start < 0:
+            continue
+        try:
+            yield json.loads(line[start:])
+        except json.JSONDecodeError:
+            continue
+
+def aggregate(documents: Iterable[dict], read_price: float = READ_PRICE,
+              write_price: float = WRITE_PRICE) -> Dict[str, dict]:
+    """
+    Add up requests and capacity per route.
+
+    Args:
+        documents: EMF documents from the handler
+        read_price (float): USD per million read request units
+        write_price (float): USD per million write request units
+
+    Returns:
+        dict: Per route: requests, read and write units, units and cost per
+        1,000 requests, and units per operation
+    """
+    routes = defaultdict(lambda: {'requests': 0, 'read_units': 0.0, 'write_units': 0.0,
+                                  'operations': defaultdict(float)})
+    for document in documents:
+        route = document.get('Route')
+        if route is None:
+            continue
+        if 'Operation' in document:
+            routes[route]['operations'][document['Operation']] += document.get('CapacityUnits', 0)
+        elif 'ReadCapacityUnits' in document:
+            routes[route]['requests'] += document.get('Requests', 0)
+            routes[route]['read_units'] += document['ReadCapacityUnits']
+            routes[route]['write_units'] += document.get('WriteCapacityUnits', 0)
+
+    report = {}
+    for route, totals in routes.items():
+        if not totals['requests']:
+            continue
+        per_1k = 1000 / totals['requests']
+        read_per_1k = totals['read_units'] * per_1k
+        write_per_1k = totals['write_units'] * per_1k
+        report[route] = {
+            'requests': totals['requests'],
+            'read_units': round(totals['read_units'], 2),
+            'write_units': round(totals['write_units'], 2),
+            'read_units_per_1k': round(read_per_1k, 2),
+            'write_units_per_1k': round(write_per_1k, 2),
+            'usd_per_1k': round((read_per_1k * read_price + write_per_1k * write_price) / 1e6, 6),
+            'operations': {operation: round(units, 2) for operation, units in
+                           sorted(totals['operations'].items(), key=lambda item: -item[1])},
+        }
+    return dict(sorted(report.items(), key=lambda item: -item[1]['usd_per_1k']))
+
+def fetch_log_lines(log_group: str, hours: float) -> Iterator[str]:
+    """Yield the handler's EMF lines from CloudWatch Logs for the last ``hours``."""
+    import boto3
+    paginator = boto3.client('logs').get_paginator('filter_log_events')
+    pages = paginator.paginate(
+        logGroupName=log_group,
+        startTime=int((time.time() - hours * 3600) * 1000),
+        filterPattern='?"ReadCapacityUnits" ?"Operation"',
+    )
+    for page in pages:
+        for event in page['events']:
+            yield event['message']
+
+def print_report(report: Dict[str, dict]) -> None:
+    """Print the report as a table, most expensive route first."""
+    print(f"{'Route':<32} {'Requests':>9} {'RRU/1k':>9} {'WRU/1k':>9} {'USD/1k':>10}  Top operation")
+    for route, row in report.items():
+        top = next(iter(row['operations'].items()), ('-', 0))
+        print(f"{route:<32} {row['requests']:>9} {row['read_units_per_1k']:>9.1f} "
+              f"{row['write_units_per_1k']:>9.1f} {row['usd_per_1k']:>10.6f}  {top[0]} ({top[1]})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help="Exported log files (default: stdin)")
+    parser.add_argument('--log-group', help="Read from this CloudWatch Logs group instead of files")
+    parser.add_argument('--hours', type=float, default=24, help="Hours of logs to read from the log group")
+    parser.add_argument('--read-price', type=float, default=READ_PRICE, help="USD per million read request units")
+    parser.add_argument('--write-price', type=float, default=WRITE_PRICE, help="USD per million write request units")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.log_group:
+        lines = fetch_log_lines(args.log_group, args.hours)
+    elif args.files:
+        lines = (line for path in args.files for line in open(path))
+    else:
+        lines = sys.stdin
+    report = aggregate(parse_documents(lines), args.read_price, args.write_price)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,41 @@
+import boto3
+import json
+import os
+import sys
+
+# Reuse the API's own aggregate logic so repaired documents match live writes
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from core.aggregates import AggregateStore
+from core.scans import parallel_scan
+
+def repair_aggregates(table_name: str, index_table_name: str, segments: int = 8,
+                      dry_run: bool = False) -> dict:
+    """
+    Rebuild artist and album aggregates from a parallel scan of the songs table.
+
+    Args:
+        table_name (str): Name of the songs table
+        index_table_name (str): Name of the index table holding the aggregates
+        segments (int): Number of parallel scan segments
+        dry_run (bool): Only report drift, do not write
+
+    Returns:
+        dict: Drift report from AggregateStore.rebuild
+    """
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.Table(table_name)
+    store = AggregateStore(dynamodb.Table(index_table_name))
+    return store.rebuild(parallel_scan(table, total_segments=segments), dry_run=dry_run)
+
+if __name__ == "__main__":
+    table_name = os.getenv('DYNAMODB_TABLE_NAME', 'DatabaseStack-SongsTable64F8B317-1AKO0N84TMQ16')
+    index_table_name = os.getenv('INDEX_TABLE_NAME')
+    if not index_table_name:
+        sys.exit("INDEX_TABLE_NAME must be set")
+    dry_run = '--dry-run' in sys.argv
+
+    print(f"Rebuilding aggregates in {index_table_name} from {table_name}...")
+    report = repair_aggregates(table_name, index_table_name, dry_run=dry_run)
+    print(json.dumps(report, indent=2))
+    print(f"{report['drift']} of {report['checked']} aggregate items {'drifted' if dry_run else 'repaired'}.")
@@ -0,0 +1,316 @@
+"""
+Generate synthetic song catalogs shaped like the real one.
+
+A ``CatalogModel`` learns from ``utilities/songs.json``:
+
+- how often each field is missing
+- title lengths and the words they are made of (accents included)
+- how many songs each artist has, and how many albums
+- dates, BPMs, file extensions and directories, lineage sizes
+
+From that it builds catalogs of any size. The same size and seed always
+give the same catalog. Fields the seed never fills in (``lineage`` and
+``duration_s`` in today's export) fall back to the defaults below, so
+filters and sorts on them still have something to work on.
+
+Usage:
+    python utilities/synthetic_catalog.py --size 100000 --format ndjson -o catalog.ndjson
+    python utilities/synthetic_catalog.py --size 1000 --raw   # uploader rows, fields missing as in the seed
+
+In code:
+    items = generate(10000, seed=1)              # items as DynamoDB stores them
+    load_table(boto3.resource('dynamodb').Table(name), items)
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+# Reuse the API's own schema and key derivation so generated rows match real writes
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from core.keys import date_added, sort_keys
+from core.schemas import song_schema
+
+SONGS_JSON = os.path.join(os.path.dirname(__file__), 'songs.json')
+
+API_FIELDS = set(song_schema.fields)
+REQUIRED_FIELDS = ('title', 'artist')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Used when the seed has no example of a field
+DEFAULT_LINEAGES = ['Santo Daime', 'Barquinha', 'UDV', 'Shipibo', 'Umbanda']
+DEFAULT_LINEAGE_SIZES = {0: 50, 1: 35, 2: 15}
+DEFAULT_DURATION_S = (60, 900)
+DEFAULT_DURATION_RATE = 0.9
+
+# date_added_ts for songs without a parseable date: one minute apart from here
+BASE_TIMESTAMP = 1577836800  # 2020-01-01
+
+class CatalogModel:
+    """Field distributions learned from a list of songs."""
+
+    def __init__(self, songs: List[Dict[str, Any]]):
+        total = len(songs) or 1
+        present = Counter(name for song in songs for name, value in song.items() if value not in (None, ''))
+        self.presence = {name: count / total for name, count in present.items()}
+        self.values = defaultdict(list)
+        for song in songs:
+            for name, value in song.items():
+                if isinstance(value, str) and value:
+                    self.values[name].append(value)
+
+        titles = self.values['title']
+        self.title_lengths = [len(title) for title in titles] or [20]
+        self.title_words = [word for title in titles for word in title.split()] or ['Hino']
+
+        # Songs per artist, largest first, and distinct albums per artist
+        by_artist = Counter(self.values['artist'])
+        self.artist_names = [name for name, _ in by_artist.most_common()] or ['Unknown Artist']
+        self.artist_weights = [count for _, count in by_artist.most_common()] or [1]
+        self.songs_per_artist = sum(self.artist_weights) / len(self.artist_weights)
+        self.artist_words = [word for name in self.artist_names for word in name.split()]
+        albums = defaultdict(set)
+        for song in songs:
+            if song.get('artist') and song.get('album'):
+                albums[song['artist']].add(song['album'])
+        self.albums_per_artist = [len(names) for names in albums.values()] or [1]
+        self.album_names = sorted({name for names in albums.values() for name in names}) or ['Untitled']
+        self.album_words = [word for name in self.album_names for word in name.split()]
+        self.album_rate = (sum(1 for song in songs if song.get('artist') and song.get('album'))
+                           / max(1, sum(1 for song in songs if song.get('artist'))))
+
+        # Full timestamps are redrawn within the seed's range; anything else (a bare year) is kept
+        self.dates = [None if _parse_date(d) else d for d in self.values['date']] or [None]
+        timestamps = [_parse_date(d) for d in self.values['date'] if _parse_date(d)]
+        self.date_range = (min(timestamps), max(timestamps)) if timestamps else (BASE_TIMESTAMP, BASE_TIMESTAMP)
+
+        lineages = [song.get('lineage') or [] for song in songs]
+        if any(lineages):
+            self.lineage_sizes = dict(Counter(len(names) for names in lineages))
+            self.lineage_names = sorted({name for names in lineages for name in names})
+        else:
+            self.lineage_sizes, self.lineage_names = DEFAULT_LINEAGE_SIZES, DEFAULT_LINEAGES
+            self.presence['lineage'] = 1.0
+
+        self.extensions = [os.path.splitext(name)[1] or '.mp3' for name in self.values['filename']] or ['.mp3']
+        self.directories = [os.path.dirname(path) for path in self.values['filepath']] or ['Media']
+
+    @classmethod
+    def from_file(cls, path: str = SONGS_JSON) -> 'CatalogModel':
+        """Learn from a JSON list of songs (default: ``utilities/songs.json``)."""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def songs(self, size: int, seed: int = 0, raw: bool = False) -> List[Dict[str, Any]]:
+        """
+        Build ``size`` songs.
+
+        Args:
+            size (int): Number of songs
+            seed (int): Random seed; the same seed gives the same catalog
+            raw (bool): Keep every field of the seed, missing as often as in
+                the seed, like rows from the uploader. By default songs look
+                like API writes: schema fields only, title and artist always
+                set, and ``song_id`` and ``s3_uri`` filled in
+
+        Returns:
+            list: Songs as JSON-compatible dicts
+        """
+        rng = random.Random(seed)
+        artists = _Artists(self, rng, max(1, round(size * self.presence.get('artist', 1) / self.songs_per_artist)))
+        fields = [name for name in self.presence if raw or name in API_FIELDS]
+        songs = []
+        for i in range(size):
+            song: Dict[str, Any] = {}
+            for name in fields:
+                if name in ('lineage', 'description'):
+                    continue
+                if not (rng.random() < self.presence[name] or (not raw and name in REQUIRED_FIELDS)):
+                    continue
+                if name == 'title':
+                    song['title'] = self._title(rng)
+                elif name == 'artist':
+                    song['artist'] = artists.pick()
+                elif name == 'date':
+                    song['date'] = self._date(rng)
+                elif name not in ('album', 'filename', 'filepath', 'albumartist'):
+                    song[name] = rng.choice(self.values[name])
+            if song.get('artist') and rng.random() < self.album_rate:
+                song['album'] = artists.album(song['artist'])
+            if raw and 'albumartist' in self.presence and song.get('album') \
+                    and rng.random() < self.presence['albumartist']:
+                song['albumartist'] = song.get('artist') or rng.choice(self.values['albumartist'])
+            filename = f"{_slug(song.get('title') or 'track')}_{i}{rng.choice(self.extensions)}"
+            song['filename'] = filename
+            song['filepath'] = f'{rng.choice(self.directories)}/{filename}'
+            song['description'] = ''
+            song['lineage'] = self._lineage(rng)
+            if not raw:
+                if rng.random() < DEFAULT_DURATION_RATE:
+                    song['duration_s'] = rng.randint(*DEFAULT_DURATION_S)
+                song['song_id'] = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                song['s3_uri'] = f's3://ourchants-songs/songs/{filename}'
+            songs.append(song)
+        return songs
+
+    def _title(self, rng: random.Random) -> str:
+        target = rng.choice(self.title_lengths)
+        words = [rng.choice(self.title_words)]
+        length = len(words[0])
+        while length < target:
+            words.append(rng.choice(self.title_words))
+            length += len(words[-1]) + 1
+        return ' '.join(words)
+
+    def _date(self, rng: random.Random) -> str:
+        example = rng.choice(self.dates)
+        if example is not None:
+            return example
+        ts = rng.randint(*self.date_range)
+        return datetime.fromtimestamp(ts, timezone.utc).strftime(DATE_FORMAT)
+
+    def _lineage(self, rng: random.Random) -> List[str]:
+        sizes, weights = zip(*sorted(self.lineage_sizes.items()))
+        size = min(rng.choices(sizes, weights)[0], len(self.lineage_names))
+        return rng.sample(self.lineage_names, size)
+
+class _Artists:
+    """Artist pool for one catalog, with songs per artist skewed like the seed's."""
+
+    def __init__(self, model: CatalogModel, rng: random.Random, count: int):
+        self.model, self.rng = model, rng
+        seed_count = len(model.artist_names)
+        names = list(model.artist_names[:count])
+        taken = set(names)
+        while len(names) < count:
+            name = ' '.join(rng.sample(model.artist_words, min(2, len(model.artist_words))))
+            if name in taken:
+                name = f'{name} {len(names)}'
+            taken.add(name)
+            names.append(name)
+        self.names = names
+        # Stretch the seed's ranked counts over the pool, keeping its skew
+        weights = [model.artist_weights[min(seed_count - 1, i * seed_count // count)] for i in range(count)]
+        self.cum_weights = []
+        running = 0
+        for weight in weights:
+            running += weight
+            self.cum_weights.append(running)
+        self.albums: Dict[str, List[str]] = {}
+
+    def pick(self) -> str:
+        return self.rng.choices(self.names, cum_weights=self.cum_weights)[0]
+
+    def album(self, artist: str) -> str:
+        albums = self.albums.get(artist)
+        if albums is None:
+            count = self.rng.choice(self.model.albums_per_artist)
+            albums = self.albums[artist] = [self._album_name() for _ in range(count)]
+        return self.rng.choice(albums)
+
+    def _album_name(self) -> str:
+        if self.rng.random() < 0.5 or len(self.model.album_words) < 2:
+            return self.rng.choice(self.model.album_names)
+        return ' '.join(self.rng.sample(self.model.album_words, 2))
+
+def _parse_date(value: str) -> Optional[int]:
+    try:
+        return int(datetime.strptime(value, DATE_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+def _slug(text: str) -> str:
+    return re.sub(r'\W+', '_', text.lower()).strip('_')[:40] or 'track'
+
+def stored_items(songs: Iterable[Dict[str, Any]], first_seq: int = 1) -> List[Dict[str, Any]]:
+    """
+    Turn songs into items as the API stores them.
+
+    Adds the derived sort keys, a ``date_added_ts`` (from ``date`` when it
+    parses, else one minute apart from 2020-01-01) and the change-feed
+    ``seq`` and ``updated_at`` a write would stamp, taking the song as last
+    written when it was added. Numbers are Decimals, as boto3 returns them.
+    Loaders should move the feed's sequence past the last ``seq``.
+    """
+    items = []
+    for i, song in enumerate(songs):
+        item = dict(song, **sort_keys(song))
+        item['date_added_ts'] = Decimal(date_added(song) or BASE_TIMESTAMP + 60 * i)
+        item['seq'] = Decimal(first_seq + i)
+        item['updated_at'] = item['date_added_ts']
+        if 'duration_s' in item:
+            item['duration_s'] = Decimal(item['duration_s'])
+        items.append(item)
+    return items
+
+@lru_cache(maxsize=1)
+def default_model() -> CatalogModel:
+    """The model learned from ``utilities/songs.json``, loaded once."""
+    return CatalogModel.from_file()
+
+def generate(size: int, seed: int = 0, raw: bool = False) -> List[Dict[str, Any]]:
+    """Build ``size`` stored items from the default model."""
+    return stored_items(default_model().songs(size, seed, raw=raw))
+
+def _encode_number(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def dumps(items: List[Dict[str, Any]]) -> str:
+    """Encode items as a JSON array, Decimals included."""
+    return json.dumps(items, ensure_ascii=False, default=_encode_number)
+
+def loads(text: str) -> List[Dict[str, Any]]:
+    """Decode items with every number as a Decimal and every object new, as boto3 returns them."""
+    return json.loads(text, parse_float=Decimal, parse_int=Decimal)
+
+def write(items: Iterable[Dict[str, Any]], output: TextIO, ndjson: bool = False) -> None:
+    """Write items as one JSON array or as one JSON object per line."""
+    if ndjson:
+        for item in items:
+            output.write(json.dumps(item, ensure_ascii=False, default=_encode_number) + '\n')
+    else:
+        output.write(dumps(list(items)) + '\n')
+
+def load_table(table, items: Iterable[Dict[str, Any]]) -> int:
+    """Write items to a DynamoDB table (real or moto) in batches of 25; return the count."""
+    count = 0
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1000, help="Number of songs")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--source', default=SONGS_JSON, help="Songs to learn from")
+    parser.add_argument('--format', choices=('json', 'ndjson'), default='json')
+    parser.add_argument('--raw', action='store_true', help="Uploader rows: seed fields, missing as in the seed")
+    parser.add_argument('--songs', action='store_true', help="Write songs without the stored keys")
+    parser.add_argument('-o', '--output', help="Output file (default: stdout)")
+    parser.add_argument('--table', help="Load into this DynamoDB table instead of writing a file")
+    args = parser.parse_args()
+
+    songs = CatalogModel.from_file(args.source).songs(args.size, args.seed, raw=args.raw)
+    items = songs if args.songs else stored_items(songs)
+    if args.table:
+        import boto3
+        print(f"Loaded {load_table(boto3.resource('dynamodb').Table(args.table), items)} songs")
+    elif args.output:
+        with open(args.output, 'w') as f:
+            write(items, f, ndjson=args.format == 'ndjson')
+    else:
+        write(items, sys.stdout, ndjson=args.format == 'ndjson')
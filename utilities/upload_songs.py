@@ -151,6 +151,10 @@ def add_to_dynamodb(dynamodb_client, song_data):
             if key not in ['s3_key', 'date_added'] and value:
                 item[key] = {'S': str(value)}
         
+        # Numeric copy of the duration for the duration-index range filters
+        if song_data.get('duration'):
+            item['duration_s'] = {'N': str(song_data['duration'])}
+        
         dynamodb_client.put_item(
             TableName=DYNAMODB_TABLE,
             Item=item